@@ -0,0 +1,154 @@
+"""
+Hashing throughput benchmark for the Decentralized Cloud Storage Validator
+
+Hashes generated files of several size classes with every strategy in
+hashing.STRATEGIES (plus the old 4KB read loop as a baseline) and prints
+GB/s per strategy and size. Files are hashed once before timing, so the
+numbers are warm page-cache throughput, i.e. the CPU/syscall ceiling.
+
+With --parallel it instead times parallel_tree_hash at each worker count
+and prints the speedup over one worker. Files larger than RAM cannot stay
+cached, so for 50G the curve flattens at disk bandwidth.
+
+    python benchmark_hashing.py --sizes 4K,1M,64M,1G --repeat 5
+    python benchmark_hashing.py --parallel --sizes 1G,10G,50G --workers 1,2,4,8,16
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import config
+from hashing import STRATEGIES, hash_file, parallel_tree_hash
+
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+BASELINE = "read-4k"
+
+
+def parse_size(text):
+    """Parse sizes such as 4K, 64M or 1G into bytes"""
+    text = text.strip().upper()
+    if text[-1:] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def write_sample_file(directory, size, block_size=config.HASH_BUFFER_SIZE):
+    """Write `size` bytes of incompressible data and return the path"""
+    block = os.urandom(min(size, block_size))
+    fd, path = tempfile.mkstemp(prefix="hashbench-", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+    return path
+
+
+def time_strategy(path, strategy, algorithm, repeat):
+    """Best-of-`repeat` throughput in bytes per second for one strategy"""
+    if strategy == BASELINE:
+        run = lambda: hash_file(path, algorithm, strategy="read", buffer_size=4096)
+    else:
+        run = lambda: hash_file(path, algorithm, strategy=strategy)
+    run()  # Warm the page cache
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return os.path.getsize(path) / best if best > 0 else float("inf")
+
+
+def run_benchmark(sizes, strategies, algorithm="sha256", repeat=3, directory=config.TEMP_DIR):
+    """Returns {size: {strategy: bytes_per_sec}}"""
+    results = {}
+    for size in sizes:
+        path = write_sample_file(directory, size)
+        try:
+            results[size] = {strategy: time_strategy(path, strategy, algorithm, repeat)
+                             for strategy in strategies}
+        finally:
+            os.remove(path)
+    return results
+
+
+def run_parallel_benchmark(sizes, worker_counts, repeat=1, directory=config.TEMP_DIR):
+    """Returns {size: {workers: bytes_per_sec}} for parallel tree hashing"""
+    results = {}
+    for size in sizes:
+        path = write_sample_file(directory, size)
+        try:
+            results[size] = {}
+            for workers in worker_counts:
+                best = float("inf")
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    parallel_tree_hash(path, workers)
+                    best = min(best, time.perf_counter() - started)
+                results[size][workers] = size / best if best > 0 else float("inf")
+        finally:
+            os.remove(path)
+    return results
+
+
+def size_label(size):
+    """Shortest exact K/M/G spelling of a size"""
+    return next((f"{size // unit}{suffix}" for suffix, unit in reversed(list(SIZE_UNITS.items()))
+                 if size >= unit and size % unit == 0), str(size))
+
+
+def print_speedups(results, worker_counts):
+    """Print GB/s and speedup over the first worker count for each size"""
+    print(f"{'size':>8} " + " ".join(f"{f'{w} cores':>16}" for w in worker_counts) + "   (GB/s, speedup)")
+    for size, by_workers in results.items():
+        base = by_workers[worker_counts[0]]
+        cells = [f"{by_workers[w] / 1e9:.2f} ({by_workers[w] / base:.1f}x)" for w in worker_counts]
+        print(f"{size_label(size):>8} " + " ".join(f"{cell:>16}" for cell in cells))
+
+
+def print_results(results, strategies):
+    """Print a GB/s table with one row per size class"""
+    print(f"{'size':>8} " + " ".join(f"{strategy:>10}" for strategy in strategies) + "   (GB/s)")
+    for size, by_strategy in results.items():
+        print(f"{size_label(size):>8} " + " ".join(f"{by_strategy[s] / 1e9:>10.2f}" for s in strategies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local file hashing strategies.")
+    parser.add_argument("--sizes", help="Comma-separated file size classes "
+                                         "(default: 4K,1M,64M,1G, or 1G,10G,50G with --parallel)")
+    parser.add_argument("--strategies", default=",".join((BASELINE,) + STRATEGIES),
+                        help="Comma-separated strategies to compare")
+    parser.add_argument("--algorithm", default=config.HASH_ALGORITHM, help="Hash algorithm")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per measurement; the best is kept")
+    parser.add_argument("--parallel", action="store_true",
+                        help="Measure multi-core tree hashing speedup instead of comparing strategies")
+    parser.add_argument("--workers", help="Comma-separated worker counts for --parallel "
+                                          "(default: powers of two up to the core count)")
+    parser.add_argument("--dir", default=str(config.TEMP_DIR), help="Where to write the sample files")
+    args = parser.parse_args()
+
+    if args.parallel:
+        sizes = [parse_size(s) for s in (args.sizes or "1G,10G,50G").split(",") if s.strip()]
+        cores = os.cpu_count() or 1
+        worker_counts = ([int(w) for w in args.workers.split(",") if w.strip()] if args.workers else
+                         sorted({2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores} | {cores}))
+        print(f"🔬 Parallel tree-sha256 benchmark ({cores} cores available, best of {args.repeat})")
+        print_speedups(run_parallel_benchmark(sizes, worker_counts, args.repeat, args.dir), worker_counts)
+        return
+
+    strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    unknown = [s for s in strategies if s != BASELINE and s not in STRATEGIES]
+    if unknown:
+        parser.error(f"unknown strategies: {', '.join(unknown)}")
+    sizes = [parse_size(s) for s in (args.sizes or "4K,1M,64M,1G").split(",") if s.strip()]
+
+    print(f"🔬 Hashing benchmark ({args.algorithm}, best of {args.repeat}, warm page cache)")
+    results = run_benchmark(sizes, strategies, args.algorithm, args.repeat, args.dir)
+    print_results(results, strategies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Byte budgets and bandwidth caps for verification sweeps
+
+A budgeted sweep downloads at most a set number of bytes per run and per
+day, and paces its downloads to a bytes/sec cap so it never saturates the
+egress link. Work is admitted in the order it arrives, which for a
+budgeted sweep is stalest verification first; once the next file no
+longer fits, it and everything after it are the backlog for the next run.
+"""
+
+import threading
+import time
+from datetime import date
+
+import config
+from chunk_sizing import align
+from rate_limit import TokenBucket
+
+DAILY_STATE_PREFIX = "verify_bytes:"  # sync_state documents counting the bytes sweeps downloaded each day
+
+
+def daily_state_key(day=None):
+    """sync_state key holding the bytes downloaded by sweeps on `day` (today by default)"""
+    return DAILY_STATE_PREFIX + (day or date.today()).isoformat()
+
+
+class ByteBudget:
+    """
+    Bytes a sweep may still download, plus an optional bandwidth cap.
+
+    admit() reserves each work item's expected download before the item
+    is started, so checks in flight can never overrun the budget together.
+    update(data) counts bytes as they actually arrive and paces them to
+    bytes_per_sec; it is a HashingSink observer, and ranged downloads call
+    it directly. `used_today` is what earlier runs downloaded today.
+    """
+
+    def __init__(self, max_bytes=None, bytes_per_day=None, used_today=0, bytes_per_sec=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.max_bytes = max_bytes
+        self.bytes_per_day = bytes_per_day
+        self.used_today = used_today
+        self.bytes_per_sec = bytes_per_sec
+        self._pacer = TokenBucket(bytes_per_sec, burst=bytes_per_sec, clock=clock, sleep=sleep) \
+            if bytes_per_sec else None
+        self._lock = threading.Lock()
+        self.reserved = 0
+        self.downloaded = 0
+        self.covered_files = 0
+        self.covered_bytes = 0
+        self.backlog_files = 0
+        self.backlog_bytes = 0
+        self.oversized_files = 0  # Files larger than the whole budget, which no run can verify
+        self.backlog_since = None  # last_verified of the stalest file left over (None if it was never verified)
+
+    @property
+    def limited(self):
+        """True if the budget caps how many bytes a run may download"""
+        return self.max_bytes is not None or self.bytes_per_day is not None
+
+    def capacity(self):
+        """Most bytes any single run may download, or None without a byte cap"""
+        caps = [cap for cap in (self.max_bytes, self.bytes_per_day) if cap is not None]
+        return min(caps) if caps else None
+
+    def remaining(self):
+        """Bytes not yet reserved in this run and today, or None without a byte cap"""
+        left = []
+        if self.max_bytes is not None:
+            left.append(self.max_bytes - self.reserved)
+        if self.bytes_per_day is not None:
+            left.append(self.bytes_per_day - self.used_today - self.reserved)
+        return max(0, min(left)) if left else None
+
+    def chunk_size(self):
+        """
+        Download chunk size under the bandwidth cap: about one second of it,
+        so paced downloads arrive evenly instead of in large bursts. None
+        leaves chunk sizing adaptive.
+        """
+        if not self.bytes_per_sec:
+            return None
+        size = min(max(self.bytes_per_sec, config.DOWNLOAD_MIN_CHUNK_SIZE), config.DOWNLOAD_MAX_CHUNK_SIZE)
+        return align(int(size))
+
+    def admit(self, items, cost):
+        """
+        Yield work items in order while cost(item), their expected download,
+        fits what is left. The first item that does not fit ends the run:
+        it and all later items become backlog, so a large stale file is not
+        overtaken run after run by smaller, fresher ones. An item larger
+        than the whole budget is skipped (and counted as oversized) instead,
+        since waiting for it would stall every run. An item may be a list
+        of records checked together.
+        """
+        capacity = self.capacity()
+        deferring = False
+        for item in items:
+            records = item if isinstance(item, list) else [item]
+            nbytes = cost(item)
+            if not deferring:
+                if capacity is not None and nbytes > capacity:
+                    self.oversized_files += len(records)
+                    self._defer(records)
+                    continue
+                remaining = self.remaining()
+                if remaining is None or nbytes <= remaining:
+                    self.reserved += nbytes
+                    self.covered_files += len(records)
+                    self.covered_bytes += sum(record.get('file_size') or 0 for record in records)
+                    yield item
+                    continue
+                deferring = True
+            self._defer(records)
+
+    def _defer(self, records):
+        for record in records:
+            if self.backlog_files == 0:
+                self.backlog_since = record.get('last_verified')
+            self.backlog_files += 1
+            self.backlog_bytes += record.get('file_size') or 0
+
+    def update(self, data):
+        """Count downloaded bytes, waiting as needed to stay under bytes_per_sec"""
+        with self._lock:
+            self.downloaded += len(data)
+        if self._pacer is not None:
+            self._pacer.acquire(len(data))
+
+    def coverage_percentage(self):
+        """Share of the files seen that this run verified"""
+        total = self.covered_files + self.backlog_files
+        return self.covered_files / total * 100 if total else 100.0
+
+    def to_dict(self):
+        """Coverage, backlog and limits as reported in sweep summaries"""
+        return {
+            'max_bytes': self.max_bytes,
+            'bytes_per_day': self.bytes_per_day,
+            'bytes_per_sec': self.bytes_per_sec,
+            'bytes_downloaded': self.downloaded,
+            'covered_files': self.covered_files,
+            'covered_bytes': self.covered_bytes,
+            'coverage_percentage': self.coverage_percentage(),
+            'backlog_files': self.backlog_files,
+            'backlog_bytes': self.backlog_bytes,
+            'backlog_since': self.backlog_since,
+            'oversized_files': self.oversized_files
+        }
@@ -0,0 +1,159 @@
+"""
+Drive Changes feed handling for the Decentralized Cloud Storage Validator
+
+An incremental sweep reads only what changed on Drive since the last run
+(the changes feed, resumed from a stored page token) and re-verifies just
+the tracked files whose content-identifying metadata moved. Everything
+else keeps its last verification.
+
+A feed is any object with start_page_token() and list_changes(page_token)
+returning (changes, next_page_token, new_start_page_token), shaped like
+Drive's changes.list. drive_client.DriveChangesFeed reads the real feed;
+FakeChangesFeed is an in-memory stand-in for offline runs and tests.
+"""
+
+import itertools
+from datetime import datetime, timezone
+
+# Drive metadata that moves whenever a file's content may have changed
+CONTENT_FIELDS = ('modifiedTime', 'md5Checksum', 'headRevisionId')
+SYNC_STATE_KEY = "drive_changes"  # sync_state document holding the stored page token
+
+
+def metadata_moved(stored, current):
+    """
+    True if a file needs re-verifying: it was removed or trashed, or any of
+    CONTENT_FIELDS differs from the stored snapshot. A file without a
+    snapshot counts as moved.
+    """
+    if not current or current.get('trashed'):
+        return True
+    stored = stored or {}
+    return any(stored.get(field) != current.get(field) for field in CONTENT_FIELDS)
+
+
+def read_changes(feed, page_token):
+    """
+    Follow the feed from page_token to its end. Returns ({file_id: latest
+    change}, token for the next run); later changes to a file replace
+    earlier ones.
+    """
+    latest = {}
+    while True:
+        changes, next_page_token, new_start_page_token = feed.list_changes(page_token)
+        for change in changes:
+            if change.get('fileId'):
+                latest[change['fileId']] = change
+        if next_page_token:
+            page_token = next_page_token
+        else:
+            return latest, new_start_page_token
+
+
+class IncrementalPlan:
+    """What an incremental sweep has to do, from one read of the changes feed"""
+
+    def __init__(self, next_page_token):
+        self.next_page_token = next_page_token
+        self.to_verify = []  # (record, change) for records whose content may have moved
+        self.unchanged = []  # (record, change) where only metadata outside CONTENT_FIELDS moved
+        self.changes_seen = 0
+        self.untracked = 0  # Changes to Drive files no active record points at
+        self.retried = 0  # Files carried over because their last verification failed
+        self.failed_ids = set()  # Drive IDs whose verification failed in this run, retried next run
+
+    def to_dict(self):
+        return {
+            'changes_seen': self.changes_seen,
+            'to_verify': len(self.to_verify),
+            'unchanged': len(self.unchanged),
+            'untracked': self.untracked,
+            'retried': self.retried,
+            'failed': len(self.failed_ids)
+        }
+
+
+def change_metadata(change):
+    """Drive metadata carried by a change; None for a removal or a carried-over retry"""
+    if change.get('removed') or change.get('retry'):
+        return None
+    return change.get('file')
+
+
+def plan_incremental(feed, page_token, records_for, retry_ids=()):
+    """
+    Read the changes since page_token and sort the affected records.
+
+    records_for(drive_ids) returns the active records (with their stored
+    `drive_metadata` snapshot) pointing at any of those Drive objects.
+    retry_ids are Drive objects whose verification failed last run; they
+    are verified again even if the feed has nothing new for them.
+    """
+    latest, next_page_token = read_changes(feed, page_token)
+    plan = IncrementalPlan(next_page_token)
+    plan.changes_seen = len(latest)
+    for drive_id in retry_ids:
+        if drive_id not in latest:
+            latest[drive_id] = {'fileId': drive_id, 'retry': True}
+            plan.retried += 1
+
+    tracked = set()
+    for record in records_for(list(latest)):
+        tracked.add(record['drive_id'])
+        change = latest[record['drive_id']]
+        if change.get('retry') or change.get('removed') or \
+                metadata_moved(record.get('drive_metadata'), change_metadata(change)):
+            plan.to_verify.append((record, change))
+        else:
+            plan.unchanged.append((record, change))
+    plan.untracked = len(set(latest) - tracked)
+    return plan
+
+
+class FakeChangesFeed:
+    """
+    In-memory changes feed for offline runs: call modify(), touch() or
+    remove() to simulate activity on Drive, then read it like the real feed. Page
+    tokens are positions in the change log.
+    """
+
+    def __init__(self, page_size=100):
+        self.page_size = page_size
+        self._log = []
+        self._revisions = itertools.count(1)
+        self.files = {}
+
+    def start_page_token(self):
+        return str(len(self._log))
+
+    def modify(self, file_id, content_md5=None, **metadata):
+        """Record a change to file_id with a new modifiedTime and headRevisionId; returns the file metadata"""
+        revision = next(self._revisions)
+        current = dict(self.files.get(file_id, {'id': file_id}))
+        current.update(modifiedTime=datetime.now(timezone.utc).isoformat(), headRevisionId=f"rev-{revision}",
+                       **metadata)
+        if content_md5 is not None:
+            current['md5Checksum'] = content_md5
+        self.files[file_id] = current
+        self._log.append({'fileId': file_id, 'removed': False, 'file': dict(current)})
+        return current
+
+    def touch(self, file_id, **metadata):
+        """Record a change that leaves content metadata alone (e.g. a rename or a new description)"""
+        current = dict(self.files.get(file_id, {'id': file_id}), **metadata)
+        self.files[file_id] = current
+        self._log.append({'fileId': file_id, 'removed': False, 'file': dict(current)})
+        return current
+
+    def remove(self, file_id):
+        """Record the permanent deletion of file_id"""
+        self.files.pop(file_id, None)
+        self._log.append({'fileId': file_id, 'removed': True})
+
+    def list_changes(self, page_token):
+        start = int(page_token)
+        end = min(start + self.page_size, len(self._log))
+        changes = [dict(change) for change in self._log[start:end]]
+        if end < len(self._log):
+            return changes, str(end), None
+        return changes, None, str(end)
@@ -0,0 +1,66 @@
+"""
+Adaptive download chunk sizing for the Decentralized Cloud Storage Validator
+
+A fixed chunk size is wrong at both ends: small objects pay for several
+round trips they do not need, and fast links spend most of each request on
+latency. AdaptiveChunkSizer starts from the object size, then aims every
+request at DOWNLOAD_CHUNK_SECONDS of transfer at the throughput observed
+so far, within fixed bounds so memory use stays predictable.
+"""
+
+import config
+
+# Drive serves any range, but aligned chunks keep requests on storage block boundaries
+CHUNK_ALIGNMENT = 256 * 1024
+THROUGHPUT_SMOOTHING = 0.5  # Weight of the newest chunk in the throughput estimate
+MAX_STEP = 2  # A chunk is at most this many times larger or smaller than the previous one
+
+
+def align(size, alignment=CHUNK_ALIGNMENT):
+    """Round down to a multiple of alignment, but never below one alignment unit"""
+    return max(alignment, size // alignment * alignment)
+
+
+class AdaptiveChunkSizer:
+    """Chooses the size of each ranged request of one download"""
+
+    def __init__(self, object_size=None, initial=config.DOWNLOAD_CHUNK_SIZE,
+                 minimum=config.DOWNLOAD_MIN_CHUNK_SIZE, maximum=config.DOWNLOAD_MAX_CHUNK_SIZE,
+                 target_seconds=config.DOWNLOAD_CHUNK_SECONDS):
+        self.object_size = object_size
+        self.minimum = align(minimum)
+        self.maximum = max(self.minimum, align(maximum))
+        self.target_seconds = target_seconds
+        self.throughput = None  # Smoothed bytes per second
+        self.requests = 0
+        if object_size is not None and object_size <= self.maximum:
+            # Small enough for a single request: one round trip instead of several
+            self.chunk_size = object_size + 1
+        else:
+            self.chunk_size = self._clamp(align(initial))
+
+    def _clamp(self, size):
+        return min(self.maximum, max(self.minimum, size))
+
+    def next_size(self, offset=0):
+        """
+        Bytes to request at `offset`: the current chunk size, cut one byte past
+        the expected end of the object. A response that fills that extra byte
+        shows the object is larger than expected, so the download carries on;
+        a short response ends it without an extra round trip.
+        """
+        if self.object_size is not None and offset <= self.object_size:
+            return min(self.chunk_size, self.object_size - offset + 1)
+        return self.chunk_size
+
+    def observe(self, nbytes, seconds):
+        """Record a finished request and resize the next one toward target_seconds of transfer"""
+        self.requests += 1
+        if nbytes <= 0 or seconds <= 0:
+            return
+        rate = nbytes / seconds
+        self.throughput = rate if self.throughput is None else \
+            THROUGHPUT_SMOOTHING * rate + (1 - THROUGHPUT_SMOOTHING) * self.throughput
+        wanted = align(int(self.throughput * self.target_seconds))
+        previous = max(self.chunk_size, self.minimum)
+        self.chunk_size = self._clamp(min(previous * MAX_STEP, max(previous // MAX_STEP, wanted)))
@@ -34,7 +34,77 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 # File Upload Configuration
 MAX_FILE_SIZE = 5 * 1024 * 1024 * 1024  # 5GB
 CHUNK_SIZE = 1024 * 1024  # 1MB chunks for resumable uploads
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Streaming upload chunk; must be a multiple of 256KB
+
+# Google Drive Client Configuration
+TOKEN_REFRESH_MARGIN = 300  # Refresh OAuth tokens this many seconds before they expire
+DRIVE_BATCH_SIZE = 100  # Calls per multipart batch request (Drive API maximum)
+
+# Drive Quota Configuration
+DRIVE_REQUESTS_PER_SECOND = 10.0  # Shared token-bucket rate for every Drive call in the process
+DRIVE_BURST = 20  # Calls allowed back to back after an idle period
+DRIVE_MAX_CONCURRENCY = 16  # Drive calls in flight at once across all threads
+DRIVE_MAX_RETRIES = 6  # Retries of a throttled or transiently failing call before giving up
+DRIVE_RETRY_BASE_DELAY = 1.0  # Seconds; backoff doubles per retry, with full jitter
+DRIVE_RETRY_MAX_DELAY = 64.0  # Seconds; cap on a single backoff
+
+# Download Configuration
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # First ranged request of a streamed download, before throughput is known
+DOWNLOAD_MIN_CHUNK_SIZE = 1024 * 1024  # Adaptive chunks never shrink below this
+DOWNLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024  # ...or grow beyond this; also bounds memory per download
+DOWNLOAD_CHUNK_SECONDS = 2.0  # Adaptive chunks aim to take about this long at the observed throughput
+DOWNLOAD_SPOOL_THRESHOLD = 64 * 1024 * 1024  # Downloads kept for reading spill to a temp file beyond this
+
+# Verification Configuration
+VERIFY_WORKERS = 8  # Concurrent verifications for verify-all
+MAX_VERIFY_WORKERS = 32  # Upper bound accepted from CLI flags and API requests
+FULL_VERIFY_INTERVAL_DAYS = 30  # Fast (metadata-only) sweeps still download each file at least this often
+VERIFY_MAX_BYTES = None  # Most bytes one verify-all run downloads (None: no limit)
+VERIFY_BYTES_PER_DAY = None  # Most bytes verify-all runs download per calendar day, across runs (None: no limit)
+VERIFY_BYTES_PER_SEC = None  # Bandwidth cap for verify-all downloads (None: no cap)
+VERIFY_LEASE_SECONDS = 300  # Distributed verify-all: a claimed file is freed for other nodes if not renewed within this
+VERIFY_LEASE_BATCH = 16  # Distributed verify-all: files a node claims at a time
+
+# Continuous Verification Daemon Configuration
+DAEMON_SLA_HOURS = 7 * 24  # Every file is re-verified at least this often
+DAEMON_FILES_PER_MINUTE = 60.0  # Steady verification rate of verify-daemon
+DAEMON_WORKERS = 4  # Verifications in flight at once
+DAEMON_RELOAD_SECONDS = 300  # How often new, deleted and re-weighted files are picked up from MongoDB
+DAEMON_STATUS_SECONDS = 60  # How often the daemon prints a status line
+DAEMON_RETRY_SECONDS = 600  # A file whose check failed is tried again after this long (or its interval, if shorter)
+DAEMON_LARGE_FILE_SIZE = 1024 * 1024 * 1024  # Files this large are checked up to twice as often (more bytes at risk)
+DAEMON_LOW_TRUST_BOOST = 3.0  # A file last found tampered (trust score 0) is checked this much more often, plus one
+
+# Background Job Configuration (web API)
+JOB_WORKERS = 2  # Background sweeps running at once
+JOB_MAX_PENDING = 8  # Jobs allowed to wait for a worker; more are refused with 503
+JOB_RETENTION_SECONDS = 3600  # How long a finished job's result can still be fetched
+JOB_MAX_REPORTED_FILES = 100  # Tampered or failed files a job lists by name; the rest are only counted
+
+# Spot-check (sampled) Verification Configuration
+SAMPLE_CONFIDENCE = 0.99  # Target probability of detecting tampering of at least SAMPLE_TAMPERED_FRACTION
+SAMPLE_TAMPERED_FRACTION = 0.01  # Smallest share of a file's chunks an attack is assumed to touch
+SAMPLE_BUDGET_BYTES = 64 * 1024 * 1024  # Most bytes a spot check downloads per file
 
 # Hash Configuration
 HASH_ALGORITHM = "sha256"
+HASH_STRATEGY = "auto"  # auto, read, readinto or mmap (see hashing.hash_file)
+HASH_BUFFER_SIZE = 1024 * 1024  # Reusable read buffer / mmap slice for local hashing
+HASH_MMAP_THRESHOLD = 64 * 1024 * 1024  # "auto" maps files at least this large
+PARALLEL_HASH_THRESHOLD = 1024 * 1024 * 1024  # Local uploads this large get a multi-core tree-sha256 digest
+PARALLEL_HASH_WORKERS = os.cpu_count() or 1  # Processes for parallel tree hashing
+PARALLEL_HASH_REGION_SIZE = 256 * 1024 * 1024  # Most bytes one worker task maps at a time
+
+# Bulk (recursive) Upload Configuration
+PIPELINE_HASH_WORKERS = 4  # Threads hashing files ahead of the uploaders
+PIPELINE_UPLOAD_WORKERS = 8  # Concurrent Drive uploads
+PROGRESS_INTERVAL = 2.0  # Seconds between progress lines during bulk uploads
+DEDUP_UPLOADS = False  # Link content already on Drive to a new name instead of uploading it again
+
+# Local Hash Cache Configuration
+HASH_CACHE_ENABLED = True  # Reuse digests of local files whose device, inode, size and mtime are unchanged
+HASH_CACHE_PATH = Path(os.environ.get('HASH_CACHE_PATH', TEMP_DIR / "hash_cache.sqlite3"))
+HASH_CACHE_MAX_ENTRIES = 100000  # Least recently used digests are evicted beyond this
+HASH_CACHE_EVICT_EVERY = 1000  # Puts between eviction passes; the cache may exceed its cap by this many meanwhile
+MERKLE_CHUNK_SIZE = 1024 * 1024  # 1MB Merkle leaves: 32 bytes of leaf data per MB of file
 HASH_DISPLAY_LENGTH = 16  # Show first 16 characters of hash in listings
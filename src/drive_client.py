@@ -0,0 +1,555 @@
+"""
+Google Drive transfer helpers for the Decentralized Cloud Storage Validator
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, MediaUpload
+
+import config
+from chunk_sizing import AdaptiveChunkSizer
+from rate_limit import THROTTLE, TRANSIENT, RateLimiter
+from hashing import HashingSink
+
+
+class DriveClientManager:
+    """
+    Process-wide owner of the Drive credentials and service object.
+
+    The service is built once from the static discovery document. Every
+    request it creates runs on an HTTP transport private to the calling
+    thread, because httplib2 connections must not be shared between threads.
+    Credentials are refreshed ahead of expiry, and the token file is rewritten
+    atomically while holding the manager lock.
+    """
+
+    def __init__(self, token_file='token.json', client_secret_file='client_secret.json',
+                 scopes=config.SCOPES, oauth_port=8082, open_browser=True,
+                 refresh_margin=config.TOKEN_REFRESH_MARGIN):
+        self.token_file = token_file
+        self.client_secret_file = client_secret_file
+        self.scopes = scopes
+        self.oauth_port = oauth_port
+        self.open_browser = open_browser
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._creds = None
+        self._service = None
+
+    def credentials(self):
+        """Return valid credentials, refreshing them shortly before they expire"""
+        with self._lock:
+            if self._creds is None:
+                self._creds = self._load_credentials()
+            elif self._expires_soon(self._creds):
+                self._creds.refresh(Request())
+                self._save_credentials(self._creds)
+            return self._creds
+
+    def service(self):
+        """Return the shared Drive v3 service, building it on first use"""
+        with self._lock:
+            if self._service is None:
+                self._service = build(
+                    'drive', 'v3',
+                    http=self.thread_http(),
+                    requestBuilder=self._build_request,
+                    static_discovery=True,
+                    cache_discovery=False
+                )
+            return self._service
+
+    def thread_http(self):
+        """Authorized HTTP transport owned by the calling thread"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials(), http=httplib2.Http())
+            self._local.http = http
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        """requestBuilder hook: bind each request to the current thread's transport and the rate limiter"""
+        self.credentials()
+        return LimitedHttpRequest(self.thread_http(), *args, **kwargs)
+
+    def _expires_soon(self, creds):
+        if not creds.valid:
+            return True
+        return creds.expiry is not None and creds.expiry - self.refresh_margin <= datetime.utcnow()
+
+    def _load_credentials(self):
+        creds = None
+        if os.path.exists(self.token_file):
+            creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+
+        if creds and not self._expires_soon(creds):
+            return creds
+
+        if creds and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(self.client_secret_file, scopes=self.scopes)
+            creds = flow.run_local_server(port=self.oauth_port, open_browser=self.open_browser)
+
+        self._save_credentials(creds)
+        return creds
+
+    def _save_credentials(self, creds):
+        """Write the token file via a temp file and atomic rename so readers never see a partial file"""
+        token_dir = os.path.dirname(os.path.abspath(self.token_file))
+        fd, tmp_path = tempfile.mkstemp(dir=token_dir, prefix='.token-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as token:
+                token.write(creds.to_json())
+                token.flush()
+                os.fsync(token.fileno())
+            os.replace(tmp_path, self.token_file)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class LimitedHttpRequest(HttpRequest):
+    """HttpRequest whose execute() and next_chunk() go through the shared RateLimiter"""
+
+    def execute(self, *args, **kwargs):
+        if self.resumable is not None:
+            # Resumable uploads execute as a series of next_chunk() calls, each limited on its own
+            return super().execute(*args, **kwargs)
+        return get_limiter().call(super().execute, *args, **kwargs)
+
+    def next_chunk(self, *args, **kwargs):
+        # After a failed chunk the client asks Drive for the stored offset before re-sending
+        return get_limiter().call(super().next_chunk, *args, **kwargs)
+
+
+# Reasons Drive gives for a 403 that means "slow down" rather than "forbidden"
+THROTTLE_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'sharingRateLimitExceeded'}
+
+
+def error_reasons(error):
+    """The `reason` strings of a Drive HttpError"""
+    try:
+        body = json.loads(error.content)
+    except (TypeError, ValueError):
+        return set()
+    errors = body.get('error', {}).get('errors', []) if isinstance(body, dict) else []
+    return {item.get('reason') for item in errors if isinstance(item, dict)}
+
+
+def classify_error(error):
+    """RateLimiter classifier: THROTTLE for quota errors, TRANSIENT for 5xx and network errors, else None"""
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        if status == 429 or (status == 403 and error_reasons(error) & THROTTLE_REASONS):
+            return THROTTLE
+        if status >= 500:
+            return TRANSIENT
+        return None
+    if isinstance(error, (ConnectionError, TimeoutError, httplib2.ServerNotFoundError)):
+        return TRANSIENT
+    return None
+
+
+def retry_after_seconds(error):
+    """Seconds from a Retry-After header, if Drive sent one"""
+    if isinstance(error, HttpError):
+        try:
+            return float(error.resp.get('retry-after'))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+_limiter = None
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def configure_limiter(rate=config.DRIVE_REQUESTS_PER_SECOND, concurrency=config.DRIVE_MAX_CONCURRENCY,
+                      burst=config.DRIVE_BURST, retry_policy=None):
+    """Replace the process-wide Drive rate limiter (call before starting a sweep or upload)"""
+    global _limiter
+    with _manager_lock:
+        _limiter = RateLimiter(rate, concurrency, burst, retry_policy,
+                               classify=classify_error, retry_after=retry_after_seconds)
+        return _limiter
+
+
+def get_limiter():
+    """Return the process-wide RateLimiter every Drive call goes through"""
+    with _manager_lock:
+        limiter = _limiter
+    return limiter or configure_limiter()
+
+
+def configure(**options):
+    """Set up the process-wide DriveClientManager (call before first use to change OAuth settings)"""
+    global _manager
+    with _manager_lock:
+        _manager = DriveClientManager(**options)
+        return _manager
+
+
+def get_manager():
+    """Return the process-wide DriveClientManager, creating it with defaults if needed"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = DriveClientManager()
+        return _manager
+
+
+def get_drive_service():
+    """Shared, thread-safe Drive v3 service"""
+    return get_manager().service()
+
+
+# Metadata needed to check a file without downloading it
+CHECKSUM_FIELDS = 'id, size, md5Checksum, sha256Checksum'
+
+# Snapshot stored by metadata refreshes; enough to tell whether the content may have changed
+REFRESH_FIELDS = 'id, size, md5Checksum, sha256Checksum, modifiedTime, headRevisionId, trashed'
+
+# Fields requested from files().create so uploads record Drive's own digests
+UPLOAD_FIELDS = 'id, name, size, md5Checksum, sha256Checksum'
+
+# Resumable upload chunks must be a multiple of this, except the last one
+RESUMABLE_CHUNK_ALIGNMENT = 256 * 1024
+
+
+class HashingMediaUpload(MediaUpload):
+    """
+    Resumable upload body that hashes bytes as the API client pulls them, so
+    the content is read exactly once and never staged on disk.
+
+    The source only has to support read(), so an HTTP request body can be
+    streamed straight to Drive. When the size is unknown the upload simply
+    ends at the first short read. Only the most recent chunk is kept, which
+    is enough to re-send after Drive confirms just part of it.
+    """
+
+    def __init__(self, stream, mimetype='application/octet-stream', chunksize=config.UPLOAD_CHUNK_SIZE,
+                 size=None, algorithm="sha256", observers=()):
+        super().__init__()
+        self._stream = stream
+        self._mimetype = mimetype
+        # Drive rejects intermediate chunks that are not a multiple of 256KB
+        self._chunksize = max(RESUMABLE_CHUNK_ALIGNMENT,
+                              chunksize // RESUMABLE_CHUNK_ALIGNMENT * RESUMABLE_CHUNK_ALIGNMENT)
+        self._size = size
+        self.sink = HashingSink(algorithm, observers)
+        self._chunk_start = 0
+        self._chunk = b''
+
+    def chunksize(self):
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        return False
+
+    def getbytes(self, begin, length):
+        """Return `length` bytes from offset `begin`; new bytes are hashed as they are read"""
+        chunk_end = self._chunk_start + len(self._chunk)
+        if begin < self._chunk_start or begin > chunk_end:
+            raise ValueError(f"Cannot seek to byte {begin}; only bytes {self._chunk_start}-{chunk_end} are buffered")
+
+        kept = self._chunk[begin - self._chunk_start:]
+        fresh = self._read(length - len(kept)) if len(kept) < length else b''
+        self.sink.write(fresh)
+        data = kept[:length] + fresh
+        self._chunk_start, self._chunk = begin, data
+        return data
+
+    def fast_forward(self, offset):
+        """
+        Hash the first `offset` bytes without sending them, for resuming an
+        upload Drive has already confirmed up to `offset`.
+        """
+        if offset < self.sink.bytes_written:
+            raise ValueError(f"Cannot rewind the upload to byte {offset}")
+        while self.sink.bytes_written < offset:
+            data = self._read(min(self._chunksize, offset - self.sink.bytes_written))
+            if not data:
+                raise ValueError(f"Source ended at byte {self.sink.bytes_written}, before byte {offset}")
+            self.sink.write(data)
+        self._chunk_start, self._chunk = offset, b''
+
+    def _read(self, length):
+        """Read up to `length` bytes, looping over short reads from sockets"""
+        parts = []
+        remaining = length
+        while remaining > 0:
+            part = self._stream.read(remaining)
+            if not part:
+                break
+            parts.append(part)
+            remaining -= len(part)
+        return b''.join(parts)
+
+    def hexdigest(self):
+        return self.sink.hexdigest()
+
+
+def upload_hashed(service, stream, file_name, size=None, mimetype='application/octet-stream',
+                  algorithm="sha256", observers=()):
+    """
+    Upload a readable stream to Drive while hashing it in the same pass.
+    Returns (drive_file, media); media.hexdigest() and media.sink carry the
+    digest, byte count and throughput once the upload has finished.
+    """
+    media = HashingMediaUpload(stream, mimetype or 'application/octet-stream', size=size,
+                               algorithm=algorithm, observers=observers)
+    drive_file = service.files().create(
+        body={'name': file_name},
+        media_body=media,
+        fields=UPLOAD_FIELDS
+    ).execute()
+    media.sink.close()
+    return drive_file, media
+
+
+def run_resumable_upload(service, media, file_name, resume_uri=None, resume_offset=0, on_chunk=None):
+    """
+    Upload `media` to Drive one chunk per request instead of in one execute().
+
+    Pass the session URI and confirmed offset of an interrupted upload to
+    continue it; `media` must already be positioned there (fast_forward).
+    After every confirmed chunk on_chunk(session_uri, offset, chunk_bytes,
+    seconds) is called, so the caller can persist the session and report
+    throughput. Returns the created file's metadata.
+    """
+    request = service.files().create(body={'name': file_name}, media_body=media, fields=UPLOAD_FIELDS)
+    if resume_uri:
+        request.resumable_uri = resume_uri
+        request.resumable_progress = resume_offset
+
+    response = None
+    offset = resume_offset
+    while response is None:
+        started = time.monotonic()
+        status, response = request.next_chunk()
+        confirmed = media.sink.bytes_written if response is not None else status.resumable_progress
+        if on_chunk is not None:
+            on_chunk(request.resumable_uri, confirmed, confirmed - offset, time.monotonic() - started)
+        offset = confirmed
+    media.sink.close()
+    return response
+
+
+def query_upload_offset(session_uri, size):
+    """
+    Ask Drive how much of a resumable upload session it has stored.
+
+    Returns the number of bytes confirmed, the file's metadata if the upload
+    had in fact completed, or None if the session no longer exists.
+    """
+    def query():
+        resp, content = get_manager().thread_http().request(
+            session_uri, 'PUT', body=b'', headers={'Content-Length': '0', 'Content-Range': f'bytes */{size}'}
+        )
+        if resp.status not in (200, 201, 308, 404, 410):
+            raise HttpError(resp, content, uri=session_uri)
+        return resp, content
+
+    resp, content = get_limiter().call(query)
+    if resp.status == 308:
+        # Range: bytes=0-N is the last byte stored; no header means nothing yet
+        stored = resp.get('range')
+        return int(stored.rsplit('-', 1)[1]) + 1 if stored else 0
+    if resp.status in (200, 201):
+        return json.loads(content)
+    return None
+
+
+def get_file_metadata(service, file_id, fields=CHECKSUM_FIELDS):
+    """files.get for a single file's metadata"""
+    return service.files().get(fileId=file_id, fields=fields).execute()
+
+
+def run_batch(service, keys, make_request, batch_size=config.DRIVE_BATCH_SIZE):
+    """
+    Run make_request(key) for every key as multipart batch requests of up to
+    `batch_size` calls each, so N calls cost N / batch_size HTTP round trips.
+
+    Returns {key: response}, where a call that failed maps to its exception
+    instead. Keys must be strings (they become batch request ids). Calls
+    throttled or failing transiently inside a batch are retried together in
+    a later batch after backoff, as single calls are by the rate limiter.
+    """
+    limiter = get_limiter()
+    results = {}
+
+    def collect(request_id, response, exception):
+        results[request_id] = exception if exception is not None else response
+
+    pending = list(dict.fromkeys(keys))
+    attempt = 0
+    while pending:
+        for start in range(0, len(pending), batch_size):
+            batch_keys = pending[start:start + batch_size]
+            batch = service.new_batch_http_request(callback=collect)
+            for key in batch_keys:
+                batch.add(make_request(key), request_id=key)
+            # Drive bills each call in a batch against the quota separately
+            limiter.call(batch.execute, cost=len(batch_keys))
+
+        failed = [key for key in pending if isinstance(results.get(key), Exception)]
+        pending = [key for key in failed if limiter.should_retry(results[key], attempt)]
+        if pending:
+            limiter.backoff(attempt, results[pending[0]])
+            attempt += 1
+
+    return results
+
+
+def batch_get_metadata(service, file_ids, fields=CHECKSUM_FIELDS, batch_size=config.DRIVE_BATCH_SIZE):
+    """
+    Fetch metadata for many files with batched files.get calls. Returns
+    {file_id: metadata}, where a file whose lookup failed maps to the
+    exception instead.
+    """
+    return run_batch(service, file_ids, lambda file_id: service.files().get(fileId=file_id, fields=fields),
+                     batch_size)
+
+
+def batch_delete(service, file_ids, batch_size=config.DRIVE_BATCH_SIZE):
+    """
+    Delete many Drive files with batched files.delete calls. Returns
+    {file_id: None}, or the exception for a file that could not be deleted.
+    """
+    results = run_batch(service, file_ids, lambda file_id: service.files().delete(fileId=file_id), batch_size)
+    return {file_id: result if isinstance(result, Exception) else None for file_id, result in results.items()}
+
+
+def is_not_found(error):
+    """True for the 404 Drive returns for a file that no longer exists"""
+    return isinstance(error, HttpError) and error.resp.status == 404
+
+
+# Fields read from each page of the changes feed
+CHANGES_FIELDS = ('nextPageToken, newStartPageToken, '
+                  'changes(fileId, removed, file(id, size, md5Checksum, modifiedTime, headRevisionId, trashed))')
+
+
+class DriveChangesFeed:
+    """The Drive changes feed (changes.list), in the shape changes.plan_incremental reads"""
+
+    def __init__(self, service, page_size=1000):
+        self.service = service
+        self.page_size = page_size
+
+    def start_page_token(self):
+        return self.service.changes().getStartPageToken().execute()['startPageToken']
+
+    def list_changes(self, page_token):
+        response = self.service.changes().list(pageToken=page_token, pageSize=self.page_size,
+                                               fields=CHANGES_FIELDS, spaces='drive').execute()
+        return response.get('changes', []), response.get('nextPageToken'), response.get('newStartPageToken')
+
+
+def download_range(service, file_id, start, end):
+    """Download the inclusive byte range [start, end] of a Drive file with an HTTP Range request"""
+    request = service.files().get_media(fileId=file_id)
+    request.headers['range'] = f'bytes={start}-{end}'
+    return request.execute()
+
+
+def download_chunks(service, file_id, size=None, sizer=None):
+    """
+    Yield a Drive file's content as consecutive ranged downloads.
+
+    Each request's size comes from `sizer` (an AdaptiveChunkSizer, built
+    from the expected `size` if not given), which is told how long every
+    request took so the next one fits the observed throughput. The expected
+    size only shapes the requests: the download always runs to the real end
+    of the object, so a grown or truncated object hashes differently.
+    """
+    sizer = sizer or AdaptiveChunkSizer(size)
+    offset = 0
+    while True:
+        length = sizer.next_size(offset)
+        started = time.monotonic()
+        try:
+            data = download_range(service, file_id, offset, offset + length - 1)
+        except HttpError as e:
+            # 416: offset is at (or past) the end of the object
+            if e.resp.status == 416:
+                return
+            raise
+        sizer.observe(len(data), time.monotonic() - started)
+        if data:
+            yield data
+        offset += len(data)
+        if len(data) < length:
+            return
+
+
+def stream_file_hash(service, file_id, algorithm="sha256", chunk_size=None, observers=(), size=None):
+    """
+    Download a Drive file chunk by chunk straight into an incremental hasher.
+
+    Nothing is buffered beyond the chunk currently in flight. Observers such
+    as a MerkleBuilder receive the same bytes. Chunks adapt to the object
+    size and throughput unless chunk_size fixes them. Returns the finished
+    HashingSink, which carries the digest, byte count and throughput.
+    """
+    sink = HashingSink(algorithm, observers)
+    for data in download_chunks(service, file_id, size, _fixed_sizer(size, chunk_size)):
+        sink.write(data)
+    sink.close()
+    return sink
+
+
+def download_file(service, file_id, size=None, algorithm="sha256", observers=(), chunk_size=None,
+                  spool_threshold=config.DOWNLOAD_SPOOL_THRESHOLD):
+    """
+    Download a Drive file for reading, hashing it on the way.
+
+    The content goes to a SpooledTemporaryFile, which stays in memory up to
+    spool_threshold bytes and moves to disk beyond that, so memory use is
+    bounded however large the object is. Returns (file object positioned at
+    the start, HashingSink). Use stream_file_hash when only the digest is needed.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_threshold, dir=config.TEMP_DIR)
+    sink = HashingSink(algorithm, observers)
+    try:
+        for data in download_chunks(service, file_id, size, _fixed_sizer(size, chunk_size)):
+            sink.write(data)
+            spool.write(data)
+    except BaseException:
+        spool.close()
+        raise
+    sink.close()
+    spool.seek(0)
+    return spool, sink
+
+
+def _fixed_sizer(size, chunk_size):
+    """A sizer that always asks for chunk_size, or None to let download_chunks adapt"""
+    if chunk_size is None:
+        return None
+    return AdaptiveChunkSizer(size, initial=chunk_size, minimum=chunk_size, maximum=chunk_size)
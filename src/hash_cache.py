@@ -0,0 +1,148 @@
+"""
+Persistent local hash cache for the Decentralized Cloud Storage Validator
+
+Digests of local files are remembered in SQLite keyed on (device, inode,
+size, mtime_ns), so a file that has not changed since it was last hashed is
+answered from the cache without reading its contents. Entries are evicted
+least-recently-used first once the cache holds max_entries digests; the
+eviction scan runs every evict_every puts rather than on each one.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import config
+from hashing import hash_file
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    path TEXT NOT NULL,
+    last_used INTEGER NOT NULL,
+    PRIMARY KEY (device, inode, size, mtime_ns, algorithm)
+);
+CREATE INDEX IF NOT EXISTS digests_last_used ON digests (last_used);
+"""
+
+
+def file_key(stat_result):
+    """Cache key of a file: it changes whenever the file is replaced, resized or written"""
+    return stat_result.st_dev, stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns
+
+
+class HashCache:
+    """SQLite-backed digest cache, safe to share between threads"""
+
+    def __init__(self, path=config.HASH_CACHE_PATH, max_entries=config.HASH_CACHE_MAX_ENTRIES,
+                 evict_every=config.HASH_CACHE_EVICT_EVERY):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.evict_every = max(1, evict_every)
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # WAL lets several processes (e.g. parallel uploads) read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, file_path, algorithm):
+        """Cached digest of the file as it is now, or None"""
+        return self.lookup(file_path, algorithm)[0]
+
+    def lookup(self, file_path, algorithm):
+        """
+        Returns (digest or None, stat_result). Pass the stat_result to put()
+        after hashing so a file modified mid-hash is never cached.
+        """
+        stat_result = os.stat(file_path)
+        key = file_key(stat_result)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM digests WHERE device=? AND inode=? AND size=? AND mtime_ns=? AND algorithm=?",
+                key + (algorithm,)
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE digests SET last_used=? WHERE device=? AND inode=? AND size=? AND mtime_ns=? AND algorithm=?",
+                    (time.time_ns(),) + key + (algorithm,)
+                )
+        return (row[0] if row else None), stat_result
+
+    def put(self, file_path, algorithm, digest, stat_result=None):
+        """
+        Remember a digest. stat_result is the stat taken before hashing; if the
+        file has changed since, nothing is stored.
+        """
+        current = os.stat(file_path)
+        if stat_result is not None and file_key(stat_result) != file_key(current):
+            return False
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                file_key(current) + (algorithm, digest, os.path.abspath(file_path), time.time_ns())
+            )
+            self._puts += 1
+            if self._puts >= self.evict_every:
+                self._puts = 0
+                self._evict()
+        return True
+
+    def _evict(self):
+        """Drop least recently used entries beyond max_entries; caller holds the lock"""
+        if self.max_entries:
+            self._conn.execute(
+                "DELETE FROM digests WHERE rowid IN "
+                "(SELECT rowid FROM digests ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+
+    def clear(self):
+        """Forget every cached digest"""
+        with self._lock:
+            self._conn.execute("DELETE FROM digests")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide HashCache, creating it on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = HashCache()
+        return _cache
+
+
+def cached_file_hash(file_path, algorithm="sha256", strategy=config.HASH_STRATEGY, use_cache=config.HASH_CACHE_ENABLED,
+                     cache=None):
+    """
+    Hex digest of a local file, answered from the cache when the file is
+    unchanged. use_cache=False hashes the contents without touching the cache.
+    """
+    if not use_cache:
+        return hash_file(file_path, algorithm, strategy=strategy).hexdigest()
+
+    if cache is None:
+        cache = get_cache()
+    digest, stat_result = cache.lookup(file_path, algorithm)
+    if digest is None:
+        digest = hash_file(file_path, algorithm, strategy=strategy).hexdigest()
+        cache.put(file_path, algorithm, digest, stat_result)
+    return digest
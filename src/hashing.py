@@ -0,0 +1,208 @@
+"""
+Streaming hash helpers for the Decentralized Cloud Storage Validator
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from merkle import TREE_HASH_CHUNK_SIZE, MerkleTree, TreeHash, hash_leaf
+
+# Digest algorithms a record's `hash` may be computed with
+ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+    "tree-sha256": TreeHash,
+}
+
+# Records stored before the `algorithm` field existed were hashed with SHA-256
+LEGACY_ALGORITHM = "sha256"
+
+
+def register_algorithm(name, factory):
+    """Make a hashlib-style factory available as a record digest algorithm"""
+    ALGORITHMS[name] = factory
+
+
+def new_hash(algorithm):
+    """A fresh hasher for a registered algorithm, or anything hashlib knows (e.g. md5)"""
+    factory = ALGORITHMS.get(algorithm)
+    return factory() if factory else hashlib.new(algorithm)
+
+
+def record_algorithm(record):
+    """The algorithm a stored record's `hash` was computed with"""
+    return record.get('algorithm') or LEGACY_ALGORITHM
+
+
+class HashingSink:
+    """
+    Write-only file-like object that feeds every chunk into an incremental
+    hasher and then drops it, so peak memory is one chunk regardless of
+    how large the streamed object is. Optional observers (anything with an
+    update() method, e.g. a MerkleBuilder) see the same bytes.
+    """
+
+    def __init__(self, algorithm="sha256", observers=()):
+        self.hash_obj = new_hash(algorithm)
+        self.observers = list(observers)
+        self.bytes_written = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    def write(self, data):
+        """Hash a chunk of data and discard it"""
+        self.hash_obj.update(data)
+        for observer in self.observers:
+            observer.update(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def close(self):
+        """Mark the stream as finished so throughput stops accumulating time"""
+        if self.finished_at is None:
+            self.finished_at = time.monotonic()
+
+    def hexdigest(self):
+        """Hex digest of everything written so far"""
+        return self.hash_obj.hexdigest()
+
+    @property
+    def elapsed(self):
+        """Seconds spent streaming"""
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    @property
+    def bytes_per_sec(self):
+        """Average stream throughput in bytes per second"""
+        elapsed = self.elapsed
+        return self.bytes_written / elapsed if elapsed > 0 else 0.0
+
+
+STRATEGIES = ("auto", "read", "readinto", "mmap")
+
+
+def hash_stream(fileobj, algorithm="sha256", observers=(), buffer_size=config.HASH_BUFFER_SIZE):
+    """
+    Hash a readable binary stream incrementally; returns the finished HashingSink.
+    Streams that support readinto() are read into one reusable buffer.
+    """
+    if hasattr(fileobj, "readinto"):
+        return _hash_readinto(fileobj, algorithm, observers, buffer_size)
+    return _hash_read(fileobj, algorithm, observers, buffer_size)
+
+
+def hash_file(file_path, algorithm="sha256", observers=(), strategy=config.HASH_STRATEGY,
+              buffer_size=config.HASH_BUFFER_SIZE, mmap_threshold=config.HASH_MMAP_THRESHOLD):
+    """
+    Hash a file on disk with the chosen strategy; returns the finished HashingSink.
+
+    "read" allocates a new bytes object per chunk, "readinto" refills one
+    preallocated buffer, and "mmap" hashes the page-cache mapping directly
+    without copying. "auto" maps files of at least mmap_threshold bytes and
+    uses readinto below that, where the mapping setup costs more than it saves.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown hash strategy '{strategy}'; choose one of {', '.join(STRATEGIES)}")
+    with open(file_path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        # Small files do not need (or pay to zero) a full-size buffer
+        buffer_size = max(1, min(buffer_size, size))
+        if strategy == "auto":
+            strategy = "mmap" if size >= mmap_threshold else "readinto"
+        if strategy == "mmap":
+            return _hash_mmap(f, algorithm, observers, buffer_size)
+        if strategy == "readinto":
+            return _hash_readinto(f, algorithm, observers, buffer_size)
+        return _hash_read(f, algorithm, observers, buffer_size)
+
+
+def _hash_read(fileobj, algorithm, observers, buffer_size):
+    """One read() call and one new bytes object per chunk"""
+    sink = HashingSink(algorithm, observers)
+    while True:
+        chunk = fileobj.read(buffer_size)
+        if not chunk:
+            break
+        sink.write(chunk)
+    sink.close()
+    return sink
+
+
+def _hash_readinto(fileobj, algorithm, observers, buffer_size):
+    """Refill a single preallocated buffer; observers must copy what they keep"""
+    sink = HashingSink(algorithm, observers)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        count = fileobj.readinto(view)
+        if not count:
+            break
+        sink.write(view[:count])
+    sink.close()
+    return sink
+
+
+def _hash_mmap(fileobj, algorithm, observers, buffer_size):
+    """Hash slices of a read-only mapping of the whole file"""
+    if os.fstat(fileobj.fileno()).st_size == 0:
+        # Empty files cannot be mapped
+        return _hash_readinto(fileobj, algorithm, observers, buffer_size)
+    sink = HashingSink(algorithm, observers)
+    with mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mapped.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mapped) as view:
+            for start in range(0, len(view), buffer_size):
+                sink.write(view[start:start + buffer_size])
+    sink.close()
+    return sink
+
+
+def parallel_tree_hash(file_path, workers=None, chunk_size=TREE_HASH_CHUNK_SIZE,
+                       region_size=config.PARALLEL_HASH_REGION_SIZE):
+    """
+    Hash a large file on several cores; returns its MerkleTree.
+
+    The file is cut into regions of whole chunks and each process in the pool
+    maps its own region and hashes the leaves in it. The root of the combined
+    leaves is the file's tree-sha256 digest, identical to what streaming
+    through TreeHash produces, so either can verify the other.
+    """
+    file_size = os.path.getsize(file_path)
+    workers = workers or os.cpu_count() or 1
+    leaf_count = max(1, math.ceil(file_size / chunk_size))
+    # Enough regions to keep every worker busy, none larger than region_size
+    per_region = max(1, min(region_size // chunk_size, math.ceil(leaf_count / (workers * 4))))
+    starts = [index * chunk_size for index in range(0, leaf_count, per_region)]
+
+    if workers == 1 or len(starts) == 1:
+        leaves = [leaf for start in starts for leaf in _hash_region(file_path, start, per_region, chunk_size)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            regions = pool.map(_hash_region, [file_path] * len(starts), starts,
+                               [per_region] * len(starts), [chunk_size] * len(starts))
+            leaves = [leaf for region in regions for leaf in region]
+    return MerkleTree(chunk_size, leaves, file_size)
+
+
+def _hash_region(file_path, start, leaf_count, chunk_size):
+    """Leaf digests of up to leaf_count chunks from byte `start`; runs in a pool worker"""
+    with open(file_path, "rb", buffering=0) as f:
+        file_size = os.fstat(f.fileno()).st_size
+        end = min(file_size, start + leaf_count * chunk_size)
+        if end <= start:
+            # The single leaf of an empty file
+            return [hash_leaf(b'')]
+        # Mappings must start on an allocation-granularity boundary
+        offset = start - start % mmap.ALLOCATIONGRANULARITY
+        with mmap.mmap(f.fileno(), end - offset, access=mmap.ACCESS_READ, offset=offset) as mapped:
+            with memoryview(mapped) as view:
+                return [hash_leaf(view[position - offset:min(position + chunk_size, end) - offset])
+                        for position in range(start, end, chunk_size)]
@@ -0,0 +1,449 @@
+"""
+Record-level integrity checks against Google Drive for the Decentralized Cloud Storage Validator
+"""
+
+from functools import partial
+
+from googleapiclient.errors import HttpError
+
+import config
+import drive_client
+import mongodb_storage
+from drive_client import batch_get_metadata, download_range, stream_file_hash
+from budget import ByteBudget, daily_state_key
+from changes import SYNC_STATE_KEY, change_metadata, plan_incremental
+from hashing import ALGORITHMS, new_hash, record_algorithm
+from leases import leased_sweep
+from merkle import MerkleBuilder, MerkleTree, chunk_ranges, diff_leaves, hash_leaf
+from verifier import compare_drive_checksums, plan_fast_sweep, verify_concurrently
+
+
+def merkle_builder_for(record):
+    """A MerkleBuilder matching the record's stored chunk size, or None if it has no tree"""
+    merkle = record.get('merkle')
+    if not merkle or not merkle.get('chunk_size'):
+        return None
+    return MerkleBuilder(merkle['chunk_size'])
+
+
+def locate_tampering(stored_merkle, builder):
+    """
+    Compare the stored tree with one rebuilt from downloaded bytes and return
+    the tampered chunk indices and merged byte ranges.
+    """
+    expected = MerkleTree.from_document(stored_merkle)
+    actual = builder.finish()
+    chunks = diff_leaves(expected, actual)
+    ranges = chunk_ranges(chunks, expected.chunk_size, max(expected.file_size, actual.file_size))
+    return chunks, ranges
+
+
+def stream_and_compare(record, budget=None):
+    """
+    Stream a record's object from Drive and compare it with the stored hash.
+    Returns (is_intact, stream, tampered_ranges); ranges are only computed for
+    tampered files that have a stored Merkle tree. A ByteBudget counts and
+    paces the download.
+    """
+    service = drive_client.get_drive_service()
+    builder = merkle_builder_for(record)
+    observers = [observer for observer in (builder, budget) if observer is not None]
+    stream = stream_file_hash(service, record['drive_id'], algorithm=record_algorithm(record), observers=observers,
+                              size=record.get('file_size'), chunk_size=budget.chunk_size() if budget else None)
+    is_intact = record['hash'] == stream.hexdigest()
+
+    tampered_ranges = None
+    if not is_intact and builder is not None:
+        stored_merkle = record['merkle'] if 'leaves' in record['merkle'] else \
+            mongodb_storage.MongoDBStorage().get_merkle(record['file_name'])
+        tampered_ranges = locate_tampering(stored_merkle, builder)[1]
+    return is_intact, stream, tampered_ranges
+
+
+def full_check(record, results_writer, budget=None):
+    """Stream the whole object from Drive, re-hash it and queue the outcome"""
+    is_intact, stream, tampered_ranges = stream_and_compare(record, budget)
+    trust_score = 100 if is_intact else 0
+
+    results_writer.record(record['file_name'], "success" if is_intact else "tampered", trust_score, mode="full")
+
+    result = {
+        'filename': record['file_name'],
+        'is_intact': is_intact,
+        'trust_score': trust_score,
+        'verified': True,
+        'mode': 'full',
+        'file_size': stream.bytes_written,
+        'bytes_per_sec': stream.bytes_per_sec
+    }
+    if tampered_ranges is not None:
+        result['tampered_ranges'] = tampered_ranges
+    return result
+
+
+def check_chunks(record, stored_merkle, indices, budget=None):
+    """
+    Verify selected chunks of a file through HTTP Range downloads, without
+    fetching the rest of the object. Returns the tampered chunk indices and
+    byte ranges plus the number of bytes downloaded.
+    """
+    tree = MerkleTree.from_document(stored_merkle)
+    invalid = [index for index in indices if index < 0 or index >= len(tree.leaves)]
+    if invalid:
+        raise ValueError(f"Chunk indices out of range (file has {len(tree.leaves)} chunks): {invalid}")
+
+    service = drive_client.get_drive_service()
+    tampered = []
+    bytes_downloaded = 0
+    for index in indices:
+        start, end = tree.chunk_range(index)
+        if end < start:
+            # The only chunk of an empty file
+            if hash_leaf(b'') != tree.leaf(index):
+                tampered.append(index)
+            continue
+        try:
+            data = download_range(service, record['drive_id'], start, end)
+        except HttpError as e:
+            # 416: the object on Drive no longer reaches this chunk
+            if e.resp.status != 416:
+                raise
+            tampered.append(index)
+            continue
+        bytes_downloaded += len(data)
+        if budget is not None:
+            budget.update(data)
+        if len(data) != end - start + 1 or hash_leaf(data) != tree.leaf(index):
+            tampered.append(index)
+
+    return {
+        'checked_chunks': list(indices),
+        'tampered_chunks': tampered,
+        'tampered_ranges': chunk_ranges(tampered, tree.chunk_size, tree.file_size),
+        'bytes_downloaded': bytes_downloaded
+    }
+
+
+def sample_check(record, results_writer, policy, budget=None):
+    """
+    Spot-check a random subset of a file's chunks with ranged downloads.
+
+    The trust score of a clean spot check is the achieved detection
+    probability as a percentage. Files without stored chunk hashes get a full
+    check instead.
+    """
+    if merkle_builder_for(record) is None:
+        return full_check(record, results_writer, budget)
+
+    stored_merkle = mongodb_storage.MongoDBStorage().get_merkle(record['file_name'])
+    plan = policy.plan(stored_merkle['leaf_count'], stored_merkle['chunk_size'])
+    report = check_chunks(record, stored_merkle, plan.indices, budget)
+
+    is_intact = not report['tampered_chunks']
+    trust_score = round(plan.confidence * 100, 2) if is_intact else 0
+    sample = {
+        'chunks': plan.indices,
+        'ranges': [list(r) for r in chunk_ranges(plan.indices, stored_merkle['chunk_size'], stored_merkle['file_size'])],
+        'tampered_chunks': report['tampered_chunks'],
+        'confidence': plan.confidence,
+        'tampered_fraction': policy.tampered_fraction,
+        'bytes_downloaded': report['bytes_downloaded']
+    }
+    results_writer.record(record['file_name'], "success" if is_intact else "tampered", trust_score,
+                          mode="sample", sample=sample)
+
+    return {
+        'filename': record['file_name'],
+        'is_intact': is_intact,
+        'trust_score': trust_score,
+        'verified': True,
+        'mode': 'sample',
+        'file_size': record.get('file_size'),
+        'bytes_downloaded': report['bytes_downloaded'],
+        'chunks_checked': len(plan.indices),
+        'confidence': plan.confidence,
+        'budget_limited': plan.budget_limited,
+        'tampered_ranges': report['tampered_ranges']
+    }
+
+
+def fast_check_batch(records, results_writer, budget=None):
+    """
+    Check a batch of records against Drive-reported checksums with a single
+    batched metadata request. Records Drive has no checksum for fall back to
+    a full check.
+    """
+    service = drive_client.get_drive_service()
+    metadata = batch_get_metadata(service, [record['drive_id'] for record in records])
+
+    results = []
+    for record in records:
+        file_metadata = metadata.get(record['drive_id'])
+        if file_metadata is None or isinstance(file_metadata, Exception):
+            results.append({
+                'filename': record['file_name'],
+                'is_intact': False,
+                'trust_score': 0,
+                'verified': False,
+                'mode': 'fast',
+                'error': str(file_metadata or 'No metadata returned by Drive')
+            })
+            continue
+
+        matches = compare_drive_checksums(record, file_metadata)
+        if matches is None:
+            results.append(full_check(record, results_writer, budget))
+            continue
+
+        trust_score = 100 if matches else 0
+        results_writer.record(record['file_name'], "success" if matches else "tampered", trust_score, mode="fast")
+        results.append({
+            'filename': record['file_name'],
+            'is_intact': matches,
+            'trust_score': trust_score,
+            'verified': True,
+            'mode': 'fast',
+            'file_size': int(file_metadata.get('size', 0))
+        })
+    return results
+
+
+def refresh_metadata(records, metadata_writer, batch_size=config.DRIVE_BATCH_SIZE * 10):
+    """
+    Fetch current Drive metadata for every record with batched calls and
+    store it on the records. Yields one result per record whose status is
+    'current', 'changed' (size or MD5 differ from what was uploaded, or the
+    file is in the trash), 'missing' (404) or 'error'.
+    """
+    service = drive_client.get_drive_service()
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield from _refresh_batch(service, batch, metadata_writer)
+            batch = []
+    if batch:
+        yield from _refresh_batch(service, batch, metadata_writer)
+
+
+def _refresh_batch(service, records, metadata_writer):
+    metadata = batch_get_metadata(service, [record['drive_id'] for record in records], drive_client.REFRESH_FIELDS)
+    for record in records:
+        file_metadata = metadata.get(record['drive_id'])
+        result = {'filename': record['file_name'], 'drive_id': record['drive_id']}
+        if drive_client.is_not_found(file_metadata):
+            metadata_writer.record(record['file_name'], None)
+            result['status'] = 'missing'
+        elif file_metadata is None or isinstance(file_metadata, Exception):
+            result.update(status='error', error=str(file_metadata or 'No metadata returned by Drive'))
+        else:
+            metadata_writer.record(record['file_name'], file_metadata)
+            recorded_md5, drive_md5 = record.get('md5_checksum'), file_metadata.get('md5Checksum')
+            changed = (bool(file_metadata.get('trashed')) or
+                       int(file_metadata.get('size', record['file_size'])) != record['file_size'] or
+                       None not in (recorded_md5, drive_md5) and recorded_md5 != drive_md5)
+            result['status'] = 'changed' if changed else 'current'
+        yield result
+
+
+def check_item(item, results_writer, sample_policy=None, budget=None):
+    """
+    Sweep work item dispatcher: a list is a fast metadata batch, a record gets
+    a spot check when a sample policy is set and a full check otherwise.
+    """
+    if isinstance(item, list):
+        return fast_check_batch(item, results_writer, budget)
+    if sample_policy is not None:
+        return sample_check(item, results_writer, sample_policy, budget)
+    return full_check(item, results_writer, budget)
+
+
+def expected_bytes(item, sample_policy=None):
+    """
+    Bytes checking a sweep work item is expected to download: the whole
+    file for a full check, up to the per-file budget for a spot check and
+    nothing for a fast metadata batch (whose members without Drive
+    checksums are still downloaded, and counted as they are).
+    """
+    if isinstance(item, list):
+        return 0
+    size = item.get('file_size') or 0
+    builder = merkle_builder_for(item)
+    if sample_policy is not None and builder is not None and sample_policy.budget_bytes:
+        # A spot check downloads at least one chunk, however small the budget
+        return min(size, max(sample_policy.budget_bytes, builder.chunk_size))
+    return size
+
+
+def sweep(records, results_writer, workers=config.VERIFY_WORKERS, fast=False,
+          full_interval_days=config.FULL_VERIFY_INTERVAL_DAYS, sample_policy=None, budget=None):
+    """
+    Verify a stream of records concurrently and yield per-file results as they finish.
+
+    With fast=True most records are checked from Drive metadata alone; records
+    whose last full verification is older than full_interval_days are still
+    downloaded and re-hashed. With a SamplePolicy each file is spot-checked
+    on randomly chosen chunks instead of being downloaded in full. With a
+    ByteBudget, records are only started while their expected download fits
+    it (the rest is counted as backlog) and downloads are paced to its cap.
+    """
+    items = plan_fast_sweep(records, interval_days=full_interval_days) if fast else records
+    if budget is not None:
+        items = budget.admit(items, partial(expected_bytes, sample_policy=sample_policy))
+    verify_one = partial(check_item, results_writer=results_writer, sample_policy=sample_policy, budget=budget)
+    return verify_concurrently(items, verify_one, workers)
+
+
+def distributed_sweep(leases, results_writer, workers=config.VERIFY_WORKERS, sample_policy=None,
+                      batch_size=config.VERIFY_LEASE_BATCH):
+    """
+    Verify the files this node manages to claim through `leases` (a
+    leases.LeaseManager), yielding per-file results, until every file of the
+    round is done or claimed by another node.
+    """
+    verify_one = partial(check_item, results_writer=results_writer, sample_policy=sample_policy)
+    return leased_sweep(leases, verify_one, workers, batch_size)
+
+
+def open_budget(storage, max_bytes=None, bytes_per_day=None, bytes_per_sec=None):
+    """A ByteBudget for a sweep, counting what earlier sweeps downloaded today against bytes_per_day"""
+    used_today = 0
+    if bytes_per_day is not None:
+        used_today = (storage.get_sync_state(daily_state_key()) or {}).get('bytes', 0)
+    return ByteBudget(max_bytes, bytes_per_day, used_today, bytes_per_sec)
+
+
+def close_budget(storage, budget):
+    """Add the bytes a sweep downloaded to today's total"""
+    if budget.downloaded:
+        storage.increment_sync_state(daily_state_key(), bytes=budget.downloaded)
+
+
+def take_baseline(storage, feed, metadata_writer):
+    """
+    First incremental run: remember the current position of the changes feed
+    and snapshot the Drive metadata of every file, so later runs can tell
+    what moved. Returns the refresh status counts.
+    """
+    page_token = feed.start_page_token()
+    counts = {'current': 0, 'changed': 0, 'missing': 0, 'error': 0}
+    for result in refresh_metadata(storage.iter_verification_sources(), metadata_writer):
+        counts[result['status']] += 1
+    metadata_writer.flush()
+    storage.save_sync_state(SYNC_STATE_KEY, page_token=page_token, retry_ids=[])
+    return counts
+
+
+def plan_changes(storage, feed):
+    """The IncrementalPlan since the stored page token, or None if no baseline has been taken yet"""
+    state = storage.get_sync_state(SYNC_STATE_KEY)
+    if state is None:
+        return None
+    return plan_incremental(feed, state['page_token'], storage.records_for_drive_ids, state.get('retry_ids', []))
+
+
+def save_changes_position(storage, plan):
+    """
+    After incremental_sweep finishes and its writers are closed (flushed):
+    continue from the new page token and retry the failed files. Saving it
+    earlier could skip changes whose results never reached MongoDB.
+    """
+    storage.save_sync_state(SYNC_STATE_KEY, page_token=plan.next_page_token,
+                            retry_ids=sorted(plan.failed_ids))
+
+
+def incremental_sweep(plan, results_writer, metadata_writer, workers=config.VERIFY_WORKERS, sample_policy=None):
+    """
+    Carry out a changes.IncrementalPlan, yielding per-file results.
+
+    Records whose content-identifying metadata moved are verified; records
+    removed from Drive are recorded as tampered without a download. The
+    Drive metadata snapshot of a record is stored with the outcome of its
+    check, so a check whose result is lost is still due on the next run,
+    and the Drive IDs of checks that failed are added to plan.failed_ids so
+    the caller can carry them over to the next run. Unchanged records keep
+    their last verification and only get a fresh snapshot.
+    """
+    for record, change in plan.unchanged:
+        metadata_writer.record(record['file_name'], change_metadata(change))
+
+    records_by_name = {}
+    snapshots = {}
+    to_check = []
+    for record, change in plan.to_verify:
+        if change.get('removed'):
+            results_writer.record(record['file_name'], "tampered", 0, mode="changes")
+            metadata_writer.record(record['file_name'], None)
+            yield {
+                'filename': record['file_name'],
+                'is_intact': False,
+                'trust_score': 0,
+                'verified': True,
+                'mode': 'changes',
+                'error': 'Removed from Google Drive'
+            }
+            continue
+        records_by_name[record['file_name']] = record
+        snapshots[record['file_name']] = change_metadata(change)
+        to_check.append(record)
+
+    for result in sweep(to_check, _SnapshotResults(results_writer, snapshots), workers, sample_policy=sample_policy):
+        if not result.get('verified'):
+            plan.failed_ids.add(records_by_name[result['filename']]['drive_id'])
+        yield result
+
+
+class _SnapshotResults:
+    """A VerificationResultWriter that stores each file's new Drive metadata snapshot along with its outcome"""
+
+    def __init__(self, results_writer, snapshots):
+        self.results_writer = results_writer
+        self.snapshots = snapshots
+
+    def record(self, file_name, verification_status, trust_score, mode="full", sample=None):
+        self.results_writer.record(file_name, verification_status, trust_score, mode, sample,
+                                   drive_metadata=self.snapshots.get(file_name))
+
+
+def rehash(record, algorithm, results_writer, storage, promote=False):
+    """
+    Stream a file once, checking it against its current digest while computing
+    an `algorithm` digest alongside. The new digest is only recorded when the
+    old one still matches, so a tampered object is never re-blessed. The
+    download doubles as a full verification and is recorded as one.
+    """
+    secondary = new_hash(algorithm)
+    service = drive_client.get_drive_service()
+    stream = stream_file_hash(service, record['drive_id'], algorithm=record_algorithm(record), observers=[secondary],
+                              size=record.get('file_size'))
+    is_intact = record['hash'] == stream.hexdigest()
+    trust_score = 100 if is_intact else 0
+
+    results_writer.record(record['file_name'], "success" if is_intact else "tampered", trust_score, mode="full")
+    if is_intact:
+        promote_from = (record_algorithm(record), record['hash']) if promote else None
+        storage.add_digest(record['file_name'], algorithm, secondary.hexdigest(), promote_from=promote_from)
+
+    return {
+        'filename': record['file_name'],
+        'is_intact': is_intact,
+        'trust_score': trust_score,
+        'verified': True,
+        'mode': 'rehash',
+        'algorithm': algorithm,
+        'promoted': promote and is_intact,
+        'file_size': stream.bytes_written,
+        'bytes_per_sec': stream.bytes_per_sec
+    }
+
+
+def rehash_sweep(records, algorithm, results_writer, storage, workers=config.VERIFY_WORKERS, promote=False):
+    """
+    Add an `algorithm` digest to a stream of records concurrently, yielding
+    per-file results. Existing digests keep verifying throughout; with
+    promote=True each file switches to the new digest as soon as it has one.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm '{algorithm}'; choose one of {', '.join(ALGORITHMS)}")
+    rehash_one = partial(rehash, algorithm=algorithm, results_writer=results_writer, storage=storage, promote=promote)
+    return verify_concurrently(records, rehash_one, workers)
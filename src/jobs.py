@@ -0,0 +1,198 @@
+"""
+Background jobs for the Decentralized Cloud Storage Validator web API
+
+Long sweeps run as jobs on a small bounded executor instead of inside the
+HTTP request. A job tracks its progress (files done, intact, tampered,
+bytes/sec) while it runs and keeps its final result for a retention
+period after it finishes, so clients can poll for it. Per-file results
+are only counted; a job keeps the first JOB_MAX_REPORTED_FILES tampered
+or failed ones, so its memory does not grow with the number of files.
+
+Jobs live in the memory of the process that accepted them. The web app
+must therefore run as a single process (threads are fine): behind a
+server with several worker processes, a poll landing on another worker
+gets 404 for a job that is still running.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import config
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when more jobs are waiting than the queue accepts"""
+
+
+def result_bytes(result):
+    """Bytes a per-file result downloaded (fast checks download nothing)"""
+    if 'bytes_downloaded' in result:
+        return result['bytes_downloaded'] or 0
+    if result.get('mode') == 'full':
+        return result.get('file_size') or 0
+    return 0
+
+
+class Job:
+    """One background job and its progress; progress may be updated from any thread"""
+
+    def __init__(self, kind, clock=time.monotonic, max_reported=config.JOB_MAX_REPORTED_FILES):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.files_done = 0
+        self.intact = 0
+        self.tampered = 0
+        self.errors = 0
+        self.bytes_done = 0
+        self.problems = []  # Tampered or failed per-file results, up to max_reported of them
+        self.unreported_problems = 0
+        self.max_reported = max_reported
+        self._clock = clock
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+
+    def add_result(self, result):
+        """Count one per-file verification result, keeping it only if it is a reportable problem"""
+        with self._lock:
+            self.files_done += 1
+            if not result.get('verified'):
+                self.errors += 1
+            elif result.get('is_intact'):
+                self.intact += 1
+            else:
+                self.tampered += 1
+            if not (result.get('verified') and result.get('is_intact')):
+                if len(self.problems) < self.max_reported:
+                    self.problems.append(result)
+                else:
+                    self.unreported_problems += 1
+            self.bytes_done += result_bytes(result)
+        return result
+
+    def reported_problems(self):
+        """(tampered or failed results kept, how many more there were)"""
+        with self._lock:
+            return list(self.problems), self.unreported_problems
+
+    def _start(self):
+        with self._lock:
+            self.status = RUNNING
+            self.started_at = datetime.now().isoformat()
+            self._started = self._clock()
+
+    def _finish(self, result=None, error=None):
+        with self._lock:
+            self.status = FAILED if error is not None else COMPLETED
+            self.result = result
+            self.error = error
+            self.finished_at = datetime.now().isoformat()
+            self._finished = self._clock()
+
+    @property
+    def done(self):
+        return self.status in (COMPLETED, FAILED)
+
+    def finished_seconds_ago(self):
+        """Seconds since the job finished, or None while it is queued or running"""
+        with self._lock:
+            return None if self._finished is None else self._clock() - self._finished
+
+    def to_dict(self):
+        """Status and progress as returned by the web API; includes the result once finished"""
+        with self._lock:
+            elapsed = 0.0
+            if self._started is not None:
+                elapsed = (self._finished if self._finished is not None else self._clock()) - self._started
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'progress': {
+                    'files_done': self.files_done,
+                    'intact': self.intact,
+                    'tampered': self.tampered,
+                    'errors': self.errors,
+                    'bytes_done': self.bytes_done,
+                    'bytes_per_sec': self.bytes_done / elapsed if elapsed > 0 else 0.0,
+                    'elapsed_seconds': elapsed
+                },
+                'result': self.result,
+                'error': self.error
+            }
+
+
+class JobQueue:
+    """
+    Runs jobs on at most `workers` threads, with at most `max_pending` jobs
+    waiting for one. Finished jobs are forgotten `retention_seconds` after
+    they finish. Jobs are held in this process only.
+    """
+
+    def __init__(self, workers=config.JOB_WORKERS, max_pending=config.JOB_MAX_PENDING,
+                 retention_seconds=config.JOB_RETENTION_SECONDS, clock=time.monotonic,
+                 max_reported=config.JOB_MAX_REPORTED_FILES):
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.max_reported = max_reported
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, run):
+        """
+        Queue run(job), whose return value becomes the job's result and whose
+        exceptions fail the job. Returns the Job; raises JobQueueFull if too
+        many jobs are already waiting.
+        """
+        with self._lock:
+            self._prune()
+            if sum(job.status == QUEUED for job in self._jobs.values()) >= self.max_pending:
+                raise JobQueueFull(f"{self.max_pending} jobs are already waiting; try again later")
+            job = Job(kind, self._clock, self.max_reported)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, run)
+        return job
+
+    def _run(self, job, run):
+        job._start()
+        try:
+            result = run(job)
+        except Exception as e:
+            job._finish(error=str(e))
+        else:
+            job._finish(result=result)
+
+    def get(self, job_id):
+        """The job with this id, or None if it never existed or its result has expired"""
+        with self._lock:
+            self._prune()
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        """Forget finished jobs past retention; caller holds the lock"""
+        for job_id, job in list(self._jobs.items()):
+            age = job.finished_seconds_ago()
+            if age is not None and age > self.retention_seconds:
+                del self._jobs[job_id]
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
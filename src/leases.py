@@ -0,0 +1,189 @@
+"""
+Distributed verification leases for the Decentralized Cloud Storage Validator
+
+Several nodes can run verify-all over the same files at once. A node
+claims files one atomic find_one_and_update at a time by writing a lease
+(owner, round, expiry) onto the file record, and only files that are not
+yet done in the current round and carry no live lease can be claimed.
+While it works, a node renews its leases in the background. When a file
+is verified the lease is swapped for a done marker for the round. A file
+whose verification failed (Drive or network errors, say) is released
+instead, so another node can try it in the same round; the node that
+failed does not claim it again. Leases still held when the node stops
+are released. A node that crashes just stops renewing, so its leases
+expire and other nodes pick them up.
+
+A round is a name shared by the nodes of one sweep, such as today's date.
+Every file is verified once per round.
+"""
+
+import os
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+import config
+from verifier import verify_concurrently
+
+
+def default_node_id():
+    """host:pid, unique per running process"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def default_round_id():
+    """Nodes started on the same day join the same round unless told otherwise"""
+    return date.today().isoformat()
+
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+class LeaseManager:
+    """
+    Claims, renews, completes and releases this node's leases on a file
+    collection (file_hashes). Leases are stored on each record as
+    `verify_lease` and a finished file gets `verified_round`.
+    """
+
+    def __init__(self, collection, node_id=None, round_id=None, lease_seconds=config.VERIFY_LEASE_SECONDS,
+                 projection=None, clock=utc_now):
+        self.collection = collection
+        self.node_id = node_id or default_node_id()
+        self.round_id = round_id or default_round_id()
+        self.lease_seconds = lease_seconds
+        self.projection = projection
+        self._clock = clock
+        self.claimed = 0
+        self.completed = 0
+        self.lost = 0  # Leases that expired and went to another node before this one finished
+        self.released = 0  # Files this node could not verify and left to other nodes
+        self._given_up = set()
+
+    def _expiry(self):
+        return self._clock() + timedelta(seconds=self.lease_seconds)
+
+    def _mine(self):
+        return {"verify_lease.owner": self.node_id, "verify_lease.round": self.round_id}
+
+    def claim(self):
+        """Lease the stalest unclaimed file not yet done in this round; None when there is none"""
+        now = self._clock()
+        query = {
+            "status": "active",
+            "verified_round": {"$ne": self.round_id},
+            "$or": [{"verify_lease": None}, {"verify_lease.expires_at": {"$lt": now}}]
+        }
+        if self._given_up:
+            query["file_name"] = {"$nin": sorted(self._given_up)}
+        record = self.collection.find_one_and_update(
+            query,
+            {"$set": {"verify_lease": {"owner": self.node_id, "round": self.round_id,
+                                       "expires_at": now + timedelta(seconds=self.lease_seconds)}}},
+            projection=self.projection,
+            sort=[("last_verified", 1)]
+        )
+        if record is not None:
+            self.claimed += 1
+        return record
+
+    def claim_batch(self, batch_size=config.VERIFY_LEASE_BATCH):
+        """Lease up to batch_size files"""
+        batch = []
+        while len(batch) < batch_size:
+            record = self.claim()
+            if record is None:
+                break
+            batch.append(record)
+        return batch
+
+    def claimed_records(self, batch_size=config.VERIFY_LEASE_BATCH):
+        """Yield records claimed batch by batch until nothing is left to claim"""
+        while True:
+            batch = self.claim_batch(batch_size)
+            if not batch:
+                return
+            yield from batch
+
+    def renew(self):
+        """Push back the expiry of every lease this node holds; returns how many were renewed"""
+        result = self.collection.update_many(self._mine(), {"$set": {"verify_lease.expires_at": self._expiry()}})
+        return result.modified_count
+
+    def complete(self, file_name):
+        """Mark a file done for the round. False if its lease was lost to another node in the meantime"""
+        result = self.collection.update_one(
+            dict(self._mine(), file_name=file_name),
+            {"$set": {"verified_round": self.round_id}, "$unset": {"verify_lease": ""}}
+        )
+        if result.matched_count:
+            self.completed += 1
+            return True
+        self.lost += 1
+        return False
+
+    def release_file(self, file_name):
+        """
+        Give up one file without marking it done, so other nodes can claim it
+        in this round; this node will not claim it again. False if its lease
+        was already lost.
+        """
+        self._given_up.add(file_name)
+        result = self.collection.update_one(dict(self._mine(), file_name=file_name),
+                                            {"$unset": {"verify_lease": ""}})
+        if result.matched_count:
+            self.released += 1
+            return True
+        self.lost += 1
+        return False
+
+    def release(self):
+        """Give up every lease this node still holds; returns how many were released"""
+        return self.collection.update_many(self._mine(), {"$unset": {"verify_lease": ""}}).modified_count
+
+    @contextmanager
+    def keep_alive(self, interval=None):
+        """
+        Renew this node's leases every `interval` seconds (a third of the
+        lease by default) while the block runs, then release whatever is
+        still held, including after an error or Ctrl+C.
+        """
+        interval = interval or self.lease_seconds / 3
+        stop = threading.Event()
+
+        def renew_until_stopped():
+            while not stop.wait(interval):
+                try:
+                    self.renew()
+                except Exception as e:
+                    print(f"⚠️ Could not renew verification leases: {e}")
+
+        renewer = threading.Thread(target=renew_until_stopped, name="lease-renewer", daemon=True)
+        renewer.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            renewer.join()
+            self.release()
+
+    def stats(self):
+        return {'node_id': self.node_id, 'round_id': self.round_id, 'claimed': self.claimed,
+                'completed': self.completed, 'released': self.released, 'lost': self.lost}
+
+
+def leased_sweep(leases, verify_one, workers=config.VERIFY_WORKERS, batch_size=config.VERIFY_LEASE_BATCH):
+    """
+    Verify claimed files concurrently until no unclaimed file is left in the
+    round. Each lease is completed as its result arrives, or released if the
+    file could not be verified. Results whose lease was lost are marked with
+    lease_lost.
+    """
+    with leases.keep_alive():
+        for result in verify_concurrently(leases.claimed_records(batch_size), verify_one, workers):
+            finish = leases.complete if result.get('verified') else leases.release_file
+            if not finish(result['filename']):
+                result['lease_lost'] = True
+            yield result
@@ -1,21 +1,25 @@
 import argparse
-import hashlib
 import os
-import requests
-from io import BytesIO
-import json
-from datetime import datetime
+import shutil
+import sys
+import threading
+import time
 import webbrowser
 
 # Google Drive and Firestore imports
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
-from googleapiclient.http import MediaFileUpload
 # from google.cloud import firestore  # Disabled for MongoDB storage
 import mongodb_storage as storage
+import config
+import drive_client
+import integrity
+import uploads
+from hashing import ALGORITHMS, record_algorithm
+from merkle import parse_chunk_spec
+from pipeline import TransferProgress
+from sampling import SamplePolicy
+from scheduler import VerificationScheduler, VerifyDaemon
+from utils import format_file_size
+from verifier import VerificationSummary, compare_drive_checksums
 
 # Configure Chrome browser for OAuth
 chrome_path = '/Applications/Google Chrome.app'
@@ -35,30 +39,24 @@ SCOPES = ['https://www.googleapis.com/auth/drive']
 # -----------------------------------------------------------------------------
 # Using local storage instead of Firestore
 
+drive_client.configure(scopes=SCOPES, oauth_port=8082)
+
 def get_drive_service():
     """
-    Handles Google Drive API authentication and returns a service object.
+    Returns the shared Google Drive service object.
     The first time you run this, a browser window will open for authentication.
+    Credentials and the discovery document are loaded once per process.
     """
-    creds = None
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file('client_secret.json', scopes=SCOPES)
-            creds = flow.run_local_server(port=8082)
-        
-        with open('token.json', 'w') as token:
-            token.write(creds.to_json())
-    
-    return build('drive', 'v3', credentials=creds)
+    return drive_client.get_drive_service()
 
-def upload_and_hash(file_path):
+def upload_and_hash(file_path, hash_workers=config.PARALLEL_HASH_WORKERS, use_cache=config.HASH_CACHE_ENABLED,
+                    dedup=config.DEDUP_UPLOADS, chunk_size=config.UPLOAD_CHUNK_SIZE, skip_unchanged=False):
     """
-    Computes hash, uploads the file to Google Drive, and stores the hash in Firestore.
+    Uploads the file to Google Drive while hashing it in the same pass, and stores the hash in MongoDB.
+    Very large files are tree-hashed on hash_workers cores first instead.
+    With skip_unchanged, files unchanged since their upload whose Drive copy still matches are skipped.
+    With dedup, content already on Drive is recorded under the new name without uploading.
+    Files larger than chunk_size go up chunk by chunk and resume after an interruption.
     """
     try:
         # Validate file exists
@@ -66,33 +64,152 @@ def upload_and_hash(file_path):
             print(f"Error: File '{file_path}' not found.")
             return
         
-        # Step 1: Compute the SHA-256 hash
-        print(f"Computing hash for {file_path}...")
-        with open(file_path, 'rb') as f:
-            file_hash = hashlib.sha256(f.read()).hexdigest()
-        print(f"File hash created: {file_hash}")
-        
-        # Step 2: Upload the file to Google Drive
-        service = get_drive_service()
+        # Step 1 & 2: Stream the file to Google Drive, computing SHA-256, MD5 and Merkle leaves on the way
         file_name = os.path.basename(file_path)
-        file_metadata = {'name': file_name}
-        media = MediaFileUpload(file_path, resumable=True)
-        file = service.files().create(body=file_metadata, media_body=media, fields='id, name').execute()
-        file_id = file.get('id')
-        print(f"File uploaded successfully to Google Drive. File ID: {file_id}, Name: {file_name}")
-
-        # Step 3: Store the hash and ID in MongoDB
-        print("Storing hash and Drive ID in MongoDB...")
-        storage.store_file_hash(file_name, file_hash, file_id, os.path.getsize(file_path))
+        file_size = os.path.getsize(file_path)
+        if hash_workers > 1 and file_size >= config.PARALLEL_HASH_THRESHOLD:
+            print(f"Tree-hashing {file_path} ({format_file_size(file_size)}) on {hash_workers} cores, then uploading...")
+        else:
+            print(f"Uploading and hashing {file_path} ({format_file_size(file_size)})...")
+        details = uploads.upload_file(file_path, file_name, hash_workers, use_cache=use_cache, dedup=dedup,
+                                      chunk_size=chunk_size, on_chunk=print_chunk, skip_unchanged=skip_unchanged)
+        if details['deduplicated']:
+            print(f"♻️  Same content is already on Drive (Drive ID: {details['drive_id']}); "
+                  f"recorded '{file_name}' without uploading it.")
+            print(f"File hash: {details['hash']} ({details['algorithm']})")
+            return
+        if details['skipped']:
+            print(f"⏭️  {file_name} is unchanged since its last upload and Drive's copy matches "
+                  f"(Drive ID: {details['drive_id']}); nothing to do.")
+            return
+        if details['resumed_from']:
+            print(f"⏯️  Resumed an interrupted upload at {format_file_size(details['resumed_from'])}.")
+        print(f"File uploaded successfully to Google Drive. File ID: {details['drive_id']}, Name: {file_name}")
+        print(f"Streamed {format_file_size(details['size'])} in {details['elapsed']:.2f}s "
+              f"({format_file_size(details['bytes_per_sec'])}/s)")
+        print(f"File hash created: {details['hash']} ({details['algorithm']})")
+        print(f"Merkle root: {details['merkle_root']} ({details['chunk_count']} chunks)")
+        if not details['drive_checksums_match']:
+            print("⚠️  Drive reports different checksums than the uploaded bytes; the upload may be corrupted.")
+
+        # Step 3: The hash, ID and checksums were stored in MongoDB as part of the upload
         print("Hash and Drive ID stored successfully.")
         print("Your unique code for this file is:", file_name)
 
     except Exception as e:
         print(f"An error occurred during upload: {e}")
 
-def verify_and_match(file_name):
+def print_chunk(offset, size, chunk_bytes, seconds):
+    """Per-chunk progress line for resumable uploads"""
+    rate = chunk_bytes / seconds if seconds > 0 else 0.0
+    print(f"⬆️  {format_file_size(offset)} / {format_file_size(size)} ({offset / size:.0%}) - "
+          f"chunk of {format_file_size(chunk_bytes)} at {format_file_size(rate)}/s")
+
+def upload_directory(root, include=(), exclude=(), hash_workers=config.PIPELINE_HASH_WORKERS,
+                     upload_workers=config.PIPELINE_UPLOAD_WORKERS, use_cache=config.HASH_CACHE_ENABLED,
+                     dedup=config.DEDUP_UPLOADS, chunk_size=config.UPLOAD_CHUNK_SIZE):
+    """
+    Uploads every file under a directory in one run, hashing and uploading in parallel.
+    Files already recorded by an earlier (possibly interrupted) run are skipped, and
+    files cut off mid-upload resume from their saved session.
+    """
+    if not os.path.isdir(root):
+        print(f"Error: Directory '{root}' not found.")
+        return
+
+    print(f"📂 UPLOADING {root}")
+    print(f"⚙️  Hash workers: {hash_workers} | Upload workers: {upload_workers}")
+    if include:
+        print(f"   Include: {', '.join(include)}")
+    if exclude:
+        print(f"   Exclude: {', '.join(exclude)}")
+    print("=" * 50)
+
+    progress = TransferProgress()
+    last_report = time.monotonic()
+    try:
+        for result in uploads.upload_tree(root, include, exclude, hash_workers=hash_workers,
+                                          upload_workers=upload_workers, progress=progress, use_cache=use_cache,
+                                          dedup=dedup, chunk_size=chunk_size):
+            if not result['uploaded']:
+                print(f"❌ {result['filename']}: {result['error']}")
+            elif not result['drive_checksums_match']:
+                print(f"⚠️  {result['filename']}: Drive reports different checksums than the uploaded bytes")
+            if time.monotonic() - last_report >= config.PROGRESS_INTERVAL:
+                print_progress(progress)
+                last_report = time.monotonic()
+    except KeyboardInterrupt:
+        print("\n⏹️  Interrupted; files uploaded so far are recorded. Re-run the same command to continue.")
+    except Exception as e:
+        print(f"An error occurred during directory upload: {e}")
+
+    print_progress(progress)
+    print(f"\n📊 UPLOAD SUMMARY")
+    print("=" * 50)
+    print(f"✅ Uploaded: {progress.completed} ({format_file_size(progress.bytes_done)})")
+    if progress.deduplicated:
+        print(f"♻️  Deduplicated (no transfer): {progress.deduplicated}")
+    print(f"⏭️  Already recorded: {progress.skipped}")
+    if progress.failed:
+        print(f"❌ Failed: {progress.failed} (re-run to retry)")
+    print_drive_stats()
+
+def print_progress(progress):
+    """Print one progress line for a bulk upload"""
+    print(f"📦 {progress.completed + progress.failed}/{progress.discovered - progress.skipped} files | "
+          f"{format_file_size(progress.bytes_done)} | {format_file_size(progress.bytes_per_sec)}/s | "
+          f"{progress.files_per_sec:.1f} files/s | {progress.elapsed:.0f}s")
+
+def fast_verify(stored_data):
+    """
+    Compares Drive-reported checksums with the recorded ones without downloading.
+    Returns True/False, or None when Drive has nothing comparable for this file.
+    """
+    print("⚡ Fast mode: checking Drive-reported checksums...")
+    service = get_drive_service()
+    metadata = drive_client.get_file_metadata(service, stored_data['drive_id'])
+    matches = compare_drive_checksums(stored_data, metadata)
+    if matches is None:
+        print("ℹ️  Drive reports no comparable checksum for this file; falling back to a full download.")
+        return None
+
+    print(f"Drive SHA-256: {metadata.get('sha256Checksum', 'n/a')}")
+    print(f"Drive MD5:     {metadata.get('md5Checksum', 'n/a')}")
+    db_storage = storage.MongoDBStorage()
+    if matches:
+        print("\n✅ Fast verification successful! Drive checksums match. Trust Score: 100%")
+        db_storage.update_verification(stored_data['file_name'], "success", 100, mode="fast")
+    else:
+        print("\n🚨🚨🚨 SECURITY ALERT - DRIVE CHECKSUMS DO NOT MATCH! 🚨🚨🚨")
+        print("❌ WARNING: This file has been modified or corrupted!")
+        print("   Run a full verification for details: python main.py verify " + stored_data['file_name'])
+        db_storage.update_verification(stored_data['file_name'], "tampered", 0, mode="fast")
+    return matches
+
+def verify_chunks(stored_data, indices):
+    """
+    Verifies only the selected chunks through ranged downloads against the stored Merkle leaves.
+    """
+    file_name = stored_data['file_name']
+    if not stored_data.get('merkle'):
+        print(f"Error: '{file_name}' has no chunk hashes (it was uploaded before chunk hashing was added).")
+        return
+
+    print(f"🧩 Checking {len(indices)} chunk(s) with ranged downloads...")
+    report = integrity.check_chunks(stored_data, stored_data['merkle'], indices)
+    print(f"Downloaded {format_file_size(report['bytes_downloaded'])} instead of {format_file_size(stored_data['file_size'])}")
+    if report['tampered_chunks']:
+        print("\n🚨 TAMPERED CHUNKS DETECTED!")
+        for start, end in report['tampered_ranges']:
+            print(f"   ❌ Bytes {start}-{end}")
+    else:
+        print(f"\n✅ All {len(indices)} checked chunk(s) are intact.")
+
+def verify_and_match(file_name, fast=False, chunks=None):
     """
     Downloads the file from Google Drive, re-hashes it, and compares with the stored hash.
+    With fast=True, Drive-reported checksums are compared instead of downloading.
+    With chunks, only those Merkle chunks are downloaded and checked.
     """
     try:
         # Step 1: Retrieve original hash and Drive ID from MongoDB
@@ -105,29 +222,28 @@ def verify_and_match(file_name):
         
         original_hash = stored_data['hash']
         file_id = stored_data['drive_id']
-        print(f"Original hash found: {original_hash}")
-
-        # Step 2: Download the file from Google Drive
-        print(f"Downloading file with ID {file_id} from Google Drive...")
-        service = get_drive_service()
-        request = service.files().get_media(fileId=file_id)
-        fh = BytesIO()
-        downloader = MediaIoBaseDownload(fh, request)
-        done = False
-        while not done:
-            status, done = downloader.next_chunk()
-        
-        downloaded_content = fh.getvalue()
-        
-        # Step 3: Re-compute the hash of the downloaded content
-        print("Re-computing hash of downloaded file...")
-        downloaded_hash = hashlib.sha256(downloaded_content).hexdigest()
+        print(f"Original hash found: {original_hash} ({record_algorithm(stored_data)})")
+
+        if chunks:
+            verify_chunks(stored_data, chunks)
+            return
+
+        if fast and fast_verify(stored_data) is not None:
+            return
+
+        # Step 2 & 3: Stream the file from Google Drive through the hasher
+        print(f"Streaming file with ID {file_id} from Google Drive and re-computing hash...")
+        is_intact, stream, tampered_ranges = integrity.stream_and_compare(stored_data)
+        downloaded_hash = stream.hexdigest()
+        downloaded_size = stream.bytes_written
         print(f"Downloaded file's hash: {downloaded_hash}")
+        print(f"Streamed {format_file_size(downloaded_size)} in {stream.elapsed:.2f}s "
+              f"({format_file_size(stream.bytes_per_sec)}/s)")
 
         # Step 4: Compare the hashes and show the result
-        if original_hash == downloaded_hash:
+        if is_intact:
             print("\n✅ Verification Successful! The file is intact. Trust Score: 100%")
-            print(f"File size: {len(downloaded_content)} bytes")
+            print(f"File size: {downloaded_size} bytes")
             # Update verification stats in MongoDB
             db_storage = storage.MongoDBStorage()
             db_storage.update_verification(file_name, "success", 100)
@@ -139,7 +255,11 @@ def verify_and_match(file_name):
             print("📊 SECURITY ANALYSIS:")
             print(f"   👤 Original Hash:   {original_hash}")
             print(f"   🔍 Current Hash:    {downloaded_hash}")
-            print(f"   📏 File Size:       {len(downloaded_content)} bytes")
+            print(f"   📏 File Size:       {downloaded_size} bytes")
+            if tampered_ranges:
+                print("   🧩 Tampered byte ranges:")
+                for start, end in tampered_ranges:
+                    print(f"      • {start}-{end}")
             print("\n⚠️  RECOMMENDATIONS:")
             print("   • Do NOT trust this file")
             print("   • Contact the file owner immediately")
@@ -163,110 +283,374 @@ def list_files():
     except Exception as e:
         print(f"An error occurred while listing files: {e}")
 
-def verify_all_files():
+def print_sweep_result(result):
+    """Print one per-file line of a verify-all sweep"""
+    file_name = result['filename']
+    if not result['verified']:
+        print(f"❌ Error verifying {file_name}: {result.get('error')}")
+    elif result['is_intact'] and result['mode'] == 'fast':
+        print(f"✅ {file_name}: INTACT (Drive checksums) - Trust Score: 100%")
+    elif result['is_intact'] and result['mode'] == 'sample':
+        limited = " (budget-limited)" if result['budget_limited'] else ""
+        print(f"✅ {file_name}: {result['chunks_checked']} sampled chunk(s) intact - "
+              f"{result['confidence'] * 100:.2f}% detection confidence{limited}, "
+              f"{format_file_size(result['bytes_downloaded'])} downloaded")
+    elif result['is_intact']:
+        print(f"✅ {file_name}: INTACT - Trust Score: 100% "
+              f"({format_file_size(result['file_size'])} at {format_file_size(result['bytes_per_sec'])}/s)")
+    else:
+        print(f"🚨 {file_name}: TAMPERED - Trust Score: 0%")
+        for start, end in result.get('tampered_ranges') or []:
+            print(f"   🧩 Tampered bytes {start}-{end}")
+
+def verify_all_files(workers=config.VERIFY_WORKERS, fast=False, full_interval_days=config.FULL_VERIFY_INTERVAL_DAYS,
+                     sample_policy=None, max_bytes=config.VERIFY_MAX_BYTES, bytes_per_day=config.VERIFY_BYTES_PER_DAY,
+                     bytes_per_sec=config.VERIFY_BYTES_PER_SEC):
     """
-    Verify integrity of all stored files at once.
+    Verify integrity of all stored files at once, `workers` files at a time.
+    In fast mode only files due a scheduled full verification are downloaded.
+    With a sample policy, files are spot-checked on random chunks. With a byte
+    budget, the stalest files are verified first until it runs out.
     """
     print("🔍 STARTING BATCH VERIFICATION OF ALL FILES")
+    print(f"⚙️  Workers: {workers}")
+    if fast:
+        print(f"⚡ Fast mode: Drive checksums, full download every {full_interval_days} days")
+    if sample_policy is not None:
+        print(f"🎲 Sample mode: {sample_policy.confidence * 100:g}% confidence of catching tampering of "
+              f"{sample_policy.tampered_fraction * 100:g}% of a file, "
+              f"budget {format_file_size(sample_policy.budget_bytes)} per file")
+    if max_bytes is not None or bytes_per_day is not None or bytes_per_sec is not None:
+        limits = [f"{format_file_size(max_bytes)} this run" if max_bytes is not None else None,
+                  f"{format_file_size(bytes_per_day)} per day" if bytes_per_day is not None else None,
+                  f"{format_file_size(bytes_per_sec)}/s" if bytes_per_sec is not None else None]
+        print(f"🪣 Byte budget: {', '.join(limit for limit in limits if limit)} (stalest files first)")
     print("=" * 50)
     
     try:
-        files = storage.list_all_files()
+        db_storage = storage.MongoDBStorage()
+        budget = None
+        if max_bytes is not None or bytes_per_day is not None or bytes_per_sec is not None:
+            budget = integrity.open_budget(db_storage, max_bytes, bytes_per_day, bytes_per_sec)
+        sources = db_storage.iter_verification_sources(stalest_first=budget is not None and budget.limited)
+        summary = VerificationSummary()
+        
+        try:
+            with storage.VerificationResultWriter() as results_writer:
+                for result in integrity.sweep(sources, results_writer, workers, fast, full_interval_days,
+                                              sample_policy, budget):
+                    summary.add(result)
+                    print_sweep_result(result)
+        finally:
+            if budget is not None:
+                integrity.close_budget(db_storage, budget)
         
-        if not files:
+        if budget is not None and budget.limited:
+            print_budget_report(budget)
+        if summary.total == 0:
             print("❌ No files to verify.")
             return
         
-        verified_count = 0
-        tampered_count = 0
-        
-        for file_name in files:
-            print(f"\n🔍 Verifying: {file_name}")
-            print("-" * 30)
-            
-            try:
-                stored_data = storage.get_file_hash(file_name)
-                if not stored_data:
-                    print(f"❌ No metadata found for {file_name}")
-                    continue
-                
-                original_hash = stored_data['hash']
-                file_id = stored_data['drive_id']
-                
-                # Download and verify
-                service = get_drive_service()
-                request = service.files().get_media(fileId=file_id)
-                fh = BytesIO()
-                downloader = MediaIoBaseDownload(fh, request)
-                
-                done = False
-                while done is False:
-                    status, done = downloader.next_chunk()
-                
-                downloaded_content = fh.getvalue()
-                downloaded_hash = hashlib.sha256(downloaded_content).hexdigest()
-                
-                if original_hash == downloaded_hash:
-                    print(f"✅ INTACT - Trust Score: 100%")
-                    verified_count += 1
-                    db_storage = storage.MongoDBStorage()
-                    db_storage.update_verification(file_name, "success", 100)
-                    db_storage.close_connection()
-                else:
-                    print(f"🚨 TAMPERED - Trust Score: 0%")
-                    tampered_count += 1
-                    db_storage = storage.MongoDBStorage()
-                    db_storage.update_verification(file_name, "tampered", 0)
-                    db_storage.close_connection()
-                    
-            except Exception as e:
-                print(f"❌ Error verifying {file_name}: {e}")
-        
         # Summary
         print(f"\n📊 VERIFICATION SUMMARY")
         print("=" * 50)
-        print(f"✅ Intact files: {verified_count}")
-        print(f"🚨 Tampered files: {tampered_count}")
-        total = verified_count + tampered_count
-        if total > 0:
-            security_percentage = (verified_count / total) * 100
-            print(f"🔒 Overall Security Score: {security_percentage:.1f}%")
+        print(f"✅ Intact files: {summary.verified_count}")
+        print(f"🚨 Tampered files: {summary.tampered_count}")
+        if summary.error_count > 0:
+            print(f"❌ Errors: {summary.error_count}")
+        if summary.checked_count > 0:
+            print(f"🔒 Overall Security Score: {summary.security_percentage():.1f}%")
             
-            if tampered_count > 0:
-                print(f"\n⚠️  SECURITY ALERT: {tampered_count} file(s) have been tampered!")
+            if summary.tampered_count > 0:
+                print(f"\n⚠️  SECURITY ALERT: {summary.tampered_count} file(s) have been tampered!")
                 print("🚨 Immediate action required!")
         else:
             print("❌ No files were verified.")
+        print_drive_stats()
             
     except Exception as e:
         print(f"An error occurred during batch verification: {e}")
 
-def delete_file(file_name):
+def verify_distributed(workers=config.VERIFY_WORKERS, sample_policy=None, round_id=None, node_id=None,
+                       lease_seconds=config.VERIFY_LEASE_SECONDS):
     """
-    Delete a file from both Google Drive and MongoDB storage.
+    Verify files together with other nodes running the same command: each node claims
+    files through leases in MongoDB, so every file is verified once per round.
+    """
+    db_storage = storage.MongoDBStorage()
+    leases = db_storage.verification_leases(node_id, round_id, lease_seconds)
+    print("🌐 DISTRIBUTED VERIFICATION")
+    print(f"⚙️  Node: {leases.node_id} | Round: {leases.round_id} | Workers: {workers} | Lease: {lease_seconds}s")
+    print("=" * 50)
+    try:
+        summary = VerificationSummary()
+        with storage.VerificationResultWriter() as results_writer:
+            for result in integrity.distributed_sweep(leases, results_writer, workers, sample_policy):
+                summary.add(result)
+                print_sweep_result(result)
+                if result.get('lease_lost'):
+                    print(f"   ⚠️  Lease on '{result['filename']}' expired and was taken over by another node")
+
+        stats = leases.stats()
+        print(f"\n📊 DISTRIBUTED VERIFICATION SUMMARY (this node)")
+        print("=" * 50)
+        if stats['claimed'] == 0:
+            print(f"✅ Nothing left to claim: every file is done or being verified in round {leases.round_id}.")
+            print("   Pass --round with a new name to start another round.")
+        print(f"📥 Claimed: {stats['claimed']} | Completed: {stats['completed']} | "
+              f"Left to other nodes: {stats['released']} | Leases lost: {stats['lost']}")
+        print(f"✅ Intact files: {summary.verified_count}")
+        print(f"🚨 Tampered files: {summary.tampered_count}")
+        if summary.error_count > 0:
+            print(f"❌ Errors: {summary.error_count}")
+        if summary.tampered_count > 0:
+            print(f"\n⚠️  SECURITY ALERT: {summary.tampered_count} file(s) have been tampered!")
+        print_drive_stats()
+
+    except Exception as e:
+        print(f"An error occurred during distributed verification: {e}")
+
+def print_budget_report(budget):
+    """Coverage achieved and backlog left by a budgeted sweep"""
+    report = budget.to_dict()
+    print(f"\n🪣 BYTE BUDGET")
+    print("=" * 50)
+    print(f"📥 Downloaded: {format_file_size(report['bytes_downloaded'])}")
+    print(f"📈 Coverage: {report['covered_files']} file(s), {format_file_size(report['covered_bytes'])} "
+          f"({report['coverage_percentage']:.1f}% of files)")
+    if report['backlog_files']:
+        since = report['backlog_since'] or "never verified"
+        print(f"⏳ Backlog: {report['backlog_files']} file(s), {format_file_size(report['backlog_bytes'])} "
+              f"(stalest last verified: {since})")
+    if report['oversized_files']:
+        print(f"⚠️  {report['oversized_files']} file(s) are larger than the whole budget and were skipped; "
+              "raise the budget or use --sample for them.")
+
+def verify_changed_files(workers=config.VERIFY_WORKERS, sample_policy=None, feed=None):
+    """
+    Verify only files that changed on Drive since the last incremental run, using the
+    Drive changes feed; all other files keep their last verification. The first run
+    records a baseline instead. `feed` may be a changes.FakeChangesFeed for offline runs.
+    """
+    print("🔁 INCREMENTAL VERIFICATION (Drive changes feed)")
+    print("=" * 50)
+    try:
+        db_storage = storage.MongoDBStorage()
+        feed = feed or drive_client.DriveChangesFeed(get_drive_service())
+        plan = integrity.plan_changes(db_storage, feed)
+        if plan is None:
+            print("📌 No baseline yet: recording the feed position and a metadata snapshot of every file...")
+            with storage.DriveMetadataWriter() as metadata_writer:
+                counts = integrity.take_baseline(db_storage, feed, metadata_writer)
+            print(f"✅ Baseline recorded for {sum(counts.values())} file(s). From now on only changed files are verified;")
+            print("   run 'python main.py verify-all' once if the files have not been fully verified recently.")
+            if counts['missing'] or counts['changed']:
+                print(f"⚠️  Already differing from their upload: {counts['changed']} changed, {counts['missing']} missing")
+            return
+
+        print(f"📰 {plan.changes_seen} change(s) on Drive: {len(plan.to_verify)} file(s) to verify, "
+              f"{len(plan.unchanged)} with metadata-only changes, {plan.untracked} untracked")
+        if plan.retried:
+            print(f"🔁 Retrying {plan.retried} file(s) whose verification failed last run")
+
+        summary = VerificationSummary()
+        with storage.VerificationResultWriter() as results_writer, storage.DriveMetadataWriter() as metadata_writer:
+            for result in integrity.incremental_sweep(plan, results_writer, metadata_writer, workers, sample_policy):
+                summary.add(result)
+                print_sweep_result(result)
+        integrity.save_changes_position(db_storage, plan)
+
+        print(f"\n📊 INCREMENTAL VERIFICATION SUMMARY")
+        print("=" * 50)
+        print(f"✅ Intact files: {summary.verified_count}")
+        print(f"🚨 Tampered files: {summary.tampered_count}")
+        if summary.error_count > 0:
+            print(f"❌ Errors: {summary.error_count} (retried on the next run)")
+        if summary.tampered_count > 0:
+            print(f"\n⚠️  SECURITY ALERT: {summary.tampered_count} file(s) have been tampered!")
+        print_drive_stats()
+
+    except Exception as e:
+        print(f"An error occurred during incremental verification: {e}")
+
+def run_verify_daemon(files_per_minute=config.DAEMON_FILES_PER_MINUTE, sla_hours=config.DAEMON_SLA_HOURS,
+                      workers=config.DAEMON_WORKERS, sample_policy=None):
+    """
+    Verify files continuously at a steady rate, most overdue first, so every file is
+    re-verified within the SLA without the load spikes of full sweeps. Runs until Ctrl+C.
+    """
+    print("🛡️  VERIFY DAEMON")
+    print(f"⚙️  Rate: {files_per_minute:g} files/min | SLA: {sla_hours:g}h | Workers: {workers}")
+    if sample_policy is not None:
+        print(f"🎲 Spot-checking with {sample_policy.confidence * 100:g}% confidence per file")
+    print("=" * 50)
+
+    db_storage = storage.MongoDBStorage()
+    scheduler = VerificationScheduler(sla_hours * 3600)
+    with storage.VerificationResultWriter() as results_writer:
+        daemon = VerifyDaemon(
+            scheduler,
+            lambda record: integrity.check_item(record, results_writer, sample_policy),
+            db_storage.iter_daemon_sources,
+            rate=files_per_minute / 60,
+            workers=workers,
+            on_result=print_sweep_result
+        )
+        runner = threading.Thread(target=daemon.run, name="verify-daemon")
+        runner.start()
+        try:
+            while runner.is_alive():
+                runner.join(config.DAEMON_STATUS_SECONDS)
+                if runner.is_alive():
+                    print_daemon_status(daemon.status())
+        except KeyboardInterrupt:
+            print("\n⏹️  Stopping after the checks in flight...")
+            daemon.stop()
+            runner.join()
+    print_daemon_status(daemon.status())
+
+def print_daemon_status(status):
+    """One status line for verify-daemon, with a warning when the rate cannot meet the SLA"""
+    print(f"📈 {status['checked']} checked ({status['intact']} intact, {status['tampered']} tampered, "
+          f"{status['errors']} errors) | {status['files']} files, {status['overdue']} past SLA | "
+          f"rate {status['rate'] * 60:.1f}/min, SLA needs {status['required_rate'] * 60:.1f}/min")
+    if status['required_rate'] > status['rate']:
+        print("⚠️  The configured rate is too low for every file to meet the SLA; raise --rate or --sla-hours.")
+
+def set_risk_weight(file_name, weight):
+    """Sets how much more often than the SLA verify-daemon checks a file"""
+    try:
+        if storage.MongoDBStorage().set_risk_weight(file_name, weight):
+            print(f"✅ Risk weight of '{file_name}' set to {weight:g}")
+        else:
+            print(f"Error: No metadata found for '{file_name}'.")
+    except Exception as e:
+        print(f"An error occurred while setting the risk weight: {e}")
+
+def print_drive_stats():
+    """Print the Drive rate limiter's counters, if it had to slow anything down"""
+    stats = drive_client.get_limiter().stats()
+    if stats['throttled'] or stats['retries'] or stats['delayed']:
+        print(f"🚦 Drive calls: {stats['calls']} | throttled: {stats['throttled']} | retries: {stats['retries']} | "
+              f"rate-limited waits: {stats['delayed']} ({stats['wait_seconds']:.1f}s) | "
+              f"rate now {stats['current_rate']:.1f}/{stats['max_rate']:g} req/s")
+
+def download_file(file_name, destination=None):
+    """
+    Downloads a stored file, checking it against the recorded hash before it is saved.
+    Large files are spooled to a temporary file instead of being held in memory,
+    and a file whose hash does not match is not written to the destination.
     """
     try:
-        # Get metadata from MongoDB
         stored_data = storage.get_file_hash(file_name)
-        
         if not stored_data:
             print(f"Error: No metadata found for '{file_name}'.")
             return
-        
-        file_id = stored_data['drive_id']
-        
-        # Delete from Google Drive
-        service = get_drive_service()
-        service.files().delete(fileId=file_id).execute()
-        print(f"File deleted from Google Drive: {file_id}")
-        
-        # Delete from MongoDB (soft delete)
-        storage.delete_file_hash(file_name)
+
+        destination = destination or os.path.basename(file_name)
+        print(f"Downloading {file_name} ({format_file_size(stored_data['file_size'])}) from Google Drive...")
+        spool, stream = drive_client.download_file(get_drive_service(), stored_data['drive_id'],
+                                                   size=stored_data['file_size'],
+                                                   algorithm=record_algorithm(stored_data))
+        with spool:
+            print(f"Streamed {format_file_size(stream.bytes_written)} in {stream.elapsed:.2f}s "
+                  f"({format_file_size(stream.bytes_per_sec)}/s)")
+            if stream.hexdigest() != stored_data['hash']:
+                print("\n🚨 SECURITY ALERT - the downloaded content does not match the stored hash!")
+                print(f"❌ Not saving it. Run 'python main.py verify {file_name}' for details.")
+                return
+            with open(destination, 'wb') as f:
+                shutil.copyfileobj(spool, f, config.HASH_BUFFER_SIZE)
+        print(f"✅ Hash verified; saved to {destination}")
+
+    except Exception as e:
+        print(f"An error occurred during download: {e}")
+
+def delete_file(file_name):
+    """
+    Delete a file from both Google Drive and MongoDB storage.
+    The Drive object is kept while other (deduplicated) names still point at it.
+    """
+    try:
+        result = uploads.delete_file(file_name)
+        if result is None:
+            print(f"Error: No metadata found for '{file_name}'.")
+            return
+
+        if result['drive_deleted']:
+            print(f"File deleted from Google Drive: {result['drive_id']}")
+        else:
+            print(f"Drive file {result['drive_id']} kept: still referenced by "
+                  f"{result['remaining_references']} other name(s)")
         print(f"✅ File '{file_name}' successfully deleted from the system.")
         
     except Exception as e:
         print(f"An error occurred during deletion: {e}")
 
+def delete_files(file_names):
+    """
+    Delete many files at once: records are soft-deleted in bulk and the Drive
+    objects no other name references are removed with batched API calls.
+    """
+    try:
+        print(f"🗑️  Deleting {len(file_names)} file(s)...")
+        results = uploads.delete_files(file_names)
+        deleted = [r for r in results if r['deleted']]
+        for result in results:
+            if not result['deleted']:
+                print(f"❌ {result['filename']}: {result['error']}")
+
+        print(f"\n📊 DELETE SUMMARY")
+        print("=" * 50)
+        print(f"✅ Deleted: {len(deleted)}")
+        print(f"☁️  Drive objects removed: {len({r['drive_id'] for r in deleted if r['drive_deleted']})}")
+        kept = len([r for r in deleted if not r['drive_deleted']])
+        if kept:
+            print(f"♻️  Names whose Drive object is still referenced elsewhere: {kept}")
+        if len(deleted) < len(results):
+            print(f"❌ Not deleted: {len(results) - len(deleted)}")
+        print_drive_stats()
+
+    except Exception as e:
+        print(f"An error occurred during deletion: {e}")
+
+def read_names(path):
+    """File names one per line from a file, or from stdin when path is '-'"""
+    with (sys.stdin if path == '-' else open(path)) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def refresh_metadata():
+    """
+    Refreshes the stored Drive metadata of every active file with batched API calls
+    and reports files that changed on Drive or disappeared from it.
+    """
+    print("🔄 REFRESHING DRIVE METADATA")
+    print("=" * 50)
+    try:
+        counts = {'current': 0, 'changed': 0, 'missing': 0, 'error': 0}
+        sources = storage.MongoDBStorage().iter_verification_sources()
+        with storage.DriveMetadataWriter() as writer:
+            for result in integrity.refresh_metadata(sources, writer):
+                counts[result['status']] += 1
+                if result['status'] == 'changed':
+                    print(f"⚠️  {result['filename']}: changed on Drive since upload; run a full verification")
+                elif result['status'] == 'missing':
+                    print(f"🚨 {result['filename']}: Drive object {result['drive_id']} no longer exists")
+                elif result['status'] == 'error':
+                    print(f"❌ {result['filename']}: {result['error']}")
+
+        print(f"\n📊 REFRESH SUMMARY")
+        print("=" * 50)
+        print(f"✅ Unchanged: {counts['current']}")
+        print(f"⚠️  Changed: {counts['changed']}")
+        print(f"🚨 Missing: {counts['missing']}")
+        if counts['error']:
+            print(f"❌ Errors: {counts['error']}")
+        print_drive_stats()
+
+    except Exception as e:
+        print(f"An error occurred during metadata refresh: {e}")
+
 def search_files(query):
     """Search files by name or hash"""
     try:
@@ -285,9 +669,17 @@ def show_database_stats():
     except Exception as e:
         print(f"An error occurred while getting stats: {e}")
 
+def init_database():
+    """Create MongoDB indexes (one-time bootstrap; safe to re-run)"""
+    try:
+        storage.ensure_indexes()
+    except Exception as e:
+        print(f"An error occurred while initializing the database: {e}")
+
 def migrate_to_mongodb():
     """Migrate existing JSON data to MongoDB"""
     try:
+        storage.ensure_indexes()
         db_storage = storage.MongoDBStorage()
         migrated_count = db_storage.migrate_from_json()
         print(f"\n🔄 Migration Summary:")
@@ -297,20 +689,144 @@ def migrate_to_mongodb():
     except Exception as e:
         print(f"An error occurred during migration: {e}")
 
+def rehash_all_files(algorithm, workers=config.VERIFY_WORKERS, promote=False):
+    """
+    Background migration: add an `algorithm` digest to every file that lacks one.
+    Each file is downloaded once, checked against its current digest and only
+    then given the new one, so existing digests keep verifying throughout.
+    """
+    print(f"🔁 RE-HASHING FILES WITH {algorithm.upper()}")
+    print(f"⚙️  Workers: {workers}" + (" | promoting new digests to primary" if promote else ""))
+    print("=" * 50)
+
+    try:
+        db_storage = storage.MongoDBStorage()
+        sources = db_storage.iter_rehash_sources(algorithm)
+        summary = VerificationSummary()
+
+        with storage.VerificationResultWriter() as results_writer:
+            for result in integrity.rehash_sweep(sources, algorithm, results_writer, db_storage, workers, promote):
+                summary.add(result)
+                print_sweep_result(result)
+
+        if summary.total == 0:
+            print(f"✅ Every file already has a {algorithm} digest.")
+            return
+
+        print(f"\n📊 RE-HASH SUMMARY")
+        print("=" * 50)
+        print(f"✅ Re-hashed: {summary.verified_count}")
+        if summary.tampered_count > 0:
+            print(f"🚨 Skipped as tampered: {summary.tampered_count}")
+        if summary.error_count > 0:
+            print(f"❌ Errors: {summary.error_count}")
+
+    except Exception as e:
+        print(f"An error occurred during re-hashing: {e}")
+
 # Main CLI logic
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="A Decentralized Cloud Storage Validator MVP.")
+    parser.add_argument('--drive-rps', type=float, default=config.DRIVE_REQUESTS_PER_SECOND,
+                        help=f'Most Drive API calls per second (default: {config.DRIVE_REQUESTS_PER_SECOND:g}).')
+    parser.add_argument('--drive-concurrency', type=int, default=config.DRIVE_MAX_CONCURRENCY,
+                        help=f'Most Drive API calls in flight at once (default: {config.DRIVE_MAX_CONCURRENCY}).')
     subparsers = parser.add_subparsers(dest='command', required=True, help='Available commands')
 
     upload_parser = subparsers.add_parser('upload', help='Upload a file to Google Drive and store its hash.')
-    upload_parser.add_argument('file_path', type=str, help='The path to the file on your local machine.')
+    upload_parser.add_argument('file_path', type=str, help='The path to the file (or, with --recursive, directory) on your local machine.')
+    upload_parser.add_argument('--recursive', action='store_true',
+                               help='Upload every file under the directory; re-running skips files already recorded.')
+    upload_parser.add_argument('--include', action='append', default=[], metavar='GLOB',
+                               help='With --recursive, only upload relative paths matching this glob (repeatable).')
+    upload_parser.add_argument('--exclude', action='append', default=[], metavar='GLOB',
+                               help='With --recursive, skip relative paths matching this glob (repeatable).')
+    upload_parser.add_argument('--hash-workers', type=int,
+                               help='Cores for tree-hashing files of at least '
+                                    f'{config.PARALLEL_HASH_THRESHOLD // (1024 ** 3)}GB, 1 disables '
+                                    f'(default: {config.PARALLEL_HASH_WORKERS}); with --recursive, hashing threads '
+                                    f'(default: {config.PIPELINE_HASH_WORKERS}).')
+    upload_parser.add_argument('--upload-workers', type=int, default=config.PIPELINE_UPLOAD_WORKERS,
+                               help=f'With --recursive, concurrent uploads (default: {config.PIPELINE_UPLOAD_WORKERS}).')
+    upload_parser.add_argument('--no-cache', action='store_true',
+                               help='Bypass the local hash cache and hash every file from disk.')
+    upload_parser.add_argument('--skip-unchanged', action='store_true',
+                               help='Skip the upload if the file is unchanged since it was last uploaded and Drive\'s '
+                                    'copy still matches (by default the file is always sent, e.g. to repair Drive\'s copy).')
+    upload_parser.add_argument('--dedup', action='store_true', default=config.DEDUP_UPLOADS,
+                               help='Record content that is already on Drive under the new name instead of uploading it again.')
+    upload_parser.add_argument('--chunk-mb', type=int, default=config.UPLOAD_CHUNK_SIZE // (1024 * 1024),
+                               help='Resumable upload chunk size in MB; larger files are sent chunk by chunk and '
+                                    f'resume after an interruption (default: {config.UPLOAD_CHUNK_SIZE // (1024 * 1024)}).')
 
     verify_parser = subparsers.add_parser('verify', help='Verify the integrity of a file stored in Google Drive.')
     verify_parser.add_argument('file_name', type=str, help='The name of the file to verify (e.g., my_document.pdf).')
+    verify_parser.add_argument('--fast', action='store_true',
+                               help='Compare Drive-reported checksums instead of downloading the file.')
+    verify_parser.add_argument('--chunks', type=parse_chunk_spec,
+                               help='Only download and check these Merkle chunks, e.g. "0,5,10-12".')
+
+    download_parser = subparsers.add_parser('download', help='Download a file from Google Drive after checking its hash.')
+    download_parser.add_argument('file_name', type=str, help='The name of the file to download.')
+    download_parser.add_argument('--output', '-o', type=str, help='Where to save it (default: the file name in the current directory).')
 
     list_parser = subparsers.add_parser('list', help='List all files stored in the system.')
 
     verify_all_parser = subparsers.add_parser('verify-all', help='Verify integrity of all stored files at once.')
+    verify_all_parser.add_argument('--workers', type=int, default=config.VERIFY_WORKERS,
+                                   help=f'Files to verify concurrently (default: {config.VERIFY_WORKERS}).')
+    verify_all_parser.add_argument('--fast', action='store_true',
+                                   help='Check Drive-reported checksums in batches instead of downloading every file.')
+    verify_all_parser.add_argument('--full-interval-days', type=int, default=config.FULL_VERIFY_INTERVAL_DAYS,
+                                   help='In fast mode, still download files not fully verified for this many days '
+                                        f'(default: {config.FULL_VERIFY_INTERVAL_DAYS}).')
+    verify_all_parser.add_argument('--incremental', action='store_true',
+                                   help='Only verify files that changed on Drive since the last incremental run '
+                                        '(the first run records a baseline). Byte budgets do not apply.')
+    verify_all_parser.add_argument('--sample', action='store_true',
+                                   help='Spot-check randomly chosen chunks of each file instead of downloading it.')
+    verify_all_parser.add_argument('--confidence', type=float, default=config.SAMPLE_CONFIDENCE,
+                                   help=f'Target tamper-detection probability for --sample (default: {config.SAMPLE_CONFIDENCE}).')
+    verify_all_parser.add_argument('--tampered-fraction', type=float, default=config.SAMPLE_TAMPERED_FRACTION,
+                                   help='Smallest share of a file an attack is assumed to modify '
+                                        f'(default: {config.SAMPLE_TAMPERED_FRACTION}).')
+    verify_all_parser.add_argument('--distributed', action='store_true',
+                                   help='Share the sweep with other nodes running the same command, '
+                                        'claiming files through MongoDB leases.')
+    verify_all_parser.add_argument('--round', dest='round_id',
+                                   help='With --distributed: name of the sweep the nodes share; each file is verified '
+                                        'once per round (default: today\'s date).')
+    verify_all_parser.add_argument('--node-id', help='With --distributed: this node\'s name (default: host:pid).')
+    verify_all_parser.add_argument('--lease-seconds', type=int, default=config.VERIFY_LEASE_SECONDS,
+                                   help='With --distributed: claimed files return to the pool if this node stops '
+                                        f'renewing them for this long (default: {config.VERIFY_LEASE_SECONDS}).')
+    verify_all_parser.add_argument('--max-gb', type=float,
+                                   help='Stop starting downloads once this run has used this many gigabytes; '
+                                        'the stalest files are verified first.')
+    verify_all_parser.add_argument('--daily-gb', type=float,
+                                   help='Most gigabytes verify-all runs download per day, counted across runs.')
+    verify_all_parser.add_argument('--max-mbps', type=float,
+                                   help='Cap verification downloads at this many megabytes per second.')
+    verify_all_parser.add_argument('--sample-budget-mb', type=float, default=config.SAMPLE_BUDGET_BYTES / (1024 * 1024),
+                                   help='Most megabytes --sample downloads per file '
+                                        f'(default: {config.SAMPLE_BUDGET_BYTES // (1024 * 1024)}).')
+
+    daemon_parser = subparsers.add_parser('verify-daemon',
+                                          help='Verify files continuously, most overdue first, within an SLA.')
+    daemon_parser.add_argument('--rate', type=float, default=config.DAEMON_FILES_PER_MINUTE,
+                               help=f'Files verified per minute (default: {config.DAEMON_FILES_PER_MINUTE:g}).')
+    daemon_parser.add_argument('--sla-hours', type=float, default=config.DAEMON_SLA_HOURS,
+                               help=f'Every file is re-verified at least this often (default: {config.DAEMON_SLA_HOURS}).')
+    daemon_parser.add_argument('--workers', type=int, default=config.DAEMON_WORKERS,
+                               help=f'Verifications in flight at once (default: {config.DAEMON_WORKERS}).')
+    daemon_parser.add_argument('--sample', action='store_true',
+                               help='Spot-check random chunks of each file (default confidence and budget) '
+                                    'instead of downloading it.')
+
+    risk_parser = subparsers.add_parser('set-risk', help='Make verify-daemon check a file more (or less) often.')
+    risk_parser.add_argument('file_name', type=str, help='The name of the file.')
+    risk_parser.add_argument('weight', type=float,
+                             help='Check the file this many times per SLA window (1 is the default).')
 
     search_parser = subparsers.add_parser('search', help='Search files by name or hash.')
     search_parser.add_argument('query', type=str, help='Search term (file name or partial hash).')
@@ -319,24 +835,103 @@ if __name__ == "__main__":
 
     migrate_parser = subparsers.add_parser('migrate', help='Migrate data from JSON to MongoDB.')
 
-    delete_parser = subparsers.add_parser('delete', help='Delete a file from both Google Drive and MongoDB storage.')
-    delete_parser.add_argument('file_name', type=str, help='The name of the file to delete.')
+    init_db_parser = subparsers.add_parser('init-db', help='Create MongoDB indexes (run once per deployment).')
+
+    rehash_parser = subparsers.add_parser('rehash', help='Add a digest in another algorithm to every stored file.')
+    rehash_parser.add_argument('--algorithm', required=True, choices=sorted(ALGORITHMS),
+                               help='Digest algorithm to compute.')
+    rehash_parser.add_argument('--workers', type=int, default=2,
+                               help='Files to re-hash concurrently (default: 2, to stay out of the way).')
+    rehash_parser.add_argument('--promote', action='store_true',
+                               help='Make the new digest the primary one; the old digest is kept as a secondary.')
+
+    delete_parser = subparsers.add_parser('delete', help='Delete files from both Google Drive and MongoDB storage.')
+    delete_parser.add_argument('file_names', nargs='*', metavar='file_name',
+                               help='The name(s) of the file(s) to delete; several names are deleted in batches.')
+    delete_parser.add_argument('--from-file', metavar='PATH',
+                               help='Also delete the names listed one per line in this file ("-" for stdin).')
+
+    refresh_parser = subparsers.add_parser('refresh-metadata',
+                                           help='Refresh the stored Drive metadata of every file with batched API calls.')
 
     args = parser.parse_args()
+    drive_client.configure_limiter(max(0.1, args.drive_rps), max(1, args.drive_concurrency))
 
     if args.command == 'upload':
-        upload_and_hash(args.file_path)
+        use_cache = config.HASH_CACHE_ENABLED and not args.no_cache
+        chunk_size = max(1, args.chunk_mb) * 1024 * 1024
+        if args.recursive:
+            upload_directory(args.file_path, args.include, args.exclude,
+                             max(1, args.hash_workers or config.PIPELINE_HASH_WORKERS),
+                             max(1, args.upload_workers), use_cache, args.dedup, chunk_size)
+        elif args.include or args.exclude:
+            parser.error('--include and --exclude require --recursive')
+        else:
+            upload_and_hash(args.file_path, max(1, args.hash_workers or config.PARALLEL_HASH_WORKERS), use_cache,
+                            args.dedup, chunk_size, args.skip_unchanged)
     elif args.command == 'verify':
-        verify_and_match(args.file_name)
+        verify_and_match(args.file_name, args.fast, args.chunks)
+    elif args.command == 'download':
+        download_file(args.file_name, args.output)
     elif args.command == 'list':
         list_files()
     elif args.command == 'verify-all':
-        verify_all_files()
+        if args.fast and args.sample:
+            parser.error('--fast and --sample cannot be combined')
+        if args.fast and args.incremental:
+            parser.error('--fast and --incremental cannot be combined')
+        if args.incremental and any(value is not None for value in (args.max_gb, args.daily_gb, args.max_mbps)):
+            parser.error('--incremental cannot be combined with --max-gb, --daily-gb or --max-mbps')
+        if args.distributed and (args.fast or args.incremental or args.max_gb or args.daily_gb or args.max_mbps):
+            parser.error('--distributed cannot be combined with --fast, --incremental or byte budgets')
+        if args.lease_seconds <= 0:
+            parser.error('--lease-seconds must be positive')
+        sample_policy = None
+        if args.sample:
+            try:
+                sample_policy = SamplePolicy(args.confidence, args.tampered_fraction,
+                                             int(args.sample_budget_mb * 1024 * 1024))
+            except ValueError as e:
+                parser.error(str(e))
+        workers = max(1, min(args.workers, config.MAX_VERIFY_WORKERS))
+        if args.incremental:
+            verify_changed_files(workers, sample_policy)
+        elif args.distributed:
+            verify_distributed(workers, sample_policy, args.round_id, args.node_id, args.lease_seconds)
+        else:
+            if any(value is not None and value <= 0 for value in (args.max_gb, args.daily_gb, args.max_mbps)):
+                parser.error('--max-gb, --daily-gb and --max-mbps must be positive')
+            gb, mb = 1024 ** 3, 1024 ** 2
+            verify_all_files(workers, args.fast, args.full_interval_days, sample_policy,
+                             int(args.max_gb * gb) if args.max_gb else config.VERIFY_MAX_BYTES,
+                             int(args.daily_gb * gb) if args.daily_gb else config.VERIFY_BYTES_PER_DAY,
+                             int(args.max_mbps * mb) if args.max_mbps else config.VERIFY_BYTES_PER_SEC)
+    elif args.command == 'verify-daemon':
+        if args.rate <= 0 or args.sla_hours <= 0:
+            parser.error('--rate and --sla-hours must be positive')
+        run_verify_daemon(args.rate, args.sla_hours, max(1, min(args.workers, config.MAX_VERIFY_WORKERS)),
+                          SamplePolicy() if args.sample else None)
+    elif args.command == 'set-risk':
+        if args.weight <= 0:
+            parser.error('weight must be positive')
+        set_risk_weight(args.file_name, args.weight)
     elif args.command == 'search':
         search_files(args.query)
     elif args.command == 'stats':
         show_database_stats()
     elif args.command == 'migrate':
         migrate_to_mongodb()
+    elif args.command == 'init-db':
+        init_database()
+    elif args.command == 'rehash':
+        rehash_all_files(args.algorithm, max(1, min(args.workers, config.MAX_VERIFY_WORKERS)), args.promote)
     elif args.command == 'delete':
-        delete_file(args.file_name)
+        names = args.file_names + (read_names(args.from_file) if args.from_file else [])
+        if not names:
+            parser.error('give at least one file name or --from-file')
+        if len(names) == 1 and not args.from_file:
+            delete_file(names[0])
+        else:
+            delete_files(names)
+    elif args.command == 'refresh-metadata':
+        refresh_metadata()
@@ -0,0 +1,185 @@
+"""
+Fixed-size chunk Merkle trees for the Decentralized Cloud Storage Validator
+
+Files are split into chunk_size pieces; each piece becomes a SHA-256 leaf
+and the leaves are folded pairwise into a single root. Storing the leaves
+lets a mismatch be narrowed down to byte ranges, and lets individual chunks
+be checked on their own via ranged downloads.
+"""
+
+import hashlib
+
+import config
+
+DIGEST_SIZE = 32
+
+# Leaf size of the "tree-sha256" record digest. Part of the algorithm's
+# definition: changing it would invalidate every stored tree digest.
+TREE_HASH_CHUNK_SIZE = 1024 * 1024
+
+# Domain-separation prefixes so a leaf can never be confused with an inner node
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+
+def hash_leaf(chunk):
+    """Leaf digest of one chunk"""
+    leaf = hashlib.sha256(LEAF_PREFIX)
+    leaf.update(chunk)
+    return leaf.digest()
+
+
+def hash_node(left, right):
+    """Inner node digest of two children"""
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def merkle_root(leaves):
+    """Fold a list of leaf digests into the root; an odd node is promoted unchanged"""
+    level = list(leaves)
+    if not level:
+        return hash_leaf(b'')
+    while len(level) > 1:
+        next_level = [hash_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0]
+
+
+class MerkleTree:
+    """Leaf digests of a file plus the parameters needed to interpret them"""
+
+    def __init__(self, chunk_size, leaves, file_size):
+        self.chunk_size = chunk_size
+        self.leaves = leaves
+        self.file_size = file_size
+
+    @property
+    def root(self):
+        return merkle_root(self.leaves)
+
+    def leaf(self, index):
+        return self.leaves[index]
+
+    def chunk_range(self, index):
+        """Inclusive byte range covered by chunk `index`"""
+        start = index * self.chunk_size
+        return start, min(start + self.chunk_size, self.file_size) - 1
+
+    def to_document(self):
+        """Compact MongoDB representation: leaves packed into one binary blob"""
+        return {
+            "chunk_size": self.chunk_size,
+            "file_size": self.file_size,
+            "leaf_count": len(self.leaves),
+            "root": self.root.hex(),
+            "leaves": b''.join(self.leaves)
+        }
+
+    @classmethod
+    def from_document(cls, doc):
+        """Rebuild a tree from to_document() output, checking the leaves against the stored root"""
+        packed = bytes(doc["leaves"])
+        leaves = [packed[i:i + DIGEST_SIZE] for i in range(0, len(packed), DIGEST_SIZE)]
+        tree = cls(doc["chunk_size"], leaves, doc["file_size"])
+        if tree.root.hex() != doc["root"]:
+            raise ValueError("Stored Merkle leaves do not match the stored root")
+        return tree
+
+
+class MerkleBuilder:
+    """
+    Incrementally turns a byte stream into Merkle leaves. Buffers at most one
+    partial chunk, so it can ride along any streaming hash or download.
+    """
+
+    def __init__(self, chunk_size=config.MERKLE_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.leaves = []
+        self.file_size = 0
+        self._pending = bytearray()
+
+    def update(self, data):
+        self.file_size += len(data)
+        view = memoryview(data)
+        if self._pending:
+            take = min(self.chunk_size - len(self._pending), len(view))
+            self._pending += view[:take]
+            view = view[take:]
+            if len(self._pending) == self.chunk_size:
+                self.leaves.append(hash_leaf(self._pending))
+                self._pending = bytearray()
+        while len(view) >= self.chunk_size:
+            self.leaves.append(hash_leaf(view[:self.chunk_size]))
+            view = view[self.chunk_size:]
+        if len(view):
+            self._pending += view
+
+    def finish(self):
+        """Flush the trailing partial chunk and return the finished tree"""
+        if self._pending or not self.leaves:
+            self.leaves.append(hash_leaf(self._pending))
+            self._pending = bytearray()
+        return MerkleTree(self.chunk_size, self.leaves, self.file_size)
+
+
+class TreeHash(MerkleBuilder):
+    """
+    hashlib-style hasher whose digest is the Merkle root over fixed-size
+    chunks. Leaves are independent of each other, so unlike a plain SHA-256
+    the work can be split across cores.
+    """
+
+    name = "tree-sha256"
+    digest_size = DIGEST_SIZE
+
+    def __init__(self, chunk_size=TREE_HASH_CHUNK_SIZE):
+        super().__init__(chunk_size)
+
+    def digest(self):
+        """Root of everything hashed so far; more data may still be added"""
+        leaves = list(self.leaves)
+        if self._pending or not leaves:
+            leaves.append(hash_leaf(self._pending))
+        return merkle_root(leaves)
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+
+def diff_leaves(expected, actual):
+    """Indices of chunks whose leaves differ, including chunks present in only one tree"""
+    count = max(len(expected.leaves), len(actual.leaves))
+    return [
+        i for i in range(count)
+        if i >= len(expected.leaves) or i >= len(actual.leaves) or expected.leaves[i] != actual.leaves[i]
+    ]
+
+
+def chunk_ranges(indices, chunk_size, file_size):
+    """Merge chunk indices into inclusive (start, end) byte ranges"""
+    ranges = []
+    for index in sorted(set(indices)):
+        start = index * chunk_size
+        end = max(min(start + chunk_size, file_size) - 1, start)
+        if ranges and ranges[-1][1] + 1 == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def parse_chunk_spec(spec):
+    """Parse a chunk selection such as '0,4,10-12' into a sorted list of indices"""
+    indices = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            indices.update(range(int(first), int(last) + 1))
+        else:
+            indices.add(int(part))
+    return sorted(indices)
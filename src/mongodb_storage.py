@@ -4,58 +4,117 @@ MongoDB storage for the Decentralized Cloud Storage Validator
 
 import json
 import os
+import re
+import threading
 from datetime import datetime
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import MongoClient, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError, ServerSelectionTimeoutError
+
+import config
+from hashing import LEGACY_ALGORITHM
+from leases import LeaseManager
 
 # MongoDB configuration
 MONGO_URI = "mongodb://localhost:27017/"
 DATABASE_NAME = "decentralized_storage"
 COLLECTION_NAME = "file_hashes"
+SESSION_COLLECTION_NAME = "upload_sessions"  # Resumable upload sessions, so interrupted uploads can continue
+SYNC_STATE_COLLECTION_NAME = "sync_state"  # Small documents such as the Drive changes page token
+DRIVE_DELETION_COLLECTION_NAME = "drive_deletions"  # Drive objects being deleted; dedup must not link new names to them
+MAX_POOL_SIZE = 50  # Enough sockets for the largest verify-all worker pool
+SOURCE_BATCH_SIZE = 1000  # Documents per cursor batch when streaming verification sources
+WRITE_BATCH_SIZE = 500  # Verification results per bulk_write
+WRITE_FLUSH_INTERVAL = 5.0  # Seconds before buffered verification results are flushed regardless of count
+SAMPLE_HISTORY_LENGTH = 20  # Spot checks remembered per file record
+
+# Fields a verification sweep needs from each record
+VERIFICATION_PROJECTION = {
+    "_id": 0,
+    "file_name": 1,
+    "hash": 1,
+    "algorithm": 1,
+    "drive_id": 1,
+    "file_size": 1,
+    "last_verified": 1,
+    "last_full_verified": 1,
+    "md5_checksum": 1,
+    "sha256_checksum": 1,
+    "merkle.chunk_size": 1
+}
+
+# The verification daemon also schedules by the last trust score and the file's risk weight
+DAEMON_PROJECTION = dict(VERIFICATION_PROJECTION, last_trust_score=1, risk_weight=1)
+
+# Incremental sweeps also compare each record's last Drive metadata snapshot
+INCREMENTAL_PROJECTION = dict(VERIFICATION_PROJECTION, drive_metadata=1)
+
+# Fields left out of records returned to API clients: binary Merkle leaves, lease bookkeeping and long histories
+LISTING_PROJECTION = {"merkle.leaves": 0, "verify_lease": 0, "sample_history": 0}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Return the process-wide pooled MongoClient, connecting on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            try:
+                client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, maxPoolSize=MAX_POOL_SIZE)
+                # Test connection once per process instead of once per operation
+                client.admin.command('ping')
+                _client = client
+                print("✅ Connected to MongoDB successfully")
+                
+            except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+                print(f"❌ Failed to connect to MongoDB: {e}")
+                print("💡 Make sure MongoDB is running locally")
+                raise
+                
+            except Exception as e:
+                print(f"❌ Unexpected error connecting to MongoDB: {e}")
+                raise
+        return _client
+
+def close_client():
+    """Close the shared MongoDB connection pool (call once at process shutdown)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            print("🔌 MongoDB connection closed")
+
+def ensure_indexes():
+    """Create the collection indexes. Idempotent; run once at bootstrap or migration time"""
+    collection = get_client()[DATABASE_NAME][COLLECTION_NAME]
+    collection.create_index("file_name", unique=True)
+    collection.create_index([("upload_date", -1)])
+    collection.create_index("hash")
+    collection.create_index("drive_id")
+    collection.create_index([("status", 1), ("last_verified", 1)])
+    collection.create_index("verify_lease.owner", sparse=True)
+    sessions = get_client()[DATABASE_NAME][SESSION_COLLECTION_NAME]
+    sessions.create_index("path", unique=True)
+    print("🗂️ MongoDB indexes are in place")
 
 class MongoDBStorage:
     def __init__(self):
-        """Initialize MongoDB connection"""
-        try:
-            self.client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-            # Test connection
-            self.client.server_info()
-            self.db = self.client[DATABASE_NAME]
-            self.collection = self.db[COLLECTION_NAME]
-            
-            # Create indexes for better performance
-            self.collection.create_index("file_name", unique=True)
-            self.collection.create_index([("upload_date", -1)])
-            self.collection.create_index("hash")
-            
-            print("✅ Connected to MongoDB successfully")
-            
-        except (ConnectionFailure, ServerSelectionTimeoutError) as e:
-            print(f"❌ Failed to connect to MongoDB: {e}")
-            print("💡 Make sure MongoDB is running locally")
-            raise
-            
-        except Exception as e:
-            print(f"❌ Unexpected error connecting to MongoDB: {e}")
-            raise
+        """Bind to the shared MongoDB connection pool"""
+        self.client = get_client()
+        self.db = self.client[DATABASE_NAME]
+        self.collection = self.db[COLLECTION_NAME]
+        self.sessions = self.db[SESSION_COLLECTION_NAME]
+        self.sync_state = self.db[SYNC_STATE_COLLECTION_NAME]
+        self.drive_deletions = self.db[DRIVE_DELETION_COLLECTION_NAME]
 
-    def store_file_hash(self, file_name, file_hash, drive_id, file_size):
-        """Store file hash and metadata in MongoDB"""
+    def store_file_hash(self, file_name, file_hash, drive_id, file_size, algorithm=config.HASH_ALGORITHM, **metadata):
+        """Store file hash, the algorithm that produced it and metadata in MongoDB; extra keyword fields are stored as-is"""
         try:
             # Check if file already exists
             existing = self.collection.find_one({"file_name": file_name})
             
-            file_data = {
-                "file_name": file_name,
-                "hash": file_hash,
-                "drive_id": drive_id,
-                "file_size": file_size,
-                "timestamp": datetime.now(),
-                "upload_date": datetime.now().isoformat(),
-                "last_verified": None,
-                "verify_count": 0,
-                "status": "active"
-            }
+            file_data = file_document(file_name, file_hash, drive_id, file_size, algorithm, **metadata)
             
             if existing:
                 # Update existing record
@@ -90,6 +149,178 @@ class MongoDBStorage:
             print(f"❌ Error retrieving file from MongoDB: {e}")
             raise
 
+    def find_by_hash(self, file_hash, algorithm=config.HASH_ALGORITHM):
+        """An active record whose content has this digest, or None; uses the hash index"""
+        try:
+            # Untagged records are SHA-256
+            algorithms = [algorithm, None] if algorithm == LEGACY_ALGORITHM else [algorithm]
+            return self.collection.find_one({"hash": file_hash, "algorithm": {"$in": algorithms}, "status": "active"})
+
+        except Exception as e:
+            print(f"❌ Error looking up hash in MongoDB: {e}")
+            raise
+
+    def drive_reference_count(self, drive_id):
+        """Number of active records pointing at a Drive object; it is deleted from Drive once this reaches zero"""
+        try:
+            return self.collection.count_documents({"drive_id": drive_id, "status": "active"})
+
+        except Exception as e:
+            print(f"❌ Error counting Drive references in MongoDB: {e}")
+            raise
+
+    def begin_drive_deletions(self, drive_ids):
+        """
+        Mark Drive objects as being deleted, then count their active
+        references again. Returns {drive_id: count}; only objects still at
+        zero may be deleted. Call end_drive_deletions afterwards.
+        """
+        try:
+            now = datetime.now().isoformat()
+            for drive_id in drive_ids:
+                self.drive_deletions.update_one({"_id": drive_id}, {"$set": {"started_at": now}}, upsert=True)
+            return self.drive_reference_counts(drive_ids)
+
+        except Exception as e:
+            print(f"❌ Error marking Drive deletions in MongoDB: {e}")
+            raise
+
+    def end_drive_deletions(self, drive_ids):
+        """Clear the marks set by begin_drive_deletions"""
+        try:
+            self.drive_deletions.delete_many({"_id": {"$in": list(drive_ids)}})
+
+        except Exception as e:
+            print(f"❌ Error clearing Drive deletions in MongoDB: {e}")
+            raise
+
+    def drive_deletion_pending(self, drive_id):
+        """True while a Drive object is being deleted"""
+        try:
+            return self.drive_deletions.find_one({"_id": drive_id}) is not None
+
+        except Exception as e:
+            print(f"❌ Error checking Drive deletions in MongoDB: {e}")
+            raise
+
+    def get_active_files(self, file_names):
+        """{file_name: record} for the active records among file_names, in one query"""
+        try:
+            cursor = self.collection.find({"file_name": {"$in": list(file_names)}, "status": "active"})
+            return {doc["file_name"]: doc for doc in cursor}
+
+        except Exception as e:
+            print(f"❌ Error retrieving files from MongoDB: {e}")
+            raise
+
+    def drive_reference_counts(self, drive_ids):
+        """{drive_id: active records pointing at it} for many Drive objects in one aggregation; absent ids count 0"""
+        try:
+            counts = dict.fromkeys(drive_ids, 0)
+            for row in self.collection.aggregate([
+                {"$match": {"drive_id": {"$in": list(counts)}, "status": "active"}},
+                {"$group": {"_id": "$drive_id", "count": {"$sum": 1}}}
+            ]):
+                counts[row["_id"]] = row["count"]
+            return counts
+
+        except Exception as e:
+            print(f"❌ Error counting Drive references in MongoDB: {e}")
+            raise
+
+    def records_for_drive_ids(self, drive_ids):
+        """Active records pointing at any of these Drive objects, with their Drive metadata snapshot"""
+        try:
+            drive_ids = list(drive_ids)
+            records = []
+            for start in range(0, len(drive_ids), SOURCE_BATCH_SIZE):
+                records.extend(self.collection.find(
+                    {"drive_id": {"$in": drive_ids[start:start + SOURCE_BATCH_SIZE]}, "status": "active"},
+                    INCREMENTAL_PROJECTION
+                ))
+            return records
+
+        except Exception as e:
+            print(f"❌ Error retrieving files by Drive ID from MongoDB: {e}")
+            raise
+
+    def get_sync_state(self, key):
+        """A stored sync_state document (e.g. the Drive changes page token), or None"""
+        try:
+            return self.sync_state.find_one({"_id": key})
+
+        except Exception as e:
+            print(f"❌ Error retrieving sync state from MongoDB: {e}")
+            raise
+
+    def save_sync_state(self, key, **fields):
+        """Create or update a sync_state document"""
+        try:
+            self.sync_state.update_one(
+                {"_id": key},
+                {"$set": dict(fields, updated_at=datetime.now().isoformat())},
+                upsert=True
+            )
+
+        except Exception as e:
+            print(f"❌ Error saving sync state to MongoDB: {e}")
+            raise
+
+    def increment_sync_state(self, key, **amounts):
+        """Atomically add to counters in a sync_state document, creating it if needed"""
+        try:
+            self.sync_state.update_one(
+                {"_id": key},
+                {"$inc": amounts, "$set": {"updated_at": datetime.now().isoformat()}},
+                upsert=True
+            )
+
+        except Exception as e:
+            print(f"❌ Error updating sync state in MongoDB: {e}")
+            raise
+
+    def get_upload_session(self, path):
+        """The saved resumable upload session for this path, or None"""
+        try:
+            return self.sessions.find_one({"path": path}, {"_id": 0})
+
+        except Exception as e:
+            print(f"❌ Error retrieving upload session from MongoDB: {e}")
+            raise
+
+    def save_upload_session(self, path, session_uri, offset, **fields):
+        """Remember a resumable session URI and the offset Drive has confirmed"""
+        try:
+            self.sessions.update_one(
+                {"path": path},
+                {"$set": dict(fields, session_uri=session_uri, offset=offset, updated_at=datetime.now().isoformat()),
+                 "$setOnInsert": {"created_at": datetime.now().isoformat()}},
+                upsert=True
+            )
+
+        except Exception as e:
+            print(f"❌ Error saving upload session to MongoDB: {e}")
+            raise
+
+    def delete_upload_session(self, path):
+        """Forget a finished or expired upload session"""
+        try:
+            self.sessions.delete_one({"path": path})
+
+        except Exception as e:
+            print(f"❌ Error deleting upload session from MongoDB: {e}")
+            raise
+
+    def get_merkle(self, file_name):
+        """Retrieve the stored Merkle tree document for a file, or None if it has none"""
+        try:
+            doc = self.collection.find_one({"file_name": file_name}, {"_id": 0, "merkle": 1})
+            return doc.get("merkle") if doc else None
+            
+        except Exception as e:
+            print(f"❌ Error retrieving Merkle tree from MongoDB: {e}")
+            raise
+
     def list_all_files(self):
         """List all stored files from MongoDB"""
         try:
@@ -122,6 +353,111 @@ class MongoDBStorage:
             print(f"❌ Error listing files in MongoDB: {e}")
             raise
 
+    def iter_verification_sources(self, batch_size=SOURCE_BATCH_SIZE, stalest_first=False):
+        """
+        Stream the fields a sweep needs for every active file in one query.
+
+        Documents arrive through a server-side cursor `batch_size` at a time,
+        so memory stays bounded however many records exist. The cursor is
+        exempt from the idle timeout because slow verifications may leave it
+        untouched for a while; it is closed explicitly when iteration ends.
+        With stalest_first, never-verified files come first, then the rest by
+        oldest last_verified. Only files last verified before this call are
+        streamed then: a file the sweep verifies moves to the end of the
+        sort order, and the cursor would otherwise return it a second time.
+        """
+        if not stalest_first:
+            return self._stream({"status": "active"}, batch_size)
+        started = datetime.now().isoformat()
+        query = {"status": "active", "$or": [{"last_verified": None}, {"last_verified": {"$lt": started}}]}
+        return self._stream(query, batch_size, sort=[("last_verified", 1)])
+
+    def verification_leases(self, node_id=None, round_id=None, lease_seconds=config.VERIFY_LEASE_SECONDS):
+        """A LeaseManager for claiming files of a distributed sweep, handing out sweep-ready records"""
+        return LeaseManager(self.collection, node_id, round_id, lease_seconds, projection=VERIFICATION_PROJECTION)
+
+    def iter_daemon_sources(self, batch_size=SOURCE_BATCH_SIZE):
+        """Stream every active file with the fields verify-daemon schedules by"""
+        cursor = self.collection.find({"status": "active"}, DAEMON_PROJECTION, batch_size=batch_size)
+        try:
+            for doc in cursor:
+                yield doc
+        finally:
+            cursor.close()
+
+    def set_risk_weight(self, file_name, weight):
+        """Set how much more often than the SLA verify-daemon checks a file (1 is the default)"""
+        try:
+            result = self.collection.update_one({"file_name": file_name, "status": "active"},
+                                                {"$set": {"risk_weight": weight}})
+            return result.matched_count > 0
+
+        except Exception as e:
+            print(f"❌ Error setting risk weight in MongoDB: {e}")
+            raise
+
+    def recorded_file_names(self, prefix="", batch_size=SOURCE_BATCH_SIZE):
+        """Names of active records starting with `prefix` (an anchored prefix query uses the file_name index)"""
+        cursor = self.collection.find(
+            {"status": "active", "file_name": {"$regex": "^" + re.escape(prefix)}},
+            {"_id": 0, "file_name": 1},
+            batch_size=batch_size
+        )
+        try:
+            return {doc["file_name"] for doc in cursor}
+        finally:
+            cursor.close()
+
+    def iter_rehash_sources(self, algorithm, batch_size=SOURCE_BATCH_SIZE):
+        """Stream active files that have no `algorithm` digest yet, primary or secondary"""
+        query = {
+            "status": "active",
+            "algorithm": {"$ne": algorithm},
+            f"digests.{algorithm}": {"$exists": False}
+        }
+        if algorithm == LEGACY_ALGORITHM:
+            # Untagged records are already SHA-256
+            query["algorithm"] = {"$nin": [algorithm, None]}
+        return self._stream(query, batch_size)
+
+    def _stream(self, query, batch_size, sort=None):
+        cursor = self.collection.find(
+            query,
+            VERIFICATION_PROJECTION,
+            batch_size=batch_size,
+            no_cursor_timeout=True,
+            sort=sort
+        )
+        try:
+            for doc in cursor:
+                yield doc
+        finally:
+            cursor.close()
+
+    def add_digest(self, file_name, algorithm, digest, promote_from=None):
+        """
+        Record a second digest of a file under digests.<algorithm>, leaving
+        the primary `hash` in use. With promote_from=(old_algorithm, old_hash)
+        the new digest becomes the primary and the old one is kept as a
+        secondary digest instead; an old SHA-256 is also kept as
+        sha256_checksum so fast checks can still compare it with Drive's.
+        """
+        try:
+            if promote_from:
+                old_algorithm, old_hash = promote_from
+                update = {"$set": {"hash": digest, "algorithm": algorithm, f"digests.{old_algorithm}": old_hash},
+                          "$unset": {f"digests.{algorithm}": ""}}
+                if old_algorithm == "sha256":
+                    update["$set"]["sha256_checksum"] = old_hash
+            else:
+                update = {"$set": {f"digests.{algorithm}": digest}}
+            result = self.collection.update_one({"file_name": file_name}, update)
+            return result.modified_count > 0
+
+        except Exception as e:
+            print(f"❌ Error storing {algorithm} digest in MongoDB: {e}")
+            raise
+
     def delete_file_hash(self, file_name):
         """Delete file hash from MongoDB (soft delete)"""
         try:
@@ -147,18 +483,52 @@ class MongoDBStorage:
             print(f"❌ Error deleting file from MongoDB: {e}")
             raise
 
-    def update_verification(self, file_name, verification_status, trust_score):
+    def delete_file_hashes(self, file_names):
+        """Soft delete many records in one update; returns how many were active"""
+        try:
+            result = self.collection.update_many(
+                {"file_name": {"$in": list(file_names)}, "status": "active"},
+                {"$set": {"status": "deleted", "deleted_at": datetime.now().isoformat()}}
+            )
+            print(f"🗑️ Soft deleted {result.modified_count} file(s) from MongoDB")
+            return result.modified_count
+
+        except Exception as e:
+            print(f"❌ Error deleting files from MongoDB: {e}")
+            raise
+
+    def restore_file_hashes(self, file_names):
+        """Undo a soft delete of many records"""
+        try:
+            result = self.collection.update_many(
+                {"file_name": {"$in": list(file_names)}},
+                {"$set": {"status": "active"}, "$unset": {"deleted_at": ""}}
+            )
+            return result.modified_count
+
+        except Exception as e:
+            print(f"❌ Error restoring files in MongoDB: {e}")
+            raise
+
+    def restore_file_hash(self, file_name):
+        """Undo a soft delete"""
+        try:
+            result = self.collection.update_one(
+                {"file_name": file_name},
+                {"$set": {"status": "active"}, "$unset": {"deleted_at": ""}}
+            )
+            return result.modified_count > 0
+
+        except Exception as e:
+            print(f"❌ Error restoring file in MongoDB: {e}")
+            raise
+
+    def update_verification(self, file_name, verification_status, trust_score, mode="full", sample=None):
         """Update verification statistics for a file"""
         try:
             result = self.collection.update_one(
                 {"file_name": file_name},
-                {
-                    "$set": {
-                        "last_verified": datetime.now().isoformat(),
-                        "last_trust_score": trust_score
-                    },
-                    "$inc": {"verify_count": 1}
-                }
+                verification_update(trust_score, mode, sample)
             )
             
             if result.modified_count > 0:
@@ -182,7 +552,7 @@ class MongoDBStorage:
                     {"hash": regex_query}
                 ],
                 "status": "active"
-            }))
+            }, LISTING_PROJECTION))
             
             if files:
                 print(f"\n🔍 Search Results for '{query}':")
@@ -260,12 +630,177 @@ class MongoDBStorage:
             raise
 
     def close_connection(self):
-        """Close MongoDB connection"""
-        try:
-            self.client.close()
-            print("🔌 MongoDB connection closed")
-        except Exception as e:
-            print(f"❌ Error closing MongoDB connection: {e}")
+        """Release this handle. The shared pool stays open for reuse; see close_client()"""
+        pass
+
+
+def file_document(file_name, file_hash, drive_id, file_size, algorithm=config.HASH_ALGORITHM, **metadata):
+    """A new file record; extra keyword fields are stored as-is"""
+    file_data = {
+        "file_name": file_name,
+        "hash": file_hash,
+        "algorithm": algorithm,
+        "drive_id": drive_id,
+        "file_size": file_size,
+        "timestamp": datetime.now(),
+        "upload_date": datetime.now().isoformat(),
+        "last_verified": None,
+        "verify_count": 0,
+        "status": "active"
+    }
+    file_data.update(metadata)
+    return file_data
+
+
+def verification_update(trust_score, mode="full", sample=None):
+    """
+    Update document recording one verification outcome: a "full" download, a
+    "fast" metadata check or a "sample" spot check. Spot checks also store
+    which ranges were checked, in last_sample and a bounded sample_history.
+    """
+    now = datetime.now().isoformat()
+    fields = {
+        "last_verified": now,
+        "last_trust_score": trust_score,
+        "last_verification_mode": mode
+    }
+    if mode == "full":
+        fields["last_full_verified"] = now
+    update = {
+        "$set": fields,
+        "$inc": {"verify_count": 1}
+    }
+    if sample is not None:
+        sample = dict(sample, checked_at=now)
+        fields["last_sample"] = sample
+        update["$push"] = {"sample_history": {"$each": [sample], "$slice": -SAMPLE_HISTORY_LENGTH}}
+    return update
+
+
+class BulkWriter:
+    """
+    Buffers MongoDB write operations and sends them as unordered bulk_write
+    batches instead of one round trip per document.
+
+    A batch is flushed once `max_batch` operations are queued or `max_interval`
+    seconds have passed, whichever comes first. Use it as a context manager,
+    or call close(), so buffered operations are written even if the caller
+    fails. Safe to share between worker threads.
+    """
+
+    label = "write"
+
+    def __init__(self, collection=None, max_batch=WRITE_BATCH_SIZE, max_interval=WRITE_FLUSH_INTERVAL):
+        self.collection = collection if collection is not None else MongoDBStorage().collection
+        self.max_batch = max_batch
+        self.max_interval = max_interval
+        self.written_count = 0
+        self.failed_count = 0
+        self._ops = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._timer = threading.Thread(target=self._flush_periodically, name=f"{self.label}-writer", daemon=True)
+        self._timer.start()
+
+    def queue(self, operation):
+        """Buffer one write operation, flushing if the batch is full"""
+        with self._lock:
+            self._ops.append(operation)
+            full = len(self._ops) >= self.max_batch
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of operations sent"""
+        with self._flush_lock:
+            with self._lock:
+                ops, self._ops = self._ops, []
+            if not ops:
+                return 0
+
+            try:
+                result = self.collection.bulk_write(ops, ordered=False)
+                self.written_count += result.inserted_count + result.matched_count + result.upserted_count
+            except BulkWriteError as e:
+                details = e.details
+                self.written_count += details.get('nInserted', 0) + details.get('nMatched', 0) + \
+                    details.get('nUpserted', 0)
+                self.failed_count += len(details.get('writeErrors', []))
+                print(f"❌ {len(details.get('writeErrors', []))} {self.label}s failed in bulk write")
+            except PyMongoError:
+                # Keep the batch for the next flush instead of dropping it
+                with self._lock:
+                    self._ops = ops + self._ops
+                raise
+            return len(ops)
+
+    def close(self):
+        """Stop the timer and flush whatever is still buffered"""
+        self._closed.set()
+        self._timer.join()
+        self.flush()
+        if self.written_count or self.failed_count:
+            print(f"📊 Recorded {self.written_count} {self.label}s in MongoDB")
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.max_interval):
+            try:
+                self.flush()
+            except PyMongoError as e:
+                print(f"⚠️ Deferred {self.label} flush failed, will retry: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+class VerificationResultWriter(BulkWriter):
+    """Buffers verification outcomes into bulk updates of the file records"""
+
+    label = "verification result"
+
+    def record(self, file_name, verification_status, trust_score, mode="full", sample=None, drive_metadata=None):
+        """
+        Queue one verification outcome, flushing if the batch is full. A
+        drive_metadata snapshot is stored in the same update, so it is never
+        written without the outcome.
+        """
+        update = verification_update(trust_score, mode, sample)
+        if drive_metadata is not None:
+            update["$set"].update(drive_metadata=drive_metadata,
+                                  drive_metadata_refreshed_at=update["$set"]["last_verified"])
+            update["$unset"] = {"drive_missing_at": ""}
+        self.queue(UpdateOne({"file_name": file_name}, update))
+
+
+class FileRecordWriter(BulkWriter):
+    """Buffers new file records (see file_document) into bulk upserts"""
+
+    label = "file record"
+
+    def add(self, document):
+        """Queue one file record, replacing any existing record with the same name"""
+        self.queue(ReplaceOne({"file_name": document["file_name"]}, document, upsert=True))
+
+
+class DriveMetadataWriter(BulkWriter):
+    """Buffers Drive metadata snapshots (see refresh_metadata in integrity) into bulk updates"""
+
+    label = "Drive metadata refresh"
+
+    def record(self, file_name, metadata):
+        """Queue a file's current Drive metadata; None marks the Drive object as missing"""
+        now = datetime.now().isoformat()
+        if metadata is None:
+            update = {"$set": {"drive_metadata": None, "drive_missing_at": now}}
+        else:
+            update = {"$set": {"drive_metadata": metadata, "drive_metadata_refreshed_at": now},
+                      "$unset": {"drive_missing_at": ""}}
+        self.queue(UpdateOne({"file_name": file_name}, update))
 
 
 # Convenience functions for backward compatibility
@@ -277,11 +812,11 @@ def save_storage(data):
     """Save hash storage data (deprecated - use MongoDB)"""
     pass
 
-def store_file_hash(file_name, file_hash, drive_id, file_size):
+def store_file_hash(file_name, file_hash, drive_id, file_size, **metadata):
     """Store file hash and metadata"""
     storage = MongoDBStorage()
     try:
-        return storage.store_file_hash(file_name, file_hash, drive_id, file_size)
+        return storage.store_file_hash(file_name, file_hash, drive_id, file_size, **metadata)
     finally:
         storage.close_connection()
 
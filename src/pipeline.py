@@ -0,0 +1,202 @@
+"""
+Two-stage producer/consumer pipeline for the Decentralized Cloud Storage Validator
+
+Used for bulk uploads: one pool of workers hashes files while a second pool
+uploads the ones already hashed, so disk reads and network transfers overlap.
+Queues between the stages are bounded, keeping memory flat however many
+files are fed in.
+"""
+
+import os
+import queue
+import threading
+import time
+from fnmatch import fnmatch
+
+_DONE = object()
+_POLL_INTERVAL = 0.2  # Seconds between checks of the stop flag while blocked on a queue
+
+
+def matches_any(path, patterns):
+    """True if the relative path matches any of the glob patterns"""
+    return any(fnmatch(path, pattern) for pattern in patterns)
+
+
+def iter_files(root, include=(), exclude=()):
+    """
+    Yield (path, relative_path) for every file under root, in a stable order.
+    relative_path uses '/' separators. A file is kept when it matches some
+    include glob (or there are none) and no exclude glob; excluded
+    directories are not descended into.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        prefix = '' if rel_dir == '.' else rel_dir + '/'
+        dirnames[:] = sorted(d for d in dirnames if not matches_any(prefix + d, exclude))
+        for name in sorted(filenames):
+            rel_path = prefix + name
+            if include and not matches_any(rel_path, include):
+                continue
+            if matches_any(rel_path, exclude):
+                continue
+            path = os.path.join(dirpath, name)
+            if os.path.isfile(path):
+                yield path, rel_path
+
+
+class TransferProgress:
+    """Thread-safe file and byte counters for a bulk transfer"""
+
+    def __init__(self):
+        self.discovered = 0
+        self.skipped = 0
+        self.completed = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.bytes_done = 0
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def found(self, skipped=False):
+        """Count a file the walker produced; skipped files were already done by an earlier run"""
+        with self._lock:
+            self.discovered += 1
+            if skipped:
+                self.skipped += 1
+
+    def finished(self, size=0, failed=False, deduplicated=False):
+        """Count a file that went through the pipeline; deduplicated files transferred no bytes"""
+        with self._lock:
+            if failed:
+                self.failed += 1
+            elif deduplicated:
+                self.completed += 1
+                self.deduplicated += 1
+            else:
+                self.completed += 1
+                self.bytes_done += size
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def files_per_sec(self):
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def bytes_per_sec(self):
+        elapsed = self.elapsed
+        return self.bytes_done / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self):
+        return {
+            'discovered': self.discovered,
+            'skipped': self.skipped,
+            'completed': self.completed,
+            'failed': self.failed,
+            'deduplicated': self.deduplicated,
+            'bytes_done': self.bytes_done,
+            'elapsed': self.elapsed,
+            'files_per_sec': self.files_per_sec,
+            'bytes_per_sec': self.bytes_per_sec
+        }
+
+
+def run_pipeline(items, first_stage, second_stage, first_workers, second_workers, on_error, queue_size=None):
+    """
+    Feed items through first_stage(item) and then second_stage(item, first_result),
+    each on its own thread pool, yielding second-stage results as they finish.
+
+    An exception in either stage is turned into a result with
+    on_error(item, exception) so one bad file does not stop the run. Closing
+    the generator early stops all workers.
+    """
+    to_first = queue.Queue(maxsize=queue_size or first_workers * 2)
+    to_second = queue.Queue(maxsize=queue_size or second_workers * 2)
+    results = queue.Queue()
+    stop = threading.Event()
+    feed_error = []
+    first_remaining = [first_workers]
+    remaining_lock = threading.Lock()
+
+    def put(q, value):
+        while not stop.is_set():
+            try:
+                q.put(value, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def feed():
+        try:
+            for item in items:
+                if not put(to_first, item):
+                    return
+        except Exception as e:
+            feed_error.append(e)
+        for _ in range(first_workers):
+            put(to_first, _DONE)
+
+    def run_first():
+        while True:
+            item = get(to_first)
+            if item is _DONE:
+                break
+            try:
+                value = first_stage(item)
+            except Exception as e:
+                put(results, on_error(item, e))
+                continue
+            put(to_second, (item, value))
+        with remaining_lock:
+            first_remaining[0] -= 1
+            last = first_remaining[0] == 0
+        if last:
+            for _ in range(second_workers):
+                put(to_second, _DONE)
+
+    def run_second():
+        while True:
+            work = get(to_second)
+            if work is _DONE:
+                break
+            item, value = work
+            try:
+                put(results, second_stage(item, value))
+            except Exception as e:
+                put(results, on_error(item, e))
+        put(results, _DONE)
+
+    threads = [threading.Thread(target=feed, name="pipeline-feed", daemon=True)]
+    threads += [threading.Thread(target=run_first, name=f"pipeline-first-{i}", daemon=True)
+                for i in range(first_workers)]
+    threads += [threading.Thread(target=run_second, name=f"pipeline-second-{i}", daemon=True)
+                for i in range(second_workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        finished = 0
+        while finished < second_workers:
+            result = results.get()
+            if result is _DONE:
+                finished += 1
+            else:
+                yield result
+        if feed_error:
+            raise feed_error[0]
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,170 @@
+"""
+Quota-aware rate limiting for the Decentralized Cloud Storage Validator
+
+Every Drive call in the process goes through one RateLimiter: a token
+bucket holds calls to the configured rate, a semaphore bounds how many are
+in flight, and throttled or transiently failed calls are retried with
+exponential backoff and full jitter. When Drive throttles, the bucket rate
+is halved and then grows back as calls succeed, so concurrent sweeps and
+uploads settle just under the quota instead of failing in a cascade.
+"""
+
+import random
+import threading
+import time
+
+import config
+
+THROTTLE = "throttle"  # Drive asked us to slow down (429, 403 rate limit)
+TRANSIENT = "transient"  # Server or network error worth retrying (5xx, connection reset)
+RECOVERY_STEP = 0.05  # Share of the configured rate regained per successful call after a throttle
+MIN_RATE_FRACTION = 0.05  # Throttling never slows the bucket below this share of the configured rate
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, holding at most `burst`"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens, sleeping until they are available. Returns the seconds
+        waited. A request for more than `burst` tokens waits for a full bucket
+        and leaves it in debt, which later callers wait out.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(self._clock())
+                needed = min(tokens, self.burst)
+                # Tolerance so float rounding cannot leave a caller sleeping 0s forever
+                if self._tokens >= needed - 1e-9:
+                    self._tokens -= tokens
+                    return waited
+                wait = (needed - self._tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: attempt n waits uniform(0, min(max_delay, base_delay * 2**n))"""
+
+    def __init__(self, max_retries=config.DRIVE_MAX_RETRIES, base_delay=config.DRIVE_RETRY_BASE_DELAY,
+                 max_delay=config.DRIVE_RETRY_MAX_DELAY, rng=random):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number `attempt` (0-based); a server Retry-After is a lower bound"""
+        backoff = self._rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(backoff, retry_after or 0.0)
+
+
+class RateLimiter:
+    """
+    Shared gate for outgoing API calls.
+
+    classify(exception) returns THROTTLE, TRANSIENT or None (not retried);
+    retry_after(exception) may return the seconds the server asked to wait.
+    """
+
+    def __init__(self, rate=config.DRIVE_REQUESTS_PER_SECOND, concurrency=config.DRIVE_MAX_CONCURRENCY,
+                 burst=config.DRIVE_BURST, retry_policy=None, classify=lambda e: None, retry_after=lambda e: None,
+                 sleep=time.sleep, clock=time.monotonic):
+        self.max_rate = float(rate)
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.classify = classify
+        self.retry_after = retry_after
+        self._sleep = sleep
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+        self.delayed = 0
+        self.wait_seconds = 0.0
+
+    def call(self, fn, *args, cost=1, **kwargs):
+        """
+        Run fn(*args, **kwargs) within the rate and concurrency limits,
+        retrying throttles and transient errors. `cost` is the number of API
+        calls fn makes (e.g. the size of a batch request).
+        """
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire(cost)
+            with self._slots:
+                with self._lock:
+                    self.calls += cost
+                    if waited:
+                        self.delayed += 1
+                        self.wait_seconds += waited
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    if not self.should_retry(e, attempt):
+                        raise
+                    error = e
+                else:
+                    self._recover()
+                    return result
+            # Back off outside the semaphore so other calls can use the slot
+            self.backoff(attempt, error)
+            attempt += 1
+
+    def should_retry(self, error, attempt):
+        """
+        Count a failed call and decide whether retry number `attempt` is
+        allowed. Also used for calls that fail inside a batch request.
+        """
+        kind = self.classify(error)
+        retry = kind is not None and attempt < self.retry_policy.max_retries
+        with self._lock:
+            if kind == THROTTLE:
+                self.throttled += 1
+                self.bucket.rate = max(self.max_rate * MIN_RATE_FRACTION, self.bucket.rate / 2)
+            if retry:
+                self.retries += 1
+            else:
+                self.failures += 1
+        return retry
+
+    def backoff(self, attempt, error=None):
+        """Sleep before retry number `attempt`, at least as long as the error's Retry-After"""
+        self._sleep(self.retry_policy.delay(attempt, self.retry_after(error) if error is not None else None))
+
+    def _recover(self):
+        with self._lock:
+            if self.bucket.rate < self.max_rate:
+                self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate * RECOVERY_STEP)
+
+    def stats(self):
+        """Counters since the limiter was created"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'throttled': self.throttled,
+                'retries': self.retries,
+                'failures': self.failures,
+                'delayed': self.delayed,
+                'wait_seconds': self.wait_seconds,
+                'current_rate': self.bucket.rate,
+                'max_rate': self.max_rate,
+                'concurrency': self.concurrency
+            }
@@ -0,0 +1,81 @@
+"""
+Probabilistic spot-check planning for the Decentralized Cloud Storage Validator
+
+If an attacker modifies at least a fraction f of a file's N chunks, checking
+k distinct chunks chosen uniformly at random misses every modified chunk with
+probability C(N - bad, k) / C(N, k). The planner picks the smallest k that
+reaches the target detection probability, capped by a per-file byte budget.
+"""
+
+import math
+import random
+
+import config
+
+# Unpredictable chunk choice: an adversary must not be able to guess which chunks get checked
+_rng = random.SystemRandom()
+
+
+def tampered_chunk_count(chunk_count, tampered_fraction):
+    """Smallest number of chunks an attack covering tampered_fraction of the file must touch"""
+    return min(chunk_count, max(1, math.ceil(tampered_fraction * chunk_count)))
+
+
+def detection_probability(chunk_count, bad_chunks, samples):
+    """Probability that `samples` distinct random chunks include at least one of `bad_chunks`"""
+    if samples <= 0 or bad_chunks <= 0:
+        return 0.0
+    if samples > chunk_count - bad_chunks:
+        return 1.0
+    miss = 1.0
+    for i in range(samples):
+        miss *= (chunk_count - bad_chunks - i) / (chunk_count - i)
+    return 1.0 - miss
+
+
+def samples_for_confidence(chunk_count, bad_chunks, confidence):
+    """Smallest sample size whose detection probability reaches `confidence`"""
+    miss = 1.0
+    for samples in range(1, chunk_count + 1):
+        if samples > chunk_count - bad_chunks:
+            return samples
+        miss *= (chunk_count - bad_chunks - samples + 1) / (chunk_count - samples + 1)
+        if 1.0 - miss >= confidence:
+            return samples
+    return chunk_count
+
+
+class SamplePlan:
+    """The chunks chosen for one file and the detection probability they give"""
+
+    def __init__(self, indices, confidence, samples_needed, budget_limited):
+        self.indices = indices
+        self.confidence = confidence
+        self.samples_needed = samples_needed
+        self.budget_limited = budget_limited
+
+
+class SamplePolicy:
+    """
+    Target detection probability for tampering that touches at least
+    `tampered_fraction` of a file, spending at most `budget_bytes` per file.
+    """
+
+    def __init__(self, confidence=config.SAMPLE_CONFIDENCE, tampered_fraction=config.SAMPLE_TAMPERED_FRACTION,
+                 budget_bytes=config.SAMPLE_BUDGET_BYTES):
+        if not 0 < confidence < 1:
+            raise ValueError("confidence must be between 0 and 1")
+        if not 0 < tampered_fraction <= 1:
+            raise ValueError("tampered_fraction must be in (0, 1]")
+        self.confidence = confidence
+        self.tampered_fraction = tampered_fraction
+        self.budget_bytes = budget_bytes
+
+    def plan(self, chunk_count, chunk_size, rng=_rng):
+        """Choose which chunks of a chunk_count-chunk file to check"""
+        bad = tampered_chunk_count(chunk_count, self.tampered_fraction)
+        needed = samples_for_confidence(chunk_count, bad, self.confidence)
+        affordable = max(1, self.budget_bytes // chunk_size) if self.budget_bytes else chunk_count
+        samples = min(needed, affordable, chunk_count)
+        indices = sorted(rng.sample(range(chunk_count), samples))
+        return SamplePlan(indices, detection_probability(chunk_count, bad, samples), needed, samples < needed)
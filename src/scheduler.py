@@ -0,0 +1,280 @@
+"""
+Continuous verification scheduling for the Decentralized Cloud Storage Validator
+
+Instead of sweeping every file at once, verify-daemon checks files one at a
+time at a steady rate. Each file gets a re-verification interval of at most
+the SLA, shortened for files with a higher risk weight, a low last trust
+score or more bytes at stake, and is scheduled for last_verified plus that
+interval. Because no interval exceeds the SLA, a daemon running at least at
+required_rate() re-verifies every file within the SLA. A per-file offset
+spreads out files that were all verified at the same moment (e.g. by a full
+sweep), so the load stays flat instead of coming back as a burst.
+"""
+
+import hashlib
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import config
+from rate_limit import TokenBucket
+
+SPREAD = 0.25  # Files are scheduled up to this share of their interval early, by a stable per-file offset
+
+
+def parse_time(value):
+    """Epoch seconds of a stored ISO timestamp (or datetime); None stays None"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def spread_offset(file_name):
+    """Stable value in [0, 1) derived from the file name"""
+    return int.from_bytes(hashlib.sha256(file_name.encode()).digest()[:8], 'big') / 2 ** 64
+
+
+class VerificationScheduler:
+    """
+    Priority queue of files keyed by when each is next due. Thread-safe:
+    the daemon pops from one thread and completes from worker threads.
+    """
+
+    def __init__(self, sla_seconds=config.DAEMON_SLA_HOURS * 3600, large_file_size=config.DAEMON_LARGE_FILE_SIZE,
+                 low_trust_boost=config.DAEMON_LOW_TRUST_BOOST, retry_seconds=config.DAEMON_RETRY_SECONDS,
+                 clock=time.time):
+        self.sla_seconds = sla_seconds
+        self.large_file_size = large_file_size
+        self.low_trust_boost = low_trust_boost
+        self.retry_seconds = retry_seconds
+        self._clock = clock
+        self._records = {}  # file_name -> record
+        self._due = {}  # file_name -> due time of its live heap entry
+        self._heap = []  # (due, file_name); entries whose due no longer matches _due are stale
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def boost(self, record):
+        """How many times more often than the SLA this file is checked (never less than once per SLA)"""
+        risk = float(record.get('risk_weight') or 1.0)
+        score = record.get('last_trust_score')
+        trust = 1.0 if score is None else 1.0 + (100 - score) / 100 * self.low_trust_boost
+        size = 1.0 + min(1.0, record.get('file_size', 0) / self.large_file_size)
+        return max(1.0, risk * trust * size)
+
+    def interval(self, record):
+        """Seconds between verifications of this file; at most the SLA"""
+        return self.sla_seconds / self.boost(record)
+
+    def due_at(self, record):
+        """When the file is next due: never-verified files are due immediately"""
+        last = parse_time(record.get('last_verified'))
+        if last is None:
+            return self._clock()
+        interval = self.interval(record)
+        return last + interval * (1 - SPREAD * spread_offset(record['file_name']))
+
+    def _push(self, file_name, due):
+        self._due[file_name] = due
+        heapq.heappush(self._heap, (due, file_name))
+
+    def sync(self, records):
+        """
+        Bring the queue in line with the current records: add new files,
+        drop ones no longer present, and reschedule files whose stored state
+        changed (e.g. a new risk weight). Returns (added, removed).
+        """
+        with self._lock:
+            seen = set()
+            added = 0
+            for record in records:
+                file_name = record['file_name']
+                seen.add(file_name)
+                if file_name in self._in_flight:
+                    continue
+                old = self._records.get(file_name)
+                if old is None:
+                    added += 1
+                elif _newer(old, record):
+                    # Our own result may not have reached MongoDB yet; keep it
+                    record = dict(record, last_verified=old['last_verified'],
+                                  last_trust_score=old.get('last_trust_score'))
+                self._records[file_name] = record
+                if old is None or file_name not in self._due or _schedule_key(old) != _schedule_key(record):
+                    self._push(file_name, self.due_at(record))
+            removed = [name for name in self._records if name not in seen]
+            for file_name in removed:
+                del self._records[file_name]
+                self._due.pop(file_name, None)
+            return added, len(removed)
+
+    def _peek(self):
+        """(due, file_name) of the earliest live entry, dropping stale ones; caller holds the lock"""
+        while self._heap:
+            due, file_name = self._heap[0]
+            if self._due.get(file_name) == due:
+                return due, file_name
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now=None):
+        """Take the most overdue file whose time has come, or None"""
+        now = self._clock() if now is None else now
+        with self._lock:
+            entry = self._peek()
+            if entry is None or entry[0] > now:
+                return None
+            heapq.heappop(self._heap)
+            file_name = entry[1]
+            del self._due[file_name]
+            self._in_flight.add(file_name)
+            return self._records[file_name]
+
+    def seconds_until_next_due(self, now=None):
+        """Seconds until the next file is due (0 if one is already due), or None when the queue is empty"""
+        now = self._clock() if now is None else now
+        with self._lock:
+            entry = self._peek()
+            return None if entry is None else max(0.0, entry[0] - now)
+
+    def complete(self, file_name, result, now=None):
+        """Reschedule a file after its check; a failed check is retried after retry_seconds at most"""
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._in_flight.discard(file_name)
+            record = self._records.get(file_name)
+            if record is None:
+                return  # Deleted while it was being checked
+            if result.get('verified'):
+                record['last_verified'] = datetime.fromtimestamp(now).isoformat()
+                record['last_trust_score'] = result.get('trust_score')
+                self._push(file_name, self.due_at(record))
+            else:
+                self._push(file_name, now + min(self.retry_seconds, self.interval(record)))
+
+    def required_rate(self):
+        """Files per second the daemon must sustain for every file to meet the SLA"""
+        with self._lock:
+            return sum(1.0 / self.interval(record) for record in self._records.values())
+
+    def overdue_count(self, now=None):
+        """Files whose last verification is already older than the SLA (or that were never verified)"""
+        now = self._clock() if now is None else now
+        with self._lock:
+            count = 0
+            for record in self._records.values():
+                last = parse_time(record.get('last_verified'))
+                if last is None or now - last > self.sla_seconds:
+                    count += 1
+            return count
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+
+def _schedule_key(record):
+    return (record.get('last_verified'), record.get('last_trust_score'), record.get('risk_weight'),
+            record.get('file_size'))
+
+
+def _newer(old, new):
+    """True if `old` was verified more recently than `new` says"""
+    old_last, new_last = parse_time(old.get('last_verified')), parse_time(new.get('last_verified'))
+    return old_last is not None and (new_last is None or old_last > new_last)
+
+
+class VerifyDaemon:
+    """
+    Runs verify_one(record) on due files at no more than `rate` files per
+    second, with at most `workers` checks in flight, until stopped.
+    load_records() is called every reload_seconds to pick up new, deleted
+    and re-weighted files. on_result(result) is called from worker threads.
+    """
+
+    def __init__(self, scheduler, verify_one, load_records, rate=config.DAEMON_FILES_PER_MINUTE / 60,
+                 workers=config.DAEMON_WORKERS, reload_seconds=config.DAEMON_RELOAD_SECONDS, on_result=None):
+        self.scheduler = scheduler
+        self.verify_one = verify_one
+        self.load_records = load_records
+        self.rate = rate
+        self.workers = workers
+        self.reload_seconds = reload_seconds
+        self.on_result = on_result
+        self.stop_event = threading.Event()
+        self.started_at = None
+        self.counts = {'checked': 0, 'intact': 0, 'tampered': 0, 'errors': 0}
+        self._counts_lock = threading.Lock()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        """Verify continuously until stop() is called; waits for in-flight checks before returning"""
+        self.started_at = time.monotonic()
+        pacer = TokenBucket(self.rate, burst=1)
+        slots = threading.BoundedSemaphore(self.workers)
+        last_reload = None
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="verify-daemon") as executor:
+            while not self.stop_event.is_set():
+                if last_reload is None or time.monotonic() - last_reload >= self.reload_seconds:
+                    try:
+                        self.scheduler.sync(self.load_records())
+                    except Exception as e:
+                        if last_reload is None:
+                            raise
+                        print(f"⚠️ Could not reload files, keeping the current schedule: {e}")
+                    last_reload = time.monotonic()
+
+                wait = self.scheduler.seconds_until_next_due()
+                if wait is None or wait > 0:
+                    until_reload = self.reload_seconds - (time.monotonic() - last_reload)
+                    self.stop_event.wait(max(0.01, min(until_reload, wait if wait is not None else until_reload)))
+                    continue
+
+                if not slots.acquire(timeout=1.0):
+                    continue
+                pacer.acquire()
+                record = self.scheduler.pop_due()
+                if record is None:
+                    slots.release()
+                    continue
+                executor.submit(self._check, record, slots)
+
+    def _check(self, record, slots):
+        try:
+            try:
+                result = self.verify_one(record)
+            except Exception as e:
+                result = {'filename': record['file_name'], 'is_intact': False, 'trust_score': 0,
+                          'verified': False, 'error': str(e)}
+            self.scheduler.complete(record['file_name'], result)
+            with self._counts_lock:
+                self.counts['checked'] += 1
+                if not result.get('verified'):
+                    self.counts['errors'] += 1
+                elif result.get('is_intact'):
+                    self.counts['intact'] += 1
+                else:
+                    self.counts['tampered'] += 1
+            if self.on_result is not None:
+                self.on_result(result)
+        finally:
+            slots.release()
+
+    def status(self):
+        """Counters, queue size, overdue files and the rate needed to meet the SLA"""
+        with self._counts_lock:
+            status = dict(self.counts)
+        status.update({
+            'files': len(self.scheduler),
+            'overdue': self.scheduler.overdue_count(),
+            'rate': self.rate,
+            'required_rate': self.scheduler.required_rate(),
+            'elapsed': time.monotonic() - self.started_at if self.started_at else 0.0
+        })
+        return status
@@ -0,0 +1,563 @@
+"""
+Upload pipeline for the Decentralized Cloud Storage Validator
+"""
+
+import hashlib
+import os
+import threading
+from functools import partial
+
+from googleapiclient.errors import HttpError
+
+import config
+import drive_client
+import hash_cache
+import mongodb_storage
+from hash_cache import cached_file_hash
+from hashing import hash_file, parallel_tree_hash, record_algorithm
+from merkle import MerkleBuilder
+from pipeline import TransferProgress, iter_files, run_pipeline
+from verifier import compare_drive_checksums
+
+# Record fields a deduplicated name shares with the record it points at
+DEDUP_COPIED_FIELDS = ('md5_checksum', 'sha256_checksum', 'merkle')
+
+
+def upload_file(file_path, file_name=None, hash_workers=config.PARALLEL_HASH_WORKERS, storage=None,
+                use_cache=config.HASH_CACHE_ENABLED, dedup=config.DEDUP_UPLOADS, chunk_size=config.UPLOAD_CHUNK_SIZE,
+                on_chunk=None, skip_unchanged=False):
+    """
+    Upload a local file and record it in MongoDB.
+
+    Files of at least PARALLEL_HASH_THRESHOLD bytes are tree-hashed on
+    `hash_workers` cores before the upload instead of on one core during it;
+    smaller files (or hash_workers=1) take the single-pass streaming path.
+    With skip_unchanged and the hash cache on, re-uploading a file that is
+    unchanged since its recorded upload is skipped without reading it, as
+    long as Drive still reports matching checksums for the recorded object;
+    otherwise the file is uploaded again, which repairs a tampered or
+    deleted Drive object. With dedup, content that
+    is already on Drive under another name is hashed locally and linked to
+    the existing Drive object instead of being transferred again.
+
+    Files larger than one chunk are sent through a resumable session saved in
+    MongoDB and hashed while they are sent, so uploading the same unmodified
+    file again after a crash continues where Drive stopped confirming.
+    on_chunk(offset, size, chunk_bytes, seconds) is called after every chunk.
+    """
+    file_name = file_name or os.path.basename(file_path)
+    storage = storage or mongodb_storage.MongoDBStorage()
+    cache = hash_cache.get_cache() if use_cache else None
+    stat_result = os.stat(file_path)
+
+    if skip_unchanged and cache is not None:
+        existing = storage.get_file_hash(file_name)
+        if existing and existing.get('status', 'active') == 'active':
+            cached = cache.lookup(file_path, record_algorithm(existing))[0]
+            if cached == existing['hash'] and drive_copy_intact(existing):
+                return _unchanged_details(existing)
+
+    tree_hashed = hash_workers > 1 and stat_result.st_size >= config.PARALLEL_HASH_THRESHOLD
+    file_hash = None
+    if dedup and not tree_hashed:
+        file_hash = cached_file_hash(file_path, config.HASH_ALGORITHM, use_cache=use_cache)
+        existing = storage.find_by_hash(file_hash, config.HASH_ALGORITHM)
+        # Re-uploading under the same name is a deliberate re-send (e.g. to repair the Drive copy)
+        if existing and existing['file_size'] == stat_result.st_size and existing['file_name'] != file_name:
+            details = link_duplicate(file_name, existing, storage)
+            if details is not None:
+                return details
+
+    if tree_hashed:
+        details = _upload_tree_hashed(file_path, file_name, stat_result.st_size, hash_workers, storage, dedup,
+                                      chunk_size, on_chunk)
+    elif stat_result.st_size > chunk_size:
+        details = _upload_resumable(file_path, file_name, stat_result, file_hash, storage, chunk_size, on_chunk)
+    else:
+        with open(file_path, 'rb') as f:
+            details = upload_stream(f, file_name, size=stat_result.st_size, storage=storage)
+
+    if cache is not None:
+        cache.put(file_path, details['algorithm'], details['hash'], stat_result)
+    return details
+
+
+def drive_copy_intact(record):
+    """True if Drive still has the record's object and reports checksums matching the record"""
+    try:
+        metadata = drive_client.get_file_metadata(drive_client.get_drive_service(), record['drive_id'])
+    except HttpError as e:
+        if e.resp.status == 404:
+            return False
+        raise
+    return not metadata.get('trashed') and compare_drive_checksums(record, metadata) is True
+
+
+def upload_stream(stream, file_name, size=None, mimetype=None, storage=None, algorithm=config.HASH_ALGORITHM):
+    """
+    Stream content to Google Drive and record it in MongoDB in a single pass.
+
+    The `algorithm` digest, the SHA-256 and MD5 Drive reports and the Merkle
+    leaves are all computed from the bytes as they are sent, so the source is
+    read once and nothing is staged on disk or held in memory beyond one
+    upload chunk. Returns the upload details.
+    """
+    observers = _RecordDigests(algorithm)
+    service = drive_client.get_drive_service()
+    drive_file, media = drive_client.upload_hashed(
+        service, stream, file_name, size, mimetype, algorithm=algorithm, observers=observers.observers
+    )
+    return _record_upload(storage, file_name, drive_file, media, observers)
+
+
+def _upload_resumable(file_path, file_name, stat_result, content_hash, storage, chunk_size, on_chunk):
+    """
+    Chunked, restartable upload of a local file, hashed while it is sent.
+    content_hash, if the caller already knows it, must match what was sent.
+    """
+    algorithm = config.HASH_ALGORITHM
+    observers = _RecordDigests(algorithm)
+    drive_file, media, resumed_from = send_local_file(file_path, file_name, storage, algorithm,
+                                                      observers.observers, chunk_size, on_chunk)
+    after = os.stat(file_path)
+    changed = ((after.st_size, after.st_mtime_ns) != (stat_result.st_size, stat_result.st_mtime_ns) or
+               media.sink.bytes_written != stat_result.st_size or
+               content_hash not in (None, media.hexdigest()))
+    if resumed_from and drive_file.get('md5Checksum') not in (None, observers.md5.hexdigest()):
+        # Bytes sent before the interruption were not the content we have now
+        changed = True
+    if changed:
+        drive_client.get_drive_service().files().delete(fileId=drive_file['id']).execute()
+        raise ValueError(f"{file_path} changed while it was being uploaded")
+    details = _record_upload(storage, file_name, drive_file, media, observers)
+    details['resumed_from'] = resumed_from
+    return details
+
+
+class _RecordDigests:
+    """Observers computing what a file record stores besides `hash`: MD5, SHA-256 and Merkle leaves"""
+
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.merkle_builder = MerkleBuilder()
+        self.md5 = hashlib.md5()
+        self.sha256 = hashlib.sha256() if algorithm != "sha256" else None
+        self.observers = [self.merkle_builder, self.md5] + ([self.sha256] if self.sha256 else [])
+
+
+def _record_upload(storage, file_name, drive_file, media, digests):
+    """Store the record of a finished upload whose bytes went through `digests`"""
+    file_hash = media.hexdigest()
+    sha256_hex = digests.sha256.hexdigest() if digests.sha256 else file_hash
+    md5_hex = digests.md5.hexdigest()
+    merkle_tree = digests.merkle_builder.finish()
+    drive_matches = (drive_file.get('sha256Checksum') in (None, sha256_hex) and
+                     drive_file.get('md5Checksum') in (None, md5_hex))
+
+    # Record the digests of the bytes we sent; if Drive already disagrees,
+    # the next fast verification flags the file instead of trusting Drive.
+    storage = storage or mongodb_storage.MongoDBStorage()
+    storage.store_file_hash(file_name, file_hash, drive_file['id'], media.sink.bytes_written,
+                            algorithm=digests.algorithm,
+                            md5_checksum=md5_hex,
+                            sha256_checksum=sha256_hex,
+                            merkle=merkle_tree.to_document())
+
+    return _upload_details(file_name, file_hash, digests.algorithm, merkle_tree, drive_file, media, drive_matches)
+
+
+def send_local_file(file_path, file_name, storage, algorithm="md5", observers=(),
+                    chunk_size=config.UPLOAD_CHUNK_SIZE, on_chunk=None):
+    """
+    Upload a local file chunk by chunk through a resumable session.
+
+    The session URI and the offset Drive has confirmed are saved in MongoDB
+    after every chunk, keyed by the file's absolute path and stamped with
+    its size and mtime. A saved session for the same size and mtime is
+    resumed: Drive is asked how far it got and the upload continues from
+    there; the skipped prefix is only read locally so the digests still
+    cover the whole file. A file that fits in one chunk has nothing to
+    resume, so it skips the session lookups. Returns (drive_file, media,
+    resumed_from), where resumed_from is 0 for a fresh upload.
+    """
+    storage = storage or mongodb_storage.MongoDBStorage()
+    path_key = os.path.abspath(file_path)
+    service = drive_client.get_drive_service()
+
+    with open(file_path, 'rb') as f:
+        stat_result = os.fstat(f.fileno())
+        size = stat_result.st_size
+        media = drive_client.HashingMediaUpload(f, chunksize=chunk_size, size=size, algorithm=algorithm,
+                                                observers=observers)
+        resume_uri, resumed_from = None, 0
+        resumable = size > chunk_size
+        session = storage.get_upload_session(path_key) if resumable else None
+        if session and (session.get('size'), session.get('mtime_ns')) != (size, stat_result.st_mtime_ns):
+            # The file changed since the session started; its bytes on Drive are not this content
+            storage.delete_upload_session(path_key)
+            session = None
+        if session:
+            state = drive_client.query_upload_offset(session['session_uri'], size)
+            if isinstance(state, dict):
+                # Drive finished the upload but the process died before recording it
+                media.fast_forward(size)
+                media.sink.close()
+                storage.delete_upload_session(path_key)
+                return state, media, size
+            if state is None:
+                storage.delete_upload_session(path_key)
+            else:
+                resume_uri, resumed_from = session['session_uri'], state
+                media.fast_forward(resumed_from)
+
+        def chunk_done(session_uri, offset, chunk_bytes, seconds):
+            if offset < size:
+                storage.save_upload_session(path_key, session_uri, offset, file_name=file_name, size=size,
+                                            mtime_ns=stat_result.st_mtime_ns, chunk_size=chunk_size)
+            if on_chunk is not None:
+                on_chunk(offset, size, chunk_bytes, seconds)
+
+        drive_file = drive_client.run_resumable_upload(service, media, file_name, resume_uri, resumed_from,
+                                                       chunk_done)
+
+    if resumable:
+        storage.delete_upload_session(path_key)
+    return drive_file, media, resumed_from
+
+
+def _upload_tree_hashed(file_path, file_name, size, hash_workers, storage, dedup=False,
+                        chunk_size=config.UPLOAD_CHUNK_SIZE, on_chunk=None):
+    """
+    Parallel tree hash first, then a streaming upload that only computes the
+    MD5 Drive reports. The tree doubles as the file's chunk Merkle tree.
+    """
+    before = os.stat(file_path)
+    merkle_tree = parallel_tree_hash(file_path, hash_workers)
+    if dedup:
+        existing = storage.find_by_hash(merkle_tree.root.hex(), "tree-sha256")
+        if existing and existing['file_size'] == size and existing['file_name'] != file_name:
+            details = link_duplicate(file_name, existing, storage)
+            if details is not None:
+                return details
+    file_hash = merkle_tree.root.hex()
+    drive_file, media, resumed_from = send_local_file(file_path, file_name, storage,
+                                                      chunk_size=chunk_size, on_chunk=on_chunk)
+    # The tree covers the bytes read before the upload; a rewrite since then may keep the size
+    after = os.stat(file_path)
+    md5_hex = media.hexdigest()
+    if ((after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns) or
+            media.sink.bytes_written != merkle_tree.file_size or
+            (resumed_from and drive_file.get('md5Checksum') not in (None, md5_hex))):
+        drive_client.get_drive_service().files().delete(fileId=drive_file['id']).execute()
+        raise ValueError(f"{file_path} changed while it was being uploaded")
+
+    drive_matches = drive_file.get('md5Checksum') in (None, md5_hex)
+
+    storage.store_file_hash(file_name, file_hash, drive_file['id'], media.sink.bytes_written,
+                            algorithm="tree-sha256",
+                            md5_checksum=md5_hex,
+                            merkle=merkle_tree.to_document())
+
+    details = _upload_details(file_name, file_hash, "tree-sha256", merkle_tree, drive_file, media, drive_matches)
+    details['resumed_from'] = resumed_from
+    return details
+
+
+def link_duplicate(file_name, existing, storage):
+    """
+    Record file_name as another name for the Drive object behind `existing`,
+    without transferring anything. The object stays on Drive until every
+    name pointing at it has been deleted (see delete_file).
+
+    Returns None, leaving file_name unrecorded, if the object is being
+    deleted right now or already was; the caller then uploads the content
+    instead. The new record is written before those checks and delete_file
+    marks the object before its final reference count, so either the delete
+    sees the new name and keeps the object, or this sees the delete (its
+    mark, or once it finished, the object missing from Drive) and backs out.
+    """
+    if existing['file_name'] == file_name:
+        return _unchanged_details(existing)
+    drive_id = existing['drive_id']
+    metadata = {field: existing[field] for field in DEDUP_COPIED_FIELDS if existing.get(field) is not None}
+    storage.store_file_hash(file_name, existing['hash'], drive_id, existing['file_size'],
+                            algorithm=record_algorithm(existing),
+                            deduplicated_from=existing['file_name'],
+                            **metadata)
+    # With no other name left on the object, a delete may have finished between the lookup and the write
+    if storage.drive_deletion_pending(drive_id) or \
+            (storage.drive_reference_count(drive_id) <= 1 and not drive_object_exists(drive_id)):
+        storage.delete_file_hash(file_name)
+        return None
+    return _unchanged_details(existing, file_name, deduplicated=True)
+
+
+def drive_object_exists(drive_id):
+    """True if Drive still has this object outside the trash"""
+    try:
+        metadata = drive_client.get_file_metadata(drive_client.get_drive_service(), drive_id)
+    except HttpError as e:
+        if e.resp.status == 404:
+            return False
+        raise
+    return not metadata.get('trashed')
+
+
+def delete_file(file_name, storage=None):
+    """
+    Soft-delete a record, then delete its Drive object if no other active
+    record still points at it. Returns None if there is no such file.
+    """
+    storage = storage or mongodb_storage.MongoDBStorage()
+    record = storage.get_file_hash(file_name)
+    if not record or record.get('status', 'active') != 'active':
+        return None
+
+    storage.delete_file_hash(file_name)
+    remaining = storage.drive_reference_count(record['drive_id'])
+    if remaining == 0:
+        # Block new dedup links to the object, then count again: a link made meanwhile keeps it
+        remaining = storage.begin_drive_deletions([record['drive_id']])[record['drive_id']]
+        try:
+            if remaining == 0:
+                drive_client.get_drive_service().files().delete(fileId=record['drive_id']).execute()
+        except HttpError as e:
+            # Already gone from Drive is fine; anything else leaves the record in place
+            if e.resp.status != 404:
+                storage.restore_file_hash(file_name)
+                raise
+        finally:
+            storage.end_drive_deletions([record['drive_id']])
+    return {
+        'filename': file_name,
+        'drive_id': record['drive_id'],
+        'drive_deleted': remaining == 0,
+        'remaining_references': remaining
+    }
+
+
+def delete_files(file_names, storage=None):
+    """
+    Batch version of delete_file for many names at once: one MongoDB update
+    soft-deletes the records, one aggregation counts the remaining
+    references, and unreferenced Drive objects are removed with batched
+    delete calls. Records whose Drive object could not be deleted are
+    restored. Returns one result dict per name, in order.
+    """
+    storage = storage or mongodb_storage.MongoDBStorage()
+    file_names = list(dict.fromkeys(file_names))
+    records = storage.get_active_files(file_names)
+    if records:
+        storage.delete_file_hashes(records)
+
+    counts = storage.drive_reference_counts({record['drive_id'] for record in records.values()})
+    unreferenced = [drive_id for drive_id, count in counts.items() if count == 0]
+    outcomes = {}
+    if unreferenced:
+        # Block new dedup links to these objects, then count again: a link made meanwhile keeps its object
+        counts.update(storage.begin_drive_deletions(unreferenced))
+        try:
+            still_unreferenced = [drive_id for drive_id in unreferenced if counts[drive_id] == 0]
+            if still_unreferenced:
+                outcomes = drive_client.batch_delete(drive_client.get_drive_service(), still_unreferenced)
+        finally:
+            storage.end_drive_deletions(unreferenced)
+    # Already gone from Drive is fine; anything else leaves the records in place
+    failed = {drive_id: error for drive_id, error in outcomes.items()
+              if error is not None and not drive_client.is_not_found(error)}
+    restore = [name for name, record in records.items() if record['drive_id'] in failed]
+    if restore:
+        storage.restore_file_hashes(restore)
+
+    results = []
+    for file_name in file_names:
+        record = records.get(file_name)
+        if record is None:
+            results.append({'filename': file_name, 'deleted': False, 'error': 'not found'})
+            continue
+        drive_id = record['drive_id']
+        error = failed.get(drive_id)
+        results.append({
+            'filename': file_name,
+            'drive_id': drive_id,
+            'deleted': error is None,
+            'drive_deleted': error is None and counts[drive_id] == 0,
+            'remaining_references': counts[drive_id],
+            'error': str(error) if error is not None else None
+        })
+    return results
+
+
+def _unchanged_details(record, file_name=None, deduplicated=False):
+    """Upload details for a file that needed no transfer: unchanged, or deduplicated under a new name"""
+    merkle = record.get('merkle') or {}
+    return {
+        'filename': file_name or record['file_name'],
+        'hash': record['hash'],
+        'algorithm': record_algorithm(record),
+        'merkle_root': merkle.get('root'),
+        'chunk_count': merkle.get('leaf_count', 0),
+        'drive_id': record['drive_id'],
+        'size': record['file_size'],
+        'elapsed': 0.0,
+        'bytes_per_sec': 0.0,
+        'drive_checksums_match': True,
+        'skipped': True,
+        'deduplicated': deduplicated
+    }
+
+
+def _upload_details(file_name, file_hash, algorithm, merkle_tree, drive_file, media, drive_matches):
+    return {
+        'filename': file_name,
+        'hash': file_hash,
+        'algorithm': algorithm,
+        'merkle_root': merkle_tree.root.hex(),
+        'chunk_count': len(merkle_tree.leaves),
+        'drive_id': drive_file['id'],
+        'size': media.sink.bytes_written,
+        'elapsed': media.sink.elapsed,
+        'bytes_per_sec': media.sink.bytes_per_sec,
+        'drive_checksums_match': drive_matches,
+        'skipped': False,
+        'deduplicated': False,
+        'resumed_from': 0
+    }
+
+
+def upload_tree(root, include=(), exclude=(), prefix=None, hash_workers=config.PIPELINE_HASH_WORKERS,
+                upload_workers=config.PIPELINE_UPLOAD_WORKERS, progress=None, storage=None,
+                algorithm=config.HASH_ALGORITHM, use_cache=config.HASH_CACHE_ENABLED, dedup=config.DEDUP_UPLOADS,
+                chunk_size=config.UPLOAD_CHUNK_SIZE):
+    """
+    Upload every file under `root` in one process, yielding a result per file.
+
+    Hashing workers read and hash files while upload workers send the ones
+    already hashed, and new records go to MongoDB in bulk batches. Files are
+    recorded as "<prefix>/<relative path>" (prefix defaults to the directory
+    name); names that are already recorded are skipped, so an interrupted
+    run can simply be started again. With dedup, files whose content is
+    already on Drive (recorded earlier or uploaded earlier in this run) are
+    linked to the existing object instead of being uploaded. Uploads go
+    through resumable sessions of chunk_size chunks, so a file cut off by a
+    crash continues where Drive stopped on the next run.
+    """
+    prefix = os.path.basename(os.path.abspath(root)) if prefix is None else prefix.strip('/')
+    storage = storage or mongodb_storage.MongoDBStorage()
+    progress = progress if progress is not None else TransferProgress()
+    recorded = storage.recorded_file_names(prefix + '/' if prefix else '')
+
+    def pending():
+        for path, rel_path in iter_files(root, include, exclude):
+            file_name = f"{prefix}/{rel_path}" if prefix else rel_path
+            progress.found(skipped=file_name in recorded)
+            if file_name not in recorded:
+                yield path, file_name
+
+    def failed(item, error):
+        progress.finished(failed=True)
+        return {'filename': item[1], 'uploaded': False, 'error': str(error)}
+
+    hash_one = partial(_hash_local_file, algorithm=algorithm, use_cache=use_cache)
+    with mongodb_storage.FileRecordWriter(storage.collection) as writer:
+        uploaded = _UploadedContent(storage) if dedup else None
+        upload_one = partial(_upload_hashed_file, writer=writer, progress=progress, storage=storage,
+                             uploaded=uploaded, chunk_size=chunk_size)
+        for result in run_pipeline(pending(), hash_one, upload_one, hash_workers, upload_workers, failed):
+            yield result
+
+
+def _hash_local_file(item, algorithm, use_cache):
+    """Pipeline stage 1: digest, Drive checksums and Merkle tree from one read of the file"""
+    path, file_name = item
+    stat_result = os.stat(path)
+    merkle_builder = MerkleBuilder()
+    md5 = hashlib.md5()
+    observers = [merkle_builder, md5]
+    sha256 = None
+    if algorithm != "sha256":
+        sha256 = hashlib.sha256()
+        observers.append(sha256)
+
+    sink = hash_file(path, algorithm, observers=observers)
+    file_hash = sink.hexdigest()
+    if use_cache:
+        hash_cache.get_cache().put(path, algorithm, file_hash, stat_result)
+    return {
+        'hash': file_hash,
+        'algorithm': algorithm,
+        'size': sink.bytes_written,
+        'md5': md5.hexdigest(),
+        'sha256': sha256.hexdigest() if sha256 else file_hash,
+        'merkle': merkle_builder.finish()
+    }
+
+
+class _UploadedContent:
+    """Dedup lookups for a bulk upload: this run's uploads (not yet flushed to MongoDB), then the hash index"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def find(self, file_hash, algorithm):
+        with self._lock:
+            document = self._documents.get((file_hash, algorithm))
+        return document or self.storage.find_by_hash(file_hash, algorithm)
+
+    def add(self, document):
+        with self._lock:
+            self._documents.setdefault((document['hash'], document['algorithm']), document)
+
+
+def _upload_hashed_file(item, hashed, writer, progress, storage, uploaded=None, chunk_size=config.UPLOAD_CHUNK_SIZE):
+    """
+    Pipeline stage 2: stream the file to Drive, checking through its MD5 that
+    it is still the content that was hashed, then queue its record. With
+    dedup, content already on Drive is only linked; links are written right
+    away through link_duplicate, so a concurrent delete of the object is
+    noticed and the file is uploaded instead.
+    """
+    path, file_name = item
+    if uploaded is not None:
+        existing = uploaded.find(hashed['hash'], hashed['algorithm'])
+        if existing and existing['file_size'] == hashed['size'] and \
+                link_duplicate(file_name, existing, storage) is not None:
+            progress.finished(deduplicated=True)
+            return {
+                'filename': file_name,
+                'uploaded': True,
+                'deduplicated': True,
+                'hash': existing['hash'],
+                'drive_id': existing['drive_id'],
+                'size': existing['file_size'],
+                'drive_checksums_match': True
+            }
+
+    drive_file, media, _ = send_local_file(path, file_name, storage, chunk_size=chunk_size)
+    if media.hexdigest() != hashed['md5']:
+        # Do not leave an unrecorded copy behind; the next run picks the file up again
+        drive_client.get_drive_service().files().delete(fileId=drive_file['id']).execute()
+        raise ValueError(f"{path} changed between hashing and upload")
+
+    drive_matches = (drive_file.get('sha256Checksum') in (None, hashed['sha256']) and
+                     drive_file.get('md5Checksum') in (None, hashed['md5']))
+    document = mongodb_storage.file_document(file_name, hashed['hash'], drive_file['id'], hashed['size'],
+                                             hashed['algorithm'],
+                                             md5_checksum=hashed['md5'],
+                                             sha256_checksum=hashed['sha256'],
+                                             merkle=hashed['merkle'].to_document())
+    writer.add(document)
+    if uploaded is not None:
+        uploaded.add(document)
+    progress.finished(hashed['size'])
+    return {
+        'filename': file_name,
+        'uploaded': True,
+        'deduplicated': False,
+        'hash': hashed['hash'],
+        'drive_id': drive_file['id'],
+        'size': hashed['size'],
+        'drive_checksums_match': drive_matches
+    }
@@ -2,13 +2,15 @@
 Utility functions for the Decentralized Cloud Storage Validator
 """
 
-import hashlib
 import os
 import logging
 from pathlib import Path
 from typing import Optional, Dict, Any
 from datetime import datetime
 
+import config
+from hash_cache import cached_file_hash
+
 def setup_logging(log_level: str = "INFO") -> logging.Logger:
     """
     Set up logging configuration
@@ -23,16 +25,14 @@ def setup_logging(log_level: str = "INFO") -> logging.Logger:
     )
     return logging.getLogger(__name__)
 
-def compute_file_hash(file_path: str, algorithm: str = "sha256") -> Optional[str]:
+def compute_file_hash(file_path: str, algorithm: str = "sha256", strategy: str = config.HASH_STRATEGY,
+                      use_cache: bool = config.HASH_CACHE_ENABLED) -> Optional[str]:
     """
-    Compute hash of a file using the specified algorithm
+    Compute hash of a file using the specified algorithm and hashing strategy.
+    Unchanged files are answered from the local hash cache unless use_cache is False.
     """
     try:
-        hash_obj = hashlib.new(algorithm)
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_obj.update(chunk)
-        return hash_obj.hexdigest()
+        return cached_file_hash(file_path, algorithm, strategy, use_cache)
     except Exception as e:
         logging.error(f"Error computing hash for {file_path}: {e}")
         return None
@@ -0,0 +1,175 @@
+"""
+Concurrent verification engine for the Decentralized Cloud Storage Validator
+"""
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+
+import config
+from hashing import record_algorithm
+
+
+def _item_name(item):
+    """Best-effort display name for a work item (file name or metadata record)"""
+    if isinstance(item, dict):
+        return item.get('file_name')
+    return item
+
+
+def _error_result(item, error):
+    return {
+        'filename': _item_name(item),
+        'is_intact': False,
+        'trust_score': 0,
+        'verified': False,
+        'error': str(error)
+    }
+
+
+def _run_safely(verify_one, item):
+    """Run one verification, turning any exception into error result(s)"""
+    try:
+        return verify_one(item)
+    except Exception as e:
+        if isinstance(item, list):
+            return [_error_result(member, e) for member in item]
+        return _error_result(item, e)
+
+
+def _flatten(outcome):
+    """A work item may be a batch of records, in which case verify_one returns a list of results"""
+    if isinstance(outcome, list):
+        return outcome
+    return [outcome]
+
+
+def verify_concurrently(items, verify_one, workers=config.VERIFY_WORKERS):
+    """
+    Run verify_one over items on a bounded thread pool and yield each result
+    as soon as it finishes.
+
+    Only a small multiple of `workers` items is submitted at a time, so a
+    lazily produced stream of items is never pulled into memory all at once.
+    verify_one must return a result dict, or a list of result dicts when the
+    item is a list (a batch); exceptions become error results.
+    """
+    workers = max(1, int(workers))
+    max_in_flight = workers * 2
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verify") as executor:
+        pending = set()
+        for item in items:
+            pending.add(executor.submit(_run_safely, verify_one, item))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from _flatten(future.result())
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from _flatten(future.result())
+
+
+def full_verify_due(record, interval_days=config.FULL_VERIFY_INTERVAL_DAYS, now=None):
+    """True when a record has not had a full-content verification within interval_days"""
+    last_full = record.get('last_full_verified')
+    if not last_full:
+        return True
+    if isinstance(last_full, str):
+        last_full = datetime.fromisoformat(last_full)
+    now = now or datetime.now()
+    return now - last_full >= timedelta(days=interval_days)
+
+
+def plan_fast_sweep(records, batch_size=config.DRIVE_BATCH_SIZE, interval_days=config.FULL_VERIFY_INTERVAL_DAYS):
+    """
+    Turn a record stream into work items for a fast sweep.
+
+    Records due a scheduled full verification are yielded on their own; the
+    rest are grouped into lists of up to batch_size records whose Drive
+    metadata can be fetched with one batch request.
+    """
+    batch = []
+    for record in records:
+        if full_verify_due(record, interval_days):
+            yield record
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def compare_drive_checksums(record, metadata):
+    """
+    Compare what Drive reports for a file against what was recorded at upload.
+
+    Returns True when every comparable value matches, False when any differs,
+    and None when Drive reports nothing comparable (e.g. Google Docs formats),
+    in which case only a download can tell.
+    """
+    checks = []
+
+    sha256 = record.get('sha256_checksum')
+    if not sha256 and record_algorithm(record) == "sha256":
+        sha256 = record.get('hash')
+    if metadata.get('sha256Checksum') and sha256:
+        checks.append(metadata['sha256Checksum'] == sha256)
+
+    if metadata.get('md5Checksum') and record.get('md5_checksum'):
+        checks.append(metadata['md5Checksum'] == record['md5_checksum'])
+
+    if not checks:
+        return None
+
+    if metadata.get('size') is not None and record.get('file_size') is not None:
+        checks.append(int(metadata['size']) == int(record['file_size']))
+
+    return all(checks)
+
+
+class VerificationSummary:
+    """Running intact/tampered/error tally for a batch verification"""
+
+    def __init__(self):
+        self.verified_count = 0
+        self.tampered_count = 0
+        self.error_count = 0
+
+    def add(self, result):
+        """Count one per-file result"""
+        if not result.get('verified'):
+            self.error_count += 1
+        elif result.get('is_intact'):
+            self.verified_count += 1
+        else:
+            self.tampered_count += 1
+        return result
+
+    @property
+    def checked_count(self):
+        """Files whose integrity was actually determined"""
+        return self.verified_count + self.tampered_count
+
+    @property
+    def total(self):
+        """All files processed, including ones that failed with an error"""
+        return self.checked_count + self.error_count
+
+    def security_percentage(self, include_errors=False):
+        """Share of intact files, optionally counting errors as not intact"""
+        total = self.total if include_errors else self.checked_count
+        return (self.verified_count / total * 100) if total > 0 else 0
+
+    def to_dict(self, include_errors=False):
+        """Summary fields as returned by the web API"""
+        return {
+            'verified_count': self.verified_count,
+            'tampered_count': self.tampered_count,
+            'error_count': self.error_count,
+            'total_files': self.total,
+            'security_percentage': self.security_percentage(include_errors)
+        }
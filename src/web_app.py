@@ -3,65 +3,40 @@
 Flask Web API for Decentralized Storage Validator
 """
 
-import os
-import hashlib
 import json
 from datetime import datetime
 from flask import Flask, request, jsonify, render_template, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import mongodb_storage
-
-# Import from main.py
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-from io import BytesIO
+import config
+import drive_client
+import integrity
+import uploads
+from jobs import JobQueue, JobQueueFull
+from merkle import parse_chunk_spec
+from sampling import SamplePolicy
+from verifier import VerificationSummary, compare_drive_checksums
 
 # Initialize Flask app
 app = Flask(__name__, template_folder='../templates', static_folder='../templates')
 CORS(app)
+jobs = JobQueue()  # Background sweeps started by /api/verify-all; in-process, so serve with a single process
 
 # Static file routes are defined later in the file
 
 # Configuration
-app.config['UPLOAD_FOLDER'] = 'temp'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# Ensure temp directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+app.config['MAX_CONTENT_LENGTH'] = config.MAX_FILE_SIZE  # Uploads are streamed, never buffered whole
 
 # Google Drive configuration
 SCOPES = ['https://www.googleapis.com/auth/drive']
 TOKEN_FILE = 'token.json'
 
-def get_drive_service():
-    """Get authenticated Google Drive service"""
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'client_secret.json', SCOPES)
-            creds = flow.run_local_server(port=8081, open_browser=False)
-        with open(TOKEN_FILE, 'w') as token:
-            token.write(creds.to_json())
-    
-    return build('drive', 'v3', credentials=creds)
+drive_client.configure(token_file=TOKEN_FILE, scopes=SCOPES, oauth_port=8081, open_browser=False)
 
-def compute_file_hash(file_path):
-    """Compute SHA-256 hash of file"""
-    hash_sha256 = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_sha256.update(chunk)
-    return hash_sha256.hexdigest()
+def get_drive_service():
+    """Get the shared, thread-safe Google Drive service"""
+    return drive_client.get_drive_service()
 
 @app.route('/')
 def index():
@@ -86,7 +61,8 @@ def get_all_files():
         files = []
         
         # Get files from MongoDB
-        documents = storage.collection.find({"status": "active"}).sort("upload_date", -1)
+        documents = storage.collection.find({"status": "active"},
+                                             mongodb_storage.LISTING_PROJECTION).sort("upload_date", -1)
         
         for doc in documents:
             # Convert ObjectId to string
@@ -108,70 +84,55 @@ def get_all_files():
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Upload a file to Google Drive and store hash in MongoDB"""
+    """Upload a file to Google Drive and store hash in MongoDB
+
+    The raw file body (with ?filename=) is streamed straight through to Drive and
+    hashed on the way; multipart form uploads under 'file' are also accepted.
+    """
     try:
-        if 'file' not in request.files:
-            return jsonify({
-                'success': False,
-                'error': 'No file provided'
-            }), 400
+        if request.mimetype == 'multipart/form-data':
+            if 'file' not in request.files:
+                return jsonify({
+                    'success': False,
+                    'error': 'No file provided'
+                }), 400
 
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({
-                'success': False,
-                'error': 'No file selected'
-            }), 400
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({
+                    'success': False,
+                    'error': 'No file selected'
+                }), 400
 
-        if file:
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            
-            try:
-                # Compute hash
-                file_hash = compute_file_hash(filepath)
-                
-                # Upload to Google Drive
-                service = get_drive_service()
-                file_metadata = {'name': filename}
-                media = MediaFileUpload(filepath, resumable=True)
-                
-                drive_file = service.files().create(
-                    body=file_metadata, 
-                    media_body=media, 
-                    fields='id,name,size'
-                ).execute()
-                
-                file_id = drive_file.get('id')
-                file_size = os.path.getsize(filepath)
-                
-                # Store in MongoDB
-                storage = mongodb_storage.MongoDBStorage()
-                storage.store_file_hash(filename, file_hash, file_id, file_size)
-                
-                # Clean up temp file
-                os.remove(filepath)
-                
-                storage.close_connection()
-                
+            stream, size, mimetype = file.stream, None, file.mimetype
+        else:
+            filename = secure_filename(request.args.get('filename', ''))
+            if not filename:
                 return jsonify({
-                    'success': True,
-                    'message': 'File uploaded successfully',
-                    'data': {
-                        'filename': filename,
-                        'hash': file_hash,
-                        'drive_id': file_id,
-                        'size': file_size,
-                        'upload_time': datetime.now().isoformat()
-                    }
-                })
-                
-            except Exception as e:
-                # Clean up temp file on error
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                raise e
+                    'success': False,
+                    'error': 'No filename provided'
+                }), 400
+            stream, size, mimetype = request.stream, request.content_length, request.mimetype
+
+        # Upload to Google Drive, hashing and chunk-hashing in the same pass
+        details = uploads.upload_stream(stream, filename, size=size, mimetype=mimetype or None)
+
+        return jsonify({
+            'success': True,
+            'message': 'File uploaded successfully',
+            'data': {
+                'filename': filename,
+                'hash': details['hash'],
+                'algorithm': details['algorithm'],
+                'merkle_root': details['merkle_root'],
+                'drive_id': details['drive_id'],
+                'size': details['size'],
+                'bytes_per_sec': details['bytes_per_sec'],
+                'drive_checksums_match': details['drive_checksums_match'],
+                'upload_time': datetime.now().isoformat()
+            }
+        })
 
     except Exception as e:
         return jsonify({
@@ -196,22 +157,61 @@ def verify_file(filename):
         
         original_hash = file_data['hash']
         file_id = file_data['drive_id']
-        
-        # Download from Google Drive
         service = get_drive_service()
-        request_obj = service.files().get_media(fileId=file_id)
-        fh = BytesIO()
-        downloader = MediaIoBaseDownload(fh, request_obj)
         
-        done = False
-        while done is False:
-            status, done = downloader.next_chunk()
+        if request.args.get('chunks'):
+            # Ranged downloads of selected Merkle chunks only
+            if not file_data.get('merkle'):
+                return jsonify({
+                    'success': False,
+                    'error': 'File has no chunk hashes recorded'
+                }), 400
+            try:
+                indices = parse_chunk_spec(request.args['chunks'])
+                report = integrity.check_chunks(file_data, file_data['merkle'], indices)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+            report.update({
+                'filename': filename,
+                'is_intact': not report['tampered_chunks'],
+                'mode': 'chunks',
+                'verification_time': datetime.now().isoformat()
+            })
+            return jsonify({
+                'success': True,
+                'data': report
+            })
+        
+        if request_flag('fast'):
+            # Compare Drive-reported checksums; fall through to a download if there are none
+            metadata = drive_client.get_file_metadata(service, file_id)
+            matches = compare_drive_checksums(file_data, metadata)
+            if matches is not None:
+                trust_score = 100 if matches else 0
+                storage.update_verification(filename, "success" if matches else "tampered", trust_score, mode="fast")
+                return jsonify({
+                    'success': True,
+                    'data': {
+                        'filename': filename,
+                        'is_intact': matches,
+                        'trust_score': trust_score,
+                        'mode': 'fast',
+                        'original_hash': original_hash,
+                        'drive_sha256': metadata.get('sha256Checksum'),
+                        'drive_md5': metadata.get('md5Checksum'),
+                        'file_size': int(metadata.get('size', 0)),
+                        'verification_time': datetime.now().isoformat()
+                    }
+                })
         
-        downloaded_content = fh.getvalue()
-        downloaded_hash = hashlib.sha256(downloaded_content).hexdigest()
+        # Stream from Google Drive through the hasher (and Merkle builder, if the file has one)
+        is_intact, stream, tampered_ranges = integrity.stream_and_compare(file_data)
+        downloaded_hash = stream.hexdigest()
         
         # Check integrity
-        is_intact = original_hash == downloaded_hash
         trust_score = 100 if is_intact else 0
         
         # Update verification stats
@@ -224,9 +224,12 @@ def verify_file(filename):
                 'filename': filename,
                 'is_intact': is_intact,
                 'trust_score': trust_score,
+                'mode': 'full',
                 'original_hash': original_hash,
                 'downloaded_hash': downloaded_hash,
-                'file_size': len(downloaded_content),
+                'file_size': stream.bytes_written,
+                'bytes_per_sec': stream.bytes_per_sec,
+                'tampered_ranges': tampered_ranges,
                 'verification_time': datetime.now().isoformat()
             }
         })
@@ -237,117 +240,174 @@ def verify_file(filename):
             'error': f'Verification failed: {str(e)}'
         }), 500
 
+def request_flag(name):
+    """Boolean option from the JSON body or query string"""
+    payload = request.get_json(silent=True) or {}
+    value = payload.get(name, request.args.get(name, False))
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+def request_has(name):
+    """True if the JSON body or query string sets this option"""
+    payload = request.get_json(silent=True) or {}
+    return name in payload or name in request.args
+
+def requested_workers():
+    """Worker count from the JSON body or query string, clamped to the configured maximum"""
+    payload = request.get_json(silent=True) or {}
+    workers = payload.get('workers', request.args.get('workers', config.VERIFY_WORKERS))
+    return max(1, min(int(workers), config.MAX_VERIFY_WORKERS))
+
+def requested_sample_policy():
+    """SamplePolicy built from the request when {"sample": true} is set, otherwise None"""
+    if not request_flag('sample'):
+        return None
+    payload = request.get_json(silent=True) or {}
+    return SamplePolicy(
+        float(payload.get('confidence', request.args.get('confidence', config.SAMPLE_CONFIDENCE))),
+        float(payload.get('tampered_fraction', request.args.get('tampered_fraction', config.SAMPLE_TAMPERED_FRACTION))),
+        int(payload.get('sample_budget_bytes', request.args.get('sample_budget_bytes', config.SAMPLE_BUDGET_BYTES)))
+    )
+
+def requested_budget_limits():
+    """(max_bytes, bytes_per_day, bytes_per_sec) from the request, defaulting to the configured limits"""
+    payload = request.get_json(silent=True) or {}
+    limits = []
+    for name, default in (('max_bytes', config.VERIFY_MAX_BYTES), ('bytes_per_day', config.VERIFY_BYTES_PER_DAY),
+                          ('bytes_per_sec', config.VERIFY_BYTES_PER_SEC)):
+        value = payload.get(name, request.args.get(name, default))
+        if value is not None and int(value) <= 0:
+            raise ValueError(f"{name} must be positive")
+        limits.append(None if value is None else int(value))
+    return tuple(limits)
+
 @app.route('/api/verify-all', methods=['POST'])
 def verify_all_files():
-    """Verify all files at once"""
+    """
+    Queue a verification of all files and return 202 with a job id to poll at /api/jobs/<id>.
+    {"fast": true} checks Drive checksums instead, and {"incremental": true} only verifies files
+    that changed on Drive since the last incremental run. {"max_bytes", "bytes_per_day",
+    "bytes_per_sec"} cap the downloads, verifying the stalest files first; they cannot be
+    combined with incremental
+    """
     try:
-        storage = mongodb_storage.MongoDBStorage()
-        files = storage.list_all_files()
-        
-        results = []
-        verified_count = 0
-        tampered_count = 0
-        
-        for filename in files:
-            try:
-                file_data = storage.get_file_hash(filename)
-                if not file_data:
-                    continue
-                
-                original_hash = file_data['hash']
-                file_id = file_data['drive_id']
-                
-                # Download and verify
-                service = get_drive_service()
-                request_obj = service.files().get_media(fileId=file_id)
-                fh = BytesIO()
-                downloader = MediaIoBaseDownload(fh, request_obj)
-                
-                done = False
-                while done is False:
-                    status, done = downloader.next_chunk()
-                
-                downloaded_content = fh.getvalue()
-                downloaded_hash = hashlib.sha256(downloaded_content).hexdigest()
-                
-                is_intact = original_hash == downloaded_hash
-                trust_score = 100 if is_intact else 0
-                
-                if is_intact:
-                    verified_count += 1
-                else:
-                    tampered_count += 1
-                
-                storage.update_verification(filename, "success" if is_intact else "tampered", trust_score)
-                
-                results.append({
-                    'filename': filename,
-                    'is_intact': is_intact,
-                    'trust_score': trust_score,
-                    'verified': True
-                })
-                
-            except Exception as e:
-                results.append({
-                    'filename': filename,
-                    'is_intact': False,
-                    'trust_score': 0,
-                    'verified': False,
-                    'error': str(e)
-                })
-        
-        total = len(results)
-        security_percentage = (verified_count / total * 100) if total > 0 else 0
-        
-        storage.close_connection()
-        
+        workers = requested_workers()
+        sample_policy = requested_sample_policy()
+        budget_limits = requested_budget_limits()
+        fast = request_flag('fast')
+        incremental = request_flag('incremental')
+        if incremental and any(request_has(name) for name in ('max_bytes', 'bytes_per_day', 'bytes_per_sec')):
+            raise ValueError("incremental verification does not take max_bytes, bytes_per_day or bytes_per_sec")
+    except (TypeError, ValueError) as e:
         return jsonify({
-            'success': True,
-            'data': {
-                'verified_count': verified_count,
-                'tampered_count': tampered_count,
-                'total_files': total,
-                'security_percentage': security_percentage,
-                'results': results,
-                'verification_time': datetime.now().isoformat()
-            }
-        })
+            'success': False,
+            'error': f'Invalid verification options: {str(e)}'
+        }), 400
 
-    except Exception as e:
+    try:
+        job = jobs.submit('verify-all', lambda job: run_verify_all(job, workers, fast, incremental, sample_policy,
+                                                                   budget_limits))
+    except JobQueueFull as e:
         return jsonify({
             'success': False,
-            'error': f'Batch verification failed: {str(e)}'
-        }), 500
+            'error': f'Batch verification not started: {str(e)}'
+        }), 503
+
+    return jsonify({
+        'success': True,
+        'data': {
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/api/jobs/{job.id}'
+        }
+    }), 202
+
+def run_verify_all(job, workers, fast, incremental, sample_policy, budget_limits):
+    """
+    Background body of /api/verify-all: runs the sweep, counting progress on the job, and returns its
+    summary. Only tampered and failed files are listed, up to JOB_MAX_REPORTED_FILES of them
+    """
+    summary = VerificationSummary()
+    changes = None
+    budget = None
+    db_storage = mongodb_storage.MongoDBStorage()
+    if incremental:
+        feed = drive_client.DriveChangesFeed(drive_client.get_drive_service())
+        plan = integrity.plan_changes(db_storage, feed)
+        if plan is None:
+            with mongodb_storage.DriveMetadataWriter() as metadata_writer:
+                changes = {'baseline': integrity.take_baseline(db_storage, feed, metadata_writer)}
+        else:
+            with mongodb_storage.VerificationResultWriter() as results_writer, \
+                    mongodb_storage.DriveMetadataWriter() as metadata_writer:
+                sweep = integrity.incremental_sweep(plan, results_writer, metadata_writer, workers, sample_policy)
+                for result in sweep:
+                    summary.add(job.add_result(result))
+            # Only move the feed position once every result and snapshot is in MongoDB
+            integrity.save_changes_position(db_storage, plan)
+            changes = plan.to_dict()
+    else:
+        if any(limit is not None for limit in budget_limits):
+            budget = integrity.open_budget(db_storage, *budget_limits)
+        sources = db_storage.iter_verification_sources(stalest_first=budget is not None and budget.limited)
+        try:
+            with mongodb_storage.VerificationResultWriter() as results_writer:
+                sweep = integrity.sweep(sources, results_writer, workers, fast, sample_policy=sample_policy,
+                                        budget=budget)
+                for result in sweep:
+                    summary.add(job.add_result(result))
+        finally:
+            if budget is not None:
+                integrity.close_budget(db_storage, budget)
+
+    problems, unreported = job.reported_problems()
+    data = summary.to_dict(include_errors=True)
+    data.update({
+        'workers': workers,
+        'fast': fast,
+        'sample': sample_policy is not None,
+        'incremental': incremental,
+        'changes': changes,
+        'budget': budget.to_dict() if budget is not None else None,
+        'problem_files': problems,
+        'unlisted_problem_count': unreported,
+        'verification_time': datetime.now().isoformat()
+    })
+    return data
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status and progress of a background job; the result is included once it has finished"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': f'Job {job_id} not found (results are kept for {config.JOB_RETENTION_SECONDS} seconds)'
+        }), 404
+
+    return jsonify({
+        'success': True,
+        'data': job.to_dict()
+    })
 
 @app.route('/api/delete/<filename>', methods=['DELETE'])
 def delete_file(filename):
-    """Delete a file from both Google Drive and MongoDB"""
+    """Delete a file from MongoDB, and from Google Drive once no other name points at it"""
     try:
-        storage = mongodb_storage.MongoDBStorage()
-        
-        # Get file metadata
-        file_data = storage.get_file_hash(filename)
-        if not file_data:
-            storage.close_connection()
+        result = uploads.delete_file(filename)
+        if result is None:
             return jsonify({
                 'success': False,
                 'error': 'File not found'
             }), 404
         
-        file_id = file_data['drive_id']
-        
-        # Delete from Google Drive
-        service = get_drive_service()
-        service.files().delete(fileId=file_id).execute()
-        
-        # Soft delete from MongoDB
-        storage.delete_file_hash(filename)
-        storage.close_connection()
-        
         return jsonify({
             'success': True,
             'message': 'File deleted successfully',
             'filename': filename,
+            'drive_deleted': result['drive_deleted'],
+            'remaining_references': result['remaining_references'],
             'deleted_time': datetime.now().isoformat()
         })
 
@@ -357,6 +417,34 @@ def delete_file(filename):
             'error': f'Delete failed: {str(e)}'
         }), 500
 
+@app.route('/api/delete-batch', methods=['POST'])
+def delete_files():
+    """Delete many files at once; unreferenced Drive objects are removed with batched API calls"""
+    try:
+        filenames = (request.get_json(silent=True) or {}).get('filenames')
+        if not isinstance(filenames, list) or not filenames or not all(isinstance(n, str) for n in filenames):
+            return jsonify({
+                'success': False,
+                'error': 'Expected a JSON body with a non-empty "filenames" list'
+            }), 400
+
+        results = uploads.delete_files(filenames)
+        return jsonify({
+            'success': True,
+            'data': {
+                'results': results,
+                'deleted': sum(1 for r in results if r['deleted']),
+                'failed': sum(1 for r in results if not r['deleted']),
+                'deleted_time': datetime.now().isoformat()
+            }
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Delete failed: {str(e)}'
+        }), 500
+
 @app.route('/api/search', methods=['GET'])
 def search_files():
     """Search files by name or hash"""
@@ -371,6 +459,8 @@ def search_files():
         storage = mongodb_storage.MongoDBStorage()
         results = storage.search_files(query)
         storage.close_connection()
+        for doc in results:
+            doc['_id'] = str(doc['_id'])
         
         return jsonify({
             'success': True,
@@ -394,6 +484,7 @@ def get_stats():
         storage = mongodb_storage.MongoDBStorage()
         stats = storage.get_database_stats()
         storage.close_connection()
+        stats['drive'] = drive_client.get_limiter().stats()
         
         return jsonify({
             'success': True,
@@ -408,5 +499,6 @@ def get_stats():
 
 if __name__ == '__main__':
     print("🚀 Starting Decentralized Storage Validator Web App")
+    mongodb_storage.ensure_indexes()
     print("🌐 Access at: http://localhost:8080")
     app.run(debug=True, host='0.0.0.0', port=8080)
@@ -233,15 +233,7 @@ function handleFileSelect(e) {
 }
 
 async function uploadFile(file) {
-    if (file.size > 16 * 1024 * 1024) { // 16MB limit
-        showNotification('File size exceeds 16MB limit', 'error');
-        return;
-    }
-
     showLoading();
-    
-    const formData = new FormData();
-    formData.append('file', file);
 
     try {
         showUploadProgress(0, 'Uploading file...');
@@ -274,8 +266,10 @@ async function uploadFile(file) {
             throw new Error('Upload failed');
         });
 
-        xhr.open('POST', '/api/upload');
-        xhr.send(formData);
+        // Send the raw bytes so the server can stream them straight to Drive
+        xhr.open('POST', '/api/upload?filename=' + encodeURIComponent(file.name));
+        xhr.setRequestHeader('Content-Type', file.type || 'application/octet-stream');
+        xhr.send(file);
 
     } catch (error) {
         hideLoading();
@@ -355,7 +349,7 @@ async function verifyAllFiles() {
             method: 'POST'
         });
         
-        const data = response.data;
+        const data = await waitForJob(response.data.job_id);
         
         // Update summary
         document.getElementById('verified-count').textContent = data.verified_count;
@@ -366,7 +360,7 @@ async function verifyAllFiles() {
         document.getElementById('verification-summary').style.display = 'block';
         
         // Update details
-        updateVerificationDetails(data.results);
+        updateVerificationDetails(data.problem_files, data.unlisted_problem_count);
         
         // Show notification
         const message = data.tampered_count > 0 
@@ -385,11 +379,29 @@ async function verifyAllFiles() {
     }
 }
 
-function updateVerificationDetails(results) {
+// Poll a background job until it finishes; resolves with its result
+async function waitForJob(jobId, intervalMs = 1000) {
+    while (true) {
+        const response = await apiRequest(`/api/jobs/${jobId}`);
+        const job = response.data;
+        if (job.status === 'completed') {
+            return job.result;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Job failed');
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
+// Lists the tampered and failed files of a batch verification; intact files are only counted
+function updateVerificationDetails(results, unlistedCount = 0) {
     const detailsDiv = document.getElementById('verification-details');
     if (!detailsDiv) return;
 
-    detailsDiv.innerHTML = '<h3>Detailed Results:</h3>';
+    detailsDiv.innerHTML = results.length > 0
+        ? '<h3>Tampered or Failed Files:</h3>'
+        : '<h3>No tampered or failed files.</h3>';
 
     results.forEach(result => {
         const resultDiv = document.createElement('div');
@@ -399,13 +411,19 @@ function updateVerificationDetails(results) {
             <div style="display: flex; justify-content: space-between; align-items: center; padding: 1rem; margin: 0.5rem 0; border-radius: 8px; background: ${result.is_intact ? 'rgba(81, 207, 102, 0.1)' : 'rgba(255, 107, 107, 0.1)'};">
                 <span><i class="fas ${result.is_intact ? 'fa-check-circle' : 'fa-exclamation-triangle'}"></i> ${escapeHtml(result.filename)}</span>
                 <span class="status-badge ${result.is_intact ? 'verified' : 'tampered'}">
-                    ${result.trust_score}%
+                    ${result.verified ? result.trust_score + '%' : 'Error'}
                 </span>
             </div>
         `;
         
         detailsDiv.appendChild(resultDiv);
     });
+
+    if (unlistedCount > 0) {
+        const moreDiv = document.createElement('p');
+        moreDiv.textContent = `...and ${unlistedCount} more tampered or failed files not listed.`;
+        detailsDiv.appendChild(moreDiv);
+    }
 }
 
 function refreshVerification() {
@@ -0,0 +1,100 @@
+"""
+Unit tests for sweep byte budgets and bandwidth caps
+"""
+
+import pytest
+from datetime import date
+from budget import ByteBudget, daily_state_key
+
+MB = 1024 * 1024
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def record(name, size, last_verified=None):
+    return {'file_name': name, 'file_size': size, 'last_verified': last_verified}
+
+def size_of(item):
+    return item['file_size']
+
+def test_admits_in_order_until_the_budget_runs_out():
+    """The first file that does not fit ends the run; it and everything after are backlog"""
+    budget = ByteBudget(max_bytes=10 * MB)
+    records = [record("a", 4 * MB), record("b", 5 * MB, "2024-01-01T00:00:00"), record("c", 3 * MB, "2024-02-01T00:00:00"),
+               record("d", 1 * MB, "2024-03-01T00:00:00")]
+    admitted = [item['file_name'] for item in budget.admit(records, size_of)]
+    assert admitted == ["a", "b"]
+    assert budget.reserved == 9 * MB
+    assert (budget.covered_files, budget.covered_bytes) == (2, 9 * MB)
+    assert (budget.backlog_files, budget.backlog_bytes) == (2, 4 * MB)
+    assert budget.backlog_since == "2024-02-01T00:00:00"
+    assert budget.coverage_percentage() == 50.0
+
+def test_files_larger_than_the_budget_are_skipped_not_blocking():
+    """A file no run could afford is counted as oversized and later files still run"""
+    budget = ByteBudget(max_bytes=10 * MB)
+    admitted = [item['file_name'] for item in budget.admit([record("huge", 50 * MB), record("b", 2 * MB)], size_of)]
+    assert admitted == ["b"]
+    assert budget.oversized_files == 1
+    assert budget.backlog_files == 1
+
+def test_daily_cap_counts_earlier_runs():
+    """What earlier runs downloaded today comes off the daily allowance"""
+    budget = ByteBudget(bytes_per_day=10 * MB, used_today=7 * MB)
+    assert budget.limited
+    assert budget.remaining() == 3 * MB
+    admitted = [item['file_name'] for item in budget.admit([record("a", 2 * MB), record("b", 2 * MB)], size_of)]
+    assert admitted == ["a"]
+    assert ByteBudget(max_bytes=5 * MB, bytes_per_day=10 * MB, used_today=8 * MB).remaining() == 2 * MB
+
+def test_batches_count_every_member():
+    """A fast metadata batch costs nothing but covers all its records"""
+    budget = ByteBudget(max_bytes=MB)
+    batch = [record("a", 10 * MB), record("b", 10 * MB)]
+    assert list(budget.admit([batch], lambda item: 0)) == [batch]
+    assert budget.covered_files == 2
+
+def test_unlimited_budget_admits_everything():
+    """Without byte caps nothing is deferred"""
+    budget = ByteBudget(bytes_per_sec=MB)
+    records = [record(str(i), 100 * MB) for i in range(5)]
+    assert len(list(budget.admit(records, size_of))) == 5
+    assert not budget.limited
+    assert budget.remaining() is None
+    assert budget.coverage_percentage() == 100.0
+
+def test_update_counts_and_paces_downloads():
+    """Downloaded bytes are counted and paced to bytes_per_sec"""
+    clock = FakeClock()
+    budget = ByteBudget(bytes_per_sec=MB, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        budget.update(b"x" * MB)
+    assert budget.downloaded == 5 * MB
+    assert 3.9 <= clock.now <= 4.1  # The first second's worth is the burst
+    assert budget.chunk_size() == MB
+    assert ByteBudget().chunk_size() is None
+
+def test_daily_state_key():
+    """Daily counters are keyed by date"""
+    assert daily_state_key(date(2024, 5, 1)) == "verify_bytes:2024-05-01"
+
+def test_stalest_first_sources_skip_files_verified_during_the_sweep(monkeypatch):
+    """A file verified after the sweep started is not streamed (and charged to the budget) again"""
+    mongomock = pytest.importorskip("mongomock")
+    import mongodb_storage
+    monkeypatch.setattr(mongodb_storage, "_client", mongomock.MongoClient())
+    storage = mongodb_storage.MongoDBStorage()
+    for name, last_verified in (("a", None), ("b", "2024-01-01T00:00:00"), ("c", "2024-02-01T00:00:00")):
+        storage.collection.insert_one(mongodb_storage.file_document(name, "00", "drive-" + name, 1,
+                                                                    last_verified=last_verified))
+
+    sources = storage.iter_verification_sources(stalest_first=True)
+    storage.collection.update_one({"file_name": "b"}, mongodb_storage.verification_update(100.0))
+    assert [record['file_name'] for record in sources] == ["a", "c"]
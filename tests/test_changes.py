@@ -0,0 +1,68 @@
+"""
+Unit tests for incremental verification planning over the Drive changes feed
+"""
+
+from changes import FakeChangesFeed, metadata_moved, plan_incremental, read_changes
+
+def make_records(feed, count):
+    """Records whose stored snapshot matches the fake feed's current metadata"""
+    records = {}
+    for n in range(count):
+        drive_id = f"id-{n}"
+        snapshot = feed.modify(drive_id, content_md5=f"md5-{n}", size=str(n))
+        records[drive_id] = {'file_name': f"file-{n}", 'drive_id': drive_id, 'drive_metadata': dict(snapshot)}
+    return records
+
+def lookup(records):
+    return lambda drive_ids: [records[d] for d in drive_ids if d in records]
+
+def test_metadata_moved_compares_content_fields_only():
+    """modifiedTime, md5Checksum and headRevisionId matter; other fields do not"""
+    stored = {'modifiedTime': 't1', 'md5Checksum': 'a', 'headRevisionId': 'r1', 'name': 'x'}
+    assert not metadata_moved(stored, dict(stored, name='renamed'))
+    assert metadata_moved(stored, dict(stored, headRevisionId='r2'))
+    assert metadata_moved(stored, dict(stored, trashed=True))
+    assert metadata_moved(None, stored)
+    assert metadata_moved(stored, None)
+
+def test_fake_feed_pages_and_keeps_latest_change():
+    """Paging follows nextPageToken to the end; a file changed twice is reported once"""
+    feed = FakeChangesFeed(page_size=3)
+    token = feed.start_page_token()
+    for n in range(5):
+        feed.modify(f"id-{n}")
+    feed.modify("id-0", content_md5="new")
+    latest, next_token = read_changes(feed, token)
+    assert sorted(latest) == [f"id-{n}" for n in range(5)]
+    assert latest["id-0"]['file']['md5Checksum'] == "new"
+    assert read_changes(feed, next_token) == ({}, next_token)
+
+def test_only_moved_files_are_planned_for_verification():
+    """Content changes and removals are verified; renames and untracked files are not"""
+    feed = FakeChangesFeed()
+    records = make_records(feed, 10)
+    token = feed.start_page_token()
+
+    feed.modify("id-1", content_md5="tampered")
+    feed.modify("id-2")  # New revision with the same checksum
+    feed.touch("id-3", name="renamed")
+    feed.remove("id-4")
+    feed.modify("someone-elses-file")
+
+    plan = plan_incremental(feed, token, lookup(records))
+    assert sorted(record['drive_id'] for record, _ in plan.to_verify) == ["id-1", "id-2", "id-4"]
+    assert [record['drive_id'] for record, _ in plan.unchanged] == ["id-3"]
+    assert plan.to_dict() == {'changes_seen': 5, 'to_verify': 3, 'unchanged': 1, 'untracked': 1,
+                              'retried': 0, 'failed': 0}
+    assert plan.next_page_token == feed.start_page_token()
+
+def test_quiet_feed_plans_nothing_and_failed_files_are_retried():
+    """With no changes nothing is verified, except files carried over from a failed run"""
+    feed = FakeChangesFeed()
+    records = make_records(feed, 5)
+    token = feed.start_page_token()
+
+    assert plan_incremental(feed, token, lookup(records)).to_verify == []
+    plan = plan_incremental(feed, token, lookup(records), retry_ids=["id-2"])
+    assert [(record['drive_id'], change.get('retry')) for record, change in plan.to_verify] == [("id-2", True)]
+    assert plan.retried == 1
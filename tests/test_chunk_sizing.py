@@ -0,0 +1,54 @@
+"""
+Unit tests for adaptive download chunk sizing
+"""
+
+from chunk_sizing import CHUNK_ALIGNMENT, AdaptiveChunkSizer, align
+
+MB = 1024 * 1024
+
+def drain(sizer, actual_size, rate):
+    """Simulate a download at a steady rate; returns the requested sizes"""
+    offset, requests = 0, []
+    while True:
+        length = sizer.next_size(offset)
+        received = max(0, min(length, actual_size - offset))
+        requests.append(length)
+        sizer.observe(received, received / rate if received else 0.01)
+        offset += received
+        if received < length:
+            return requests
+
+def test_align_rounds_down_to_the_alignment():
+    """Sizes snap to 256KB multiples and never below one unit"""
+    assert align(3 * CHUNK_ALIGNMENT + 5) == 3 * CHUNK_ALIGNMENT
+    assert align(10) == CHUNK_ALIGNMENT
+
+def test_small_objects_take_one_request():
+    """An object up to the maximum chunk is fetched in one round trip, with one spare byte to detect growth"""
+    sizer = AdaptiveChunkSizer(5 * MB, maximum=64 * MB)
+    assert sizer.next_size(0) == 5 * MB + 1
+    assert drain(AdaptiveChunkSizer(5 * MB, maximum=64 * MB), 5 * MB, 10 * MB) == [5 * MB + 1]
+
+def test_chunks_grow_with_throughput_within_bounds():
+    """A fast link grows chunks step by step toward target_seconds of transfer, capped at the maximum"""
+    sizer = AdaptiveChunkSizer(1024 * MB, initial=8 * MB, minimum=1 * MB, maximum=64 * MB, target_seconds=2.0)
+    requests = drain(sizer, 1024 * MB, rate=100 * MB)
+    assert requests[:4] == [8 * MB, 16 * MB, 32 * MB, 64 * MB]
+    assert max(requests) == 64 * MB
+    assert len(requests) < 1024 // 8
+
+def test_chunks_shrink_on_a_slow_link():
+    """A slow link shrinks chunks toward the minimum"""
+    sizer = AdaptiveChunkSizer(None, initial=8 * MB, minimum=1 * MB, maximum=64 * MB, target_seconds=2.0)
+    sizer.observe(8 * MB, 32.0)
+    assert sizer.chunk_size == 4 * MB
+    for _ in range(5):
+        sizer.observe(sizer.chunk_size, sizer.chunk_size / (256 * 1024))
+    assert sizer.chunk_size == 1 * MB
+
+def test_download_continues_past_the_expected_size():
+    """An object larger than recorded is read to its real end; a truncated one ends early"""
+    grown = drain(AdaptiveChunkSizer(4 * MB, maximum=64 * MB), 6 * MB, 10 * MB)
+    assert len(grown) > 1
+    truncated = drain(AdaptiveChunkSizer(4 * MB, maximum=64 * MB), 3 * MB, 10 * MB)
+    assert truncated == [4 * MB + 1]
@@ -0,0 +1,221 @@
+"""
+Unit tests for Drive upload hashing and resumable session queries, against mocked HTTP
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import pytest
+from datetime import datetime, timedelta
+
+pytest.importorskip("googleapiclient")
+
+import httplib2
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence
+import drive_client
+from drive_client import RESUMABLE_CHUNK_ALIGNMENT, HashingMediaUpload
+
+K = RESUMABLE_CHUNK_ALIGNMENT
+
+def drive_service(responses):
+    return build('drive', 'v3', http=HttpMockSequence(responses), static_discovery=True)
+
+def test_getbytes_hashes_each_byte_once_across_resends():
+    """Re-sent and partially confirmed chunks do not change the digest"""
+    data = os.urandom(3 * K + 1000)
+    media = HashingMediaUpload(io.BytesIO(data), chunksize=K, size=len(data))
+    assert media.getbytes(0, K) == data[:K]
+    assert media.getbytes(0, K) == data[:K]  # Whole chunk re-sent after a failed request
+    assert media.getbytes(K // 2, K) == data[K // 2:K // 2 + K]  # Drive confirmed half of it
+    assert media.getbytes(K // 2 + K, K) == data[K // 2 + K:K // 2 + 2 * K]
+    assert media.getbytes(K // 2 + K, K) == data[K // 2 + K:K // 2 + 2 * K]
+    assert media.getbytes(K // 2 + 2 * K, K) == data[K // 2 + 2 * K:]
+    assert media.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert media.sink.bytes_written == len(data)
+
+def test_getbytes_refuses_to_seek_outside_the_buffered_chunk():
+    """Bytes before the current chunk are gone, so seeking back to them is an error"""
+    data = os.urandom(2 * K)
+    media = HashingMediaUpload(io.BytesIO(data), chunksize=K, size=len(data))
+    media.getbytes(0, K)
+    media.getbytes(K, K)
+    with pytest.raises(ValueError):
+        media.getbytes(0, K)
+    with pytest.raises(ValueError):
+        media.getbytes(2 * K + 1, K)
+
+def test_upload_digest_matches_file_when_drive_confirms_partial_chunks():
+    """A resumable upload through the API client hashes the file exactly once"""
+    data = os.urandom(3 * K + 1000)
+    service = drive_service([
+        ({'status': '200', 'location': 'https://upload.example/session'}, ''),
+        ({'status': '308', 'range': f'bytes=0-{K // 2 - 1}'}, ''),
+        ({'status': '308', 'range': f'bytes=0-{K // 2 + K - 1}'}, ''),
+        ({'status': '308', 'range': f'bytes=0-{K // 2 + 2 * K - 1}'}, ''),
+        ({'status': '200'}, json.dumps({'id': 'drive-1', 'size': str(len(data))})),
+    ])
+    media = HashingMediaUpload(io.BytesIO(data), chunksize=K, size=len(data), algorithm="md5")
+    drive_file = service.files().create(body={'name': 'f'}, media_body=media).execute()
+    assert drive_file['id'] == 'drive-1'
+    assert media.hexdigest() == hashlib.md5(data).hexdigest()
+
+def test_upload_hashed_of_unknown_size_stream():
+    """A stream of unknown size ends at the first short read and is hashed whole"""
+    data = os.urandom(K + 10)
+    service = drive_service([
+        ({'status': '200', 'location': 'https://upload.example/session'}, ''),
+        ({'status': '200'}, json.dumps({'id': 'drive-2'})),
+    ])
+    drive_file, media = drive_client.upload_hashed(service, io.BytesIO(data), 'f')
+    assert drive_file['id'] == 'drive-2'
+    assert media.hexdigest() == hashlib.sha256(data).hexdigest()
+
+def test_fast_forward_hashes_the_skipped_prefix_without_sending_it():
+    """Resuming at an offset still digests the whole file, and later chunks start at the offset"""
+    data = os.urandom(2 * K + 500)
+    media = HashingMediaUpload(io.BytesIO(data), chunksize=K, size=len(data))
+    media.fast_forward(K + 100)
+    assert media.sink.bytes_written == K + 100
+    assert media.getbytes(K + 100, K) == data[K + 100:2 * K + 100]
+    assert media.getbytes(2 * K + 100, K) == data[2 * K + 100:]
+    assert media.hexdigest() == hashlib.sha256(data).hexdigest()
+    with pytest.raises(ValueError):
+        media.fast_forward(K)
+
+def test_fast_forward_past_the_end_of_the_source_fails():
+    """A file shorter than the offset Drive confirmed cannot be the file that was uploaded"""
+    media = HashingMediaUpload(io.BytesIO(b"x" * 100), chunksize=K, size=100)
+    with pytest.raises(ValueError):
+        media.fast_forward(200)
+
+class FakeHttp:
+    """Answers every request with one canned (response, content) pair and remembers the requests"""
+
+    def __init__(self, headers, content=b''):
+        self.response = httplib2.Response(headers)
+        self.content = content
+        self.requests = []
+
+    def thread_http(self):
+        return self
+
+    def request(self, uri, method, body=None, headers=None):
+        self.requests.append((uri, method, headers))
+        return self.response, self.content
+
+@pytest.fixture
+def session_http(monkeypatch):
+    def answer(headers, content=b''):
+        http = FakeHttp(headers, content)
+        monkeypatch.setattr(drive_client, "get_manager", lambda: http)
+        return http
+    return answer
+
+def test_query_upload_offset_reads_the_range_header(session_http):
+    """308 with Range: bytes=0-N means N + 1 bytes are stored"""
+    http = session_http({'status': '308', 'range': 'bytes=0-262143'})
+    assert drive_client.query_upload_offset('https://upload.example/session', 10 * K) == 262144
+    uri, method, headers = http.requests[0]
+    assert method == 'PUT' and headers['Content-Range'] == f'bytes */{10 * K}'
+
+def test_query_upload_offset_without_range_header_is_zero(session_http):
+    """308 without a Range header means Drive has stored nothing yet"""
+    session_http({'status': '308'})
+    assert drive_client.query_upload_offset('https://upload.example/session', K) == 0
+
+def test_query_upload_offset_of_a_finished_upload_returns_the_file(session_http):
+    """200 means the upload completed; its body is the file's metadata"""
+    session_http({'status': '200'}, json.dumps({'id': 'drive-3', 'md5Checksum': 'abc'}).encode())
+    assert drive_client.query_upload_offset('https://upload.example/session', K) == {'id': 'drive-3',
+                                                                                      'md5Checksum': 'abc'}
+
+@pytest.mark.parametrize("status", ['404', '410'])
+def test_query_upload_offset_of_an_expired_session_is_none(session_http, status):
+    """A session Drive no longer knows has to be started again"""
+    session_http({'status': status})
+    assert drive_client.query_upload_offset('https://upload.example/session', K) is None
+
+def test_query_upload_offset_raises_on_other_errors(session_http):
+    """Anything else is an error, not a reason to restart the upload"""
+    session_http({'status': '403'}, b'forbidden')
+    with pytest.raises(HttpError):
+        drive_client.query_upload_offset('https://upload.example/session', K)
+
+class FakeCredentials:
+    """Enough of google.oauth2 Credentials for DriveClientManager: validity, expiry, refresh and JSON"""
+
+    def __init__(self, expires_in, token="token-0"):
+        self.valid = True
+        self.expiry = datetime.utcnow() + timedelta(seconds=expires_in)
+        self.token = token
+        self.refreshes = 0
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    def to_json(self):
+        return json.dumps({'token': self.token})
+
+    def before_request(self, request, method, url, headers):
+        headers['authorization'] = f"Bearer {self.token}"
+
+def manager_with(creds, tmp_path, refresh_margin=300):
+    manager = drive_client.DriveClientManager(token_file=str(tmp_path / "token.json"), refresh_margin=refresh_margin)
+    manager._creds = creds
+    return manager
+
+def test_credentials_refresh_inside_the_margin_and_not_before(tmp_path):
+    """Credentials expiring within refresh_margin are refreshed and saved; later expiries are left alone"""
+    creds = FakeCredentials(expires_in=600)
+    manager = manager_with(creds, tmp_path)
+    assert manager.credentials() is creds
+    assert creds.refreshes == 0 and not (tmp_path / "token.json").exists()
+
+    creds.expiry = datetime.utcnow() + timedelta(seconds=200)
+    assert manager.credentials() is creds
+    assert creds.refreshes == 1
+    assert json.loads((tmp_path / "token.json").read_text()) == {'token': "token-1"}
+
+    creds.valid = False  # Expired or revoked regardless of the clock
+    manager.credentials()
+    assert creds.refreshes == 2
+
+def test_interrupted_token_write_keeps_the_old_token(tmp_path, monkeypatch):
+    """A failure while writing the new token leaves the previous file whole and no temp file behind"""
+    (tmp_path / "token.json").write_text(json.dumps({'token': "old"}))
+    creds = FakeCredentials(expires_in=10)
+    manager = manager_with(creds, tmp_path)
+
+    def crash(fd):
+        raise OSError("disk full")
+    monkeypatch.setattr(drive_client.os, "fsync", crash)
+    with pytest.raises(OSError):
+        manager.credentials()
+    assert json.loads((tmp_path / "token.json").read_text()) == {'token': "old"}
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["token.json"]
+
+def test_each_thread_gets_its_own_transport_sharing_one_credential(tmp_path):
+    """httplib2 connections are per thread, but every thread authorizes with the same credentials"""
+    creds = FakeCredentials(expires_in=3600)
+    manager = manager_with(creds, tmp_path)
+    transports = []
+
+    def grab():
+        transports.append(manager.thread_http())
+        transports.append(manager.thread_http())
+    threads = [threading.Thread(target=grab) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert transports[0] is transports[1] and transports[2] is transports[3]
+    assert transports[0] is not transports[2]
+    assert transports[0].http is not transports[2].http
+    assert transports[0].credentials is creds and transports[2].credentials is creds
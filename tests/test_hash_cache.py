@@ -0,0 +1,76 @@
+"""
+Unit tests for the persistent local hash cache
+"""
+
+import hashlib
+import os
+import hash_cache
+from hash_cache import HashCache, cached_file_hash
+
+def make_file(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return path
+
+def test_unchanged_file_is_not_read_again(tmp_path, monkeypatch):
+    """A second lookup of an unchanged file is answered without hashing it"""
+    cache = HashCache(tmp_path / "cache.sqlite3")
+    path = make_file(tmp_path, "a.bin", b"hello")
+    assert cached_file_hash(path, cache=cache) == hashlib.sha256(b"hello").hexdigest()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("file contents were read")
+    monkeypatch.setattr(hash_cache, "hash_file", fail)
+    assert cached_file_hash(path, cache=cache) == hashlib.sha256(b"hello").hexdigest()
+
+def test_modified_file_is_rehashed(tmp_path):
+    """Changing size or mtime invalidates the cached digest"""
+    cache = HashCache(tmp_path / "cache.sqlite3")
+    path = make_file(tmp_path, "a.bin", b"hello")
+    cached_file_hash(path, cache=cache)
+
+    path.write_bytes(b"HELLO")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert cache.get(path, "sha256") is None
+    assert cached_file_hash(path, cache=cache) == hashlib.sha256(b"HELLO").hexdigest()
+
+def test_change_during_hashing_is_not_cached(tmp_path):
+    """A digest computed from a stat that no longer matches is discarded"""
+    cache = HashCache(tmp_path / "cache.sqlite3")
+    path = make_file(tmp_path, "a.bin", b"hello")
+    _, before = cache.lookup(path, "sha256")
+    path.write_bytes(b"hello, world")
+    assert cache.put(path, "sha256", "stale", before) is False
+    assert len(cache) == 0
+
+def test_lru_eviction_respects_cap(tmp_path):
+    """Beyond max_entries the least recently used digest is dropped"""
+    cache = HashCache(tmp_path / "cache.sqlite3", max_entries=2, evict_every=1)
+    paths = [make_file(tmp_path, f"{i}.bin", bytes([i])) for i in range(3)]
+    cache.put(paths[0], "sha256", "d0")
+    cache.put(paths[1], "sha256", "d1")
+    assert cache.get(paths[0], "sha256") == "d0"  # Touch 0 so 1 is the oldest
+    cache.put(paths[2], "sha256", "d2")
+
+    assert len(cache) == 2
+    assert cache.get(paths[1], "sha256") is None
+    assert cache.get(paths[0], "sha256") == "d0"
+
+def test_eviction_runs_in_batches(tmp_path):
+    """The cache may run over its cap until every evict_every-th put trims it back"""
+    cache = HashCache(tmp_path / "cache.sqlite3", max_entries=2, evict_every=3)
+    paths = [make_file(tmp_path, f"{i}.bin", bytes([i])) for i in range(6)]
+    for i in range(5):
+        cache.put(paths[i], "sha256", f"d{i}")
+    assert len(cache) == 4  # Trimmed at the third put, then two more added
+    cache.put(paths[5], "sha256", "d5")
+    assert len(cache) == 2
+    assert [cache.get(path, "sha256") for path in paths[4:]] == ["d4", "d5"]
+
+def test_bypass_leaves_cache_untouched(tmp_path):
+    """use_cache=False hashes the file and stores nothing"""
+    cache = HashCache(tmp_path / "cache.sqlite3")
+    path = make_file(tmp_path, "a.bin", b"hello")
+    assert cached_file_hash(path, use_cache=False, cache=cache) == hashlib.sha256(b"hello").hexdigest()
+    assert len(cache) == 0
@@ -0,0 +1,113 @@
+"""
+Unit tests for streaming hash helpers
+"""
+
+import hashlib
+import io
+import os
+import pytest
+from hashing import (ALGORITHMS, STRATEGIES, HashingSink, hash_file, hash_stream, new_hash,
+                     parallel_tree_hash, record_algorithm)
+from merkle import TREE_HASH_CHUNK_SIZE, MerkleBuilder, TreeHash
+
+def test_hashing_sink_matches_one_shot_hash():
+    """Chunked writes produce the same digest as hashing the whole payload"""
+    payload = b"decentralized storage " * 1000
+    sink = HashingSink()
+    for start in range(0, len(payload), 333):
+        sink.write(payload[start:start + 333])
+    sink.close()
+
+    assert sink.hexdigest() == hashlib.sha256(payload).hexdigest()
+    assert sink.bytes_written == len(payload)
+    assert sink.bytes_per_sec >= 0
+
+def test_hashing_sink_other_algorithm():
+    """Sink honours the requested algorithm"""
+    sink = HashingSink("md5")
+    sink.write(b"abc")
+    assert sink.hexdigest() == hashlib.md5(b"abc").hexdigest()
+
+@pytest.mark.parametrize("strategy", STRATEGIES)
+@pytest.mark.parametrize("size", [0, 1, 4095, 3 * 1024 + 17])
+def test_hash_file_strategies_agree(tmp_path, strategy, size):
+    """Every strategy produces the one-shot digest, including partial final buffers and empty files"""
+    payload = os.urandom(size)
+    path = tmp_path / "data.bin"
+    path.write_bytes(payload)
+
+    sink = hash_file(path, strategy=strategy, buffer_size=1024, mmap_threshold=2048)
+    assert sink.hexdigest() == hashlib.sha256(payload).hexdigest()
+    assert sink.bytes_written == size
+
+def test_reused_buffer_is_safe_for_observers(tmp_path):
+    """Observers fed from the reusable readinto buffer still see every byte"""
+    payload = os.urandom(10 * 1000)
+    path = tmp_path / "data.bin"
+    path.write_bytes(payload)
+
+    via_buffer = MerkleBuilder(chunk_size=1000)
+    hash_file(path, observers=[via_buffer], strategy="readinto", buffer_size=256)
+    direct = MerkleBuilder(chunk_size=1000)
+    direct.update(payload)
+    assert via_buffer.finish().root == direct.finish().root
+
+def test_hash_stream_without_readinto():
+    """Plain read()-only streams are still supported"""
+    class ReadOnly:
+        def __init__(self, data):
+            self.stream = io.BytesIO(data)
+        def read(self, size):
+            return self.stream.read(size)
+
+    sink = hash_stream(ReadOnly(b"x" * 5000), buffer_size=1024)
+    assert sink.hexdigest() == hashlib.sha256(b"x" * 5000).hexdigest()
+
+def test_hash_file_rejects_unknown_strategy(tmp_path):
+    """Strategy names are validated"""
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"abc")
+    with pytest.raises(ValueError):
+        hash_file(path, strategy="turbo")
+
+@pytest.mark.parametrize("algorithm", sorted(ALGORITHMS))
+def test_registered_algorithms_stream_consistently(algorithm):
+    """Chunked hashing through the sink matches a one-shot digest for every registered algorithm"""
+    payload = os.urandom(3 * 1024 * 1024 + 5)
+    one_shot = new_hash(algorithm)
+    one_shot.update(payload)
+
+    sink = hash_stream(io.BytesIO(payload), algorithm=algorithm, buffer_size=64 * 1024)
+    assert sink.hexdigest() == one_shot.hexdigest()
+
+def test_tree_hash_is_the_merkle_root():
+    """tree-sha256 equals the root of a Merkle tree over the same chunks, and digest() does not finish it"""
+    payload = os.urandom(2 * TREE_HASH_CHUNK_SIZE + 100)
+    tree_hash = new_hash("tree-sha256")
+    tree_hash.update(payload[:10])
+    early = tree_hash.hexdigest()
+    tree_hash.update(payload[10:])
+
+    builder = MerkleBuilder(TREE_HASH_CHUNK_SIZE)
+    builder.update(payload)
+    assert tree_hash.digest() == builder.finish().root
+    assert early != tree_hash.hexdigest()
+
+def test_record_algorithm_defaults_to_sha256():
+    """Records stored before algorithm tags existed are SHA-256"""
+    assert record_algorithm({'hash': 'abc'}) == "sha256"
+    assert record_algorithm({'hash': 'abc', 'algorithm': 'blake2b'}) == "blake2b"
+
+@pytest.mark.parametrize("size", [0, 1000, 10 * 1000 + 7])
+def test_parallel_tree_hash_matches_streaming(tmp_path, size):
+    """Process-pool tree hashing over unaligned regions gives the streaming tree digest and leaves"""
+    payload = os.urandom(size)
+    path = tmp_path / "data.bin"
+    path.write_bytes(payload)
+
+    tree = parallel_tree_hash(path, workers=2, chunk_size=1000, region_size=3000)
+    streamed = TreeHash(chunk_size=1000)
+    streamed.update(payload)
+    assert tree.root == streamed.digest()
+    assert tree.file_size == size
+    assert len(tree.leaves) == max(1, -(-size // 1000))
@@ -0,0 +1,147 @@
+"""
+Offline tests for incremental verification: a FakeChangesFeed, an in-memory
+MongoDB and in-memory Drive contents stand in for the services
+"""
+
+import hashlib
+import pytest
+
+pytest.importorskip("googleapiclient")
+mongomock = pytest.importorskip("mongomock")
+
+from googleapiclient.errors import HttpError
+from pymongo.errors import AutoReconnect
+import drive_client
+import integrity
+import main
+import mongodb_storage
+from changes import SYNC_STATE_KEY, FakeChangesFeed
+from hashing import HashingSink
+
+class Response(dict):
+    def __init__(self, status):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = "error"
+
+class OfflineDrive:
+    """Object contents by Drive ID, served to integrity's download and metadata calls"""
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.contents = {}
+        self.broken = set()  # Drive IDs whose download fails
+
+    def put(self, drive_id, content):
+        self.contents[drive_id] = content
+        self.feed.modify(drive_id, content_md5=hashlib.md5(content).hexdigest(), size=str(len(content)))
+
+    def stream_file_hash(self, service, drive_id, algorithm="sha256", observers=(), size=None, chunk_size=None):
+        if drive_id in self.broken:
+            raise ConnectionError("connection reset")
+        sink = HashingSink(algorithm, observers)
+        sink.write(self.contents[drive_id])
+        sink.close()
+        return sink
+
+    def batch_get_metadata(self, service, drive_ids, fields=None):
+        return {drive_id: dict(self.feed.files[drive_id]) if drive_id in self.feed.files
+                else HttpError(Response(404), b"not found") for drive_id in drive_ids}
+
+@pytest.fixture
+def storage(monkeypatch):
+    # pymongo passes sort= to the bulk builder for updates and replaces; this mongomock release does not take it
+    builder = mongomock.collection.BulkOperationBuilder
+    for name in ("add_update", "add_replace"):
+        method = getattr(builder, name)
+        monkeypatch.setattr(builder, name, lambda self, *args, sort=None, _method=method, **kwargs:
+                            _method(self, *args, **kwargs))
+    monkeypatch.setattr(mongodb_storage, "_client", mongomock.MongoClient())
+    return mongodb_storage.MongoDBStorage()
+
+@pytest.fixture
+def feed():
+    return FakeChangesFeed(page_size=2)
+
+@pytest.fixture
+def drive(monkeypatch, storage, feed):
+    offline = OfflineDrive(feed)
+    monkeypatch.setattr(drive_client, "get_drive_service", lambda: None)
+    monkeypatch.setattr(integrity, "stream_file_hash", offline.stream_file_hash)
+    monkeypatch.setattr(integrity, "batch_get_metadata", offline.batch_get_metadata)
+    for n in range(5):
+        content = f"content {n}".encode()
+        offline.put(f"id-{n}", content)
+        storage.store_file_hash(f"file-{n}", hashlib.sha256(content).hexdigest(), f"id-{n}", len(content),
+                                md5_checksum=hashlib.md5(content).hexdigest())
+    return offline
+
+def record(storage, n):
+    return storage.collection.find_one({"file_name": f"file-{n}"})
+
+def changes_state(storage):
+    return storage.get_sync_state(SYNC_STATE_KEY)
+
+def test_baseline_then_changes_pass(storage, feed, drive):
+    """The first run only snapshots; the next verifies what moved, including removed and failed files"""
+    main.verify_changed_files(workers=2, feed=feed)
+    assert changes_state(storage)['page_token'] == feed.start_page_token()
+    assert all(record(storage, n)['drive_metadata']['md5Checksum'] for n in range(5))
+    assert all(record(storage, n)['verify_count'] == 0 for n in range(5))
+
+    drive.put("id-1", b"tampered")
+    feed.remove("id-2")
+    drive.put("id-3", b"content 3")  # New revision, same bytes, but the download fails
+    drive.broken.add("id-3")
+    feed.touch("id-4", name="renamed")
+    main.verify_changed_files(workers=2, feed=feed)
+
+    assert (record(storage, 1)['last_trust_score'], record(storage, 1)['last_verification_mode']) == (0, "full")
+    removed = record(storage, 2)
+    assert (removed['last_trust_score'], removed['last_verification_mode']) == (0, "changes")
+    assert removed['drive_missing_at'] and removed['drive_metadata'] is None
+    assert record(storage, 3)['verify_count'] == 0
+    assert record(storage, 4)['verify_count'] == 0 and record(storage, 4)['drive_metadata']['name'] == "renamed"
+    assert record(storage, 0)['verify_count'] == 0
+    state = changes_state(storage)
+    assert state['page_token'] == feed.start_page_token()
+    assert state['retry_ids'] == ["id-3"]
+
+    # The failed file is retried on the next run although the feed has nothing new for it
+    drive.broken.clear()
+    main.verify_changed_files(workers=2, feed=feed)
+    assert (record(storage, 3)['verify_count'], record(storage, 3)['last_trust_score']) == (1, 100)
+    assert changes_state(storage)['retry_ids'] == []
+
+def test_removed_file_is_reported_not_intact(storage, feed, drive):
+    """A removal is a tampered result without any download"""
+    main.verify_changed_files(workers=1, feed=feed)
+    feed.remove("id-0")
+    drive.broken.add("id-0")
+    plan = integrity.plan_changes(storage, feed)
+    with mongodb_storage.VerificationResultWriter() as results_writer, \
+            mongodb_storage.DriveMetadataWriter() as metadata_writer:
+        results = list(integrity.incremental_sweep(plan, results_writer, metadata_writer, workers=1))
+    assert [(r['filename'], r['verified'], r['is_intact'], r['mode']) for r in results] == \
+        [("file-0", True, False, "changes")]
+    assert not plan.failed_ids
+
+def test_page_token_only_advances_after_results_are_flushed(storage, feed, drive, monkeypatch):
+    """If results cannot be written, the next run reads the same changes again"""
+    main.verify_changed_files(workers=1, feed=feed)
+    baseline_token = changes_state(storage)['page_token']
+    drive.put("id-0", b"tampered")
+
+    flush = mongodb_storage.VerificationResultWriter.flush
+
+    def lost_connection(self):
+        raise AutoReconnect("connection reset")
+    monkeypatch.setattr(mongodb_storage.VerificationResultWriter, "flush", lost_connection)
+    main.verify_changed_files(workers=1, feed=feed)
+    assert changes_state(storage)['page_token'] == baseline_token
+    assert record(storage, 0)['verify_count'] == 0
+
+    monkeypatch.setattr(mongodb_storage.VerificationResultWriter, "flush", flush)
+    main.verify_changed_files(workers=1, feed=feed)
+    assert changes_state(storage)['page_token'] == feed.start_page_token()
+    assert (record(storage, 0)['verify_count'], record(storage, 0)['last_trust_score']) == (1, 0)
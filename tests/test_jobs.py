@@ -0,0 +1,113 @@
+"""
+Unit tests for the background job queue
+"""
+
+import threading
+import pytest
+from jobs import COMPLETED, FAILED, QUEUED, Job, JobQueue, JobQueueFull, result_bytes
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def wait_done(job, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if job.done:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("job did not finish")
+
+def test_job_reports_progress_and_result():
+    """Progress counts files, outcomes and throughput; the return value becomes the result"""
+    clock = FakeClock()
+    queue = JobQueue(workers=1, max_pending=4, retention_seconds=60, clock=clock)
+    release = threading.Event()
+    seen = threading.Event()
+
+    def run(job):
+        job.add_result({'verified': True, 'is_intact': True, 'mode': 'full', 'file_size': 1000})
+        job.add_result({'verified': True, 'is_intact': False, 'mode': 'sample', 'bytes_downloaded': 500})
+        job.add_result({'verified': False, 'error': 'boom'})
+        clock.now += 3
+        seen.set()
+        release.wait(5)
+        return {'verified_count': 1}
+
+    job = queue.submit('verify-all', run)
+    assert seen.wait(5)
+    progress = queue.get(job.id).to_dict()['progress']
+    assert (progress['files_done'], progress['intact'], progress['tampered'], progress['errors']) == (3, 1, 1, 1)
+    assert progress['bytes_done'] == 1500
+    assert progress['bytes_per_sec'] == 500.0
+
+    release.set()
+    wait_done(job)
+    status = job.to_dict()
+    assert status['status'] == COMPLETED
+    assert status['result'] == {'verified_count': 1}
+    queue.shutdown()
+
+def test_job_keeps_only_a_bounded_list_of_problem_files():
+    """Intact files are only counted, and tampered or failed files beyond max_reported only add to a count"""
+    job = Job('verify-all', max_reported=2)
+    for i in range(1000):
+        job.add_result({'filename': f"ok-{i}", 'verified': True, 'is_intact': True})
+    job.add_result({'filename': "bad-1", 'verified': True, 'is_intact': False, 'trust_score': 0})
+    job.add_result({'filename': "err-1", 'verified': False, 'error': 'boom'})
+    job.add_result({'filename': "bad-2", 'verified': True, 'is_intact': False, 'trust_score': 0})
+    problems, unreported = job.reported_problems()
+    assert [result['filename'] for result in problems] == ["bad-1", "err-1"]
+    assert unreported == 1
+    assert job.to_dict()['progress']['files_done'] == 1003
+
+def test_failed_job_keeps_the_error():
+    """An exception fails the job with its message"""
+    queue = JobQueue(workers=1)
+    job = queue.submit('verify-all', lambda job: 1 / 0)
+    wait_done(job)
+    assert job.status == FAILED
+    assert 'division' in job.to_dict()['error']
+    queue.shutdown()
+
+def test_finished_jobs_expire_after_retention():
+    """A finished job can be fetched until its retention runs out"""
+    clock = FakeClock()
+    queue = JobQueue(workers=1, retention_seconds=60, clock=clock)
+    job = queue.submit('verify-all', lambda job: 'done')
+    wait_done(job)
+    clock.now += 59
+    assert queue.get(job.id) is job
+    clock.now += 2
+    assert queue.get(job.id) is None
+    assert queue.get('no-such-job') is None
+    queue.shutdown()
+
+def test_queue_refuses_jobs_beyond_max_pending():
+    """Only max_pending jobs may wait for a busy worker"""
+    queue = JobQueue(workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block(job):
+        started.set()
+        release.wait(5)
+
+    running = queue.submit('verify-all', block)
+    assert started.wait(5)
+    waiting = queue.submit('verify-all', block)
+    assert waiting.status == QUEUED
+    with pytest.raises(JobQueueFull):
+        queue.submit('verify-all', block)
+    release.set()
+    wait_done(running)
+    wait_done(waiting)
+    queue.shutdown()
+
+def test_result_bytes():
+    """Only downloaded bytes count toward throughput"""
+    assert result_bytes({'mode': 'full', 'file_size': 10}) == 10
+    assert result_bytes({'mode': 'sample', 'file_size': 10, 'bytes_downloaded': 4}) == 4
+    assert result_bytes({'mode': 'fast', 'file_size': 10}) == 0
@@ -0,0 +1,224 @@
+"""
+Unit tests for distributed verification leases
+"""
+
+import multiprocessing
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from multiprocessing.managers import BaseManager
+from types import SimpleNamespace
+from leases import LeaseManager, leased_sweep
+
+MISSING = object()
+
+def _get(doc, path):
+    for key in path.split('.'):
+        if not isinstance(doc, dict) or key not in doc:
+            return MISSING
+        doc = doc[key]
+    return doc
+
+def _matches(doc, query):
+    for key, condition in query.items():
+        if key == '$or':
+            if not any(_matches(doc, option) for option in condition):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(condition, dict) and condition and all(op.startswith('$') for op in condition):
+            for op, arg in condition.items():
+                if op == '$ne' and value == arg:
+                    return False
+                if op == '$lt' and (value is MISSING or value is None or not value < arg):
+                    return False
+                if op == '$nin' and value in arg:
+                    return False
+        elif condition is None:
+            if value is not MISSING and value is not None:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+def _apply(doc, update):
+    for path, value in update.get('$set', {}).items():
+        *parents, leaf = path.split('.')
+        target = doc
+        for key in parents:
+            target = target.setdefault(key, {})
+        target[leaf] = value
+    for path in update.get('$unset', {}):
+        *parents, leaf = path.split('.')
+        target = _get(doc, '.'.join(parents)) if parents else doc
+        if isinstance(target, dict):
+            target.pop(leaf, None)
+
+class FakeFileCollection:
+    """Just enough of a pymongo collection for the lease queries, with each call atomic"""
+
+    def __init__(self, docs):
+        self.docs = [dict(doc) for doc in docs]
+        self.checks = []
+        self._lock = threading.Lock()
+
+    def find_one_and_update(self, query, update, projection=None, sort=None):
+        with self._lock:
+            candidates = [doc for doc in self.docs if _matches(doc, query)]
+            for field, _ in reversed(sort or []):
+                candidates.sort(key=lambda doc: (doc.get(field) is not None, doc.get(field) or ''))
+            if not candidates:
+                return None
+            before = {key: value for key, value in candidates[0].items() if key != 'verify_lease'}
+            _apply(candidates[0], update)
+            return before
+
+    def update_many(self, query, update):
+        with self._lock:
+            matched = [doc for doc in self.docs if _matches(doc, query)]
+            for doc in matched:
+                _apply(doc, update)
+            return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    def update_one(self, query, update):
+        with self._lock:
+            for doc in self.docs:
+                if _matches(doc, query):
+                    _apply(doc, update)
+                    return SimpleNamespace(matched_count=1, modified_count=1)
+            return SimpleNamespace(matched_count=0, modified_count=0)
+
+    def record_check(self, file_name, node_id):
+        with self._lock:
+            self.checks.append((file_name, node_id))
+
+    def get_checks(self):
+        with self._lock:
+            return list(self.checks)
+
+    def get_docs(self):
+        with self._lock:
+            return [dict(doc) for doc in self.docs]
+
+class FakeClock:
+    def __init__(self):
+        self.now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    def __call__(self):
+        return self.now
+
+def make_docs(count):
+    return [{'file_name': f"file-{i:03d}", 'status': 'active', 'file_size': 10,
+             'last_verified': None if i % 3 == 0 else f"2024-01-{1 + i % 28:02d}T00:00:00"} for i in range(count)]
+
+def test_claims_stalest_first_and_never_twice():
+    """Claims go to never-verified then oldest files; a claimed file cannot be claimed again"""
+    files = FakeFileCollection(make_docs(6))
+    clock = FakeClock()
+    a = LeaseManager(files, "a", "r1", lease_seconds=60, clock=clock)
+    b = LeaseManager(files, "b", "r1", lease_seconds=60, clock=clock)
+    first = a.claim_batch(3)
+    assert [doc['last_verified'] for doc in first][:2] == [None, None]
+    second = b.claim_batch(10)
+    assert len(second) == 3
+    assert not {doc['file_name'] for doc in first} & {doc['file_name'] for doc in second}
+    assert a.claim() is None
+
+def test_done_files_are_skipped_until_a_new_round():
+    """A completed file is not claimed again in the same round, but is in the next one"""
+    files = FakeFileCollection(make_docs(2))
+    node = LeaseManager(files, "a", "r1", clock=FakeClock())
+    for record in node.claimed_records():
+        assert node.complete(record['file_name'])
+    assert node.claim() is None
+    assert len(LeaseManager(files, "a", "r2", clock=FakeClock()).claim_batch(10)) == 2
+
+def test_expired_leases_go_to_other_nodes_and_renewal_keeps_them():
+    """A crashed node's leases expire; a live node's renewals hold on to them"""
+    files = FakeFileCollection(make_docs(2))
+    clock = FakeClock()
+    crashed = LeaseManager(files, "crashed", "r1", lease_seconds=60, clock=clock)
+    alive = LeaseManager(files, "alive", "r1", lease_seconds=60, clock=clock)
+    other = LeaseManager(files, "other", "r1", lease_seconds=60, clock=clock)
+    lost = crashed.claim()
+    kept = alive.claim()
+
+    clock.now += timedelta(seconds=45)
+    assert alive.renew() == 1
+    clock.now += timedelta(seconds=30)
+    taken = other.claim()
+    assert taken['file_name'] == lost['file_name']
+    assert other.claim() is None  # The renewed lease is still live
+
+    assert not crashed.complete(lost['file_name'])
+    assert crashed.lost == 1
+    assert alive.complete(kept['file_name'])
+
+def test_release_returns_unfinished_files():
+    """Leaving keep_alive releases leases that were not completed"""
+    files = FakeFileCollection(make_docs(3))
+    clock = FakeClock()
+    node = LeaseManager(files, "a", "r1", clock=clock)
+    with node.keep_alive(interval=60):
+        node.claim_batch(2)
+    assert not any('verify_lease' in doc for doc in files.get_docs())
+    assert len(LeaseManager(files, "b", "r1", clock=clock).claim_batch(10)) == 3
+
+def test_failed_verifications_are_released_not_completed():
+    """A file that could not be verified is left for other nodes instead of being marked done for the round"""
+    files = FakeFileCollection(make_docs(4))
+    node = LeaseManager(files, "a", "r1", clock=FakeClock())
+
+    def verify_one(record):
+        if record['file_name'] == "file-001":
+            return {'filename': record['file_name'], 'verified': False, 'error': "Drive returned 500"}
+        return {'filename': record['file_name'], 'verified': True, 'is_intact': True, 'trust_score': 100}
+
+    results = list(leased_sweep(node, verify_one, workers=2, batch_size=2))
+    assert sorted(result['filename'] for result in results) == [f"file-{i:03d}" for i in range(4)]
+    assert not any(result.get('lease_lost') for result in results)
+    assert node.stats()['completed'] == 3 and node.stats()['released'] == 1
+
+    failed = next(doc for doc in files.get_docs() if doc['file_name'] == "file-001")
+    assert 'verified_round' not in failed and 'verify_lease' not in failed
+    assert [record['file_name'] for record in LeaseManager(files, "b", "r1", clock=FakeClock()).claim_batch(10)] == \
+        ["file-001"]
+
+class LeaseTestManager(BaseManager):
+    pass
+
+LeaseTestManager.register('Files', FakeFileCollection)
+
+def run_node(files, node_id):
+    leases = LeaseManager(files, node_id, "round-1", lease_seconds=0.5)
+
+    def verify_one(record):
+        files.record_check(record['file_name'], node_id)
+        time.sleep(0.02)
+        return {'filename': record['file_name'], 'verified': True, 'is_intact': True, 'trust_score': 100}
+
+    for _ in leased_sweep(leases, verify_one, workers=2, batch_size=4):
+        pass
+
+def test_nodes_in_separate_processes_never_verify_a_file_twice():
+    """Four processes sharing one collection verify every file exactly once between them"""
+    context = multiprocessing.get_context("fork")
+    manager = LeaseTestManager(ctx=context)
+    manager.start()
+    try:
+        docs = make_docs(80)
+        files = manager.Files(docs)
+        nodes = [context.Process(target=run_node, args=(files, f"node-{i}")) for i in range(4)]
+        for node in nodes:
+            node.start()
+        for node in nodes:
+            node.join(60)
+            assert node.exitcode == 0
+
+        checks = files.get_checks()
+        checked = [file_name for file_name, _ in checks]
+        assert sorted(checked) == sorted(doc['file_name'] for doc in docs)
+        assert len({node_id for _, node_id in checks}) > 1
+        assert all(doc.get('verified_round') == "round-1" and 'verify_lease' not in doc for doc in files.get_docs())
+    finally:
+        manager.shutdown()
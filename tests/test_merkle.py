@@ -0,0 +1,53 @@
+"""
+Unit tests for Merkle chunk trees
+"""
+
+import os
+import pytest
+from merkle import (MerkleBuilder, MerkleTree, chunk_ranges, diff_leaves, hash_leaf,
+                    merkle_root, parse_chunk_spec)
+
+def build(data, chunk_size=16, step=7):
+    """Feed data to a builder in uneven pieces"""
+    builder = MerkleBuilder(chunk_size)
+    for start in range(0, len(data), step):
+        builder.update(data[start:start + step])
+    return builder.finish()
+
+def test_leaves_do_not_depend_on_write_sizes():
+    """Chunk leaves come out the same however the stream is split"""
+    data = os.urandom(100)
+    tree = build(data, step=7)
+    assert tree.leaves == build(data, step=50).leaves
+    assert len(tree.leaves) == 7
+    assert tree.leaves[0] == hash_leaf(data[:16])
+    assert tree.leaves[-1] == hash_leaf(data[96:])
+
+def test_document_round_trip():
+    """Packed leaves are restored and checked against the root"""
+    tree = build(os.urandom(40))
+    doc = tree.to_document()
+    restored = MerkleTree.from_document(doc)
+    assert restored.leaves == tree.leaves
+    assert restored.root == merkle_root(tree.leaves)
+
+    doc['root'] = "00" * 32
+    with pytest.raises(ValueError):
+        MerkleTree.from_document(doc)
+
+def test_tampering_is_localized_to_byte_ranges():
+    """A modified byte and an appended tail map to the chunks that changed"""
+    original = bytearray(os.urandom(64))
+    tampered = bytearray(original)
+    tampered[20] ^= 0xFF
+    tampered += b"extra"
+
+    expected, actual = build(bytes(original)), build(bytes(tampered))
+    chunks = diff_leaves(expected, actual)
+    assert chunks == [1, 4]
+    assert chunk_ranges(chunks, 16, len(tampered)) == [(16, 31), (64, 68)]
+    assert chunk_ranges([0, 1, 3], 16, 64) == [(0, 31), (48, 63)]
+
+def test_parse_chunk_spec():
+    """Chunk selections accept lists and ranges"""
+    assert parse_chunk_spec("3, 0,5-7") == [0, 3, 5, 6, 7]
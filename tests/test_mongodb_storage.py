@@ -0,0 +1,172 @@
+"""
+Unit tests for the MongoDB connection pool, indexes and bulk writers, against an in-memory MongoDB
+"""
+
+import threading
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from pymongo import InsertOne
+from pymongo.errors import AutoReconnect, DuplicateKeyError
+import mongodb_storage
+from verifier import compare_drive_checksums
+from mongodb_storage import BulkWriter, DriveMetadataWriter, FileRecordWriter, VerificationResultWriter
+
+@pytest.fixture
+def storage(monkeypatch):
+    # pymongo passes sort= to the bulk builder for updates and replaces; this mongomock release does not take it
+    builder = mongomock.collection.BulkOperationBuilder
+    for name in ("add_update", "add_replace"):
+        method = getattr(builder, name)
+        monkeypatch.setattr(builder, name, lambda self, *args, sort=None, _method=method, **kwargs:
+                            _method(self, *args, **kwargs))
+    monkeypatch.setattr(mongodb_storage, "_client", mongomock.MongoClient())
+    storage = mongodb_storage.MongoDBStorage()
+    for name in ("a", "b", "c"):
+        storage.collection.insert_one(mongodb_storage.file_document(name, "00", "drive-" + name, 1))
+    return storage
+
+def test_promoting_a_digest_keeps_the_sha256_for_fast_checks(storage):
+    """After switching a record to a new primary digest, Drive's sha256Checksum is still comparable"""
+    storage.add_digest("a", "blake2b", "b2", promote_from=("sha256", "00"))
+    record = storage.collection.find_one({"file_name": "a"})
+    assert (record["hash"], record["algorithm"], record["digests"], record["sha256_checksum"]) == \
+        ("b2", "blake2b", {"sha256": "00"}, "00")
+    assert compare_drive_checksums(record, {"sha256Checksum": "00", "size": "1"}) is True
+    assert compare_drive_checksums(record, {"sha256Checksum": "ff", "size": "1"}) is False
+
+class FlakyCollection:
+    """Delegates to a collection, but the first `failures` bulk writes lose the connection"""
+
+    def __init__(self, collection, failures=1):
+        self.collection = collection
+        self.failures = failures
+
+    def bulk_write(self, ops, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("connection reset")
+        return self.collection.bulk_write(ops, ordered=ordered)
+
+def verify_count(storage, name):
+    return storage.collection.find_one({"file_name": name})["verify_count"]
+
+def test_flushes_when_the_batch_is_full(storage):
+    """Queuing max_batch operations writes them at once; the rest wait for the next flush"""
+    writer = VerificationResultWriter(storage.collection, max_batch=2, max_interval=60)
+    writer.record("a", "verified", 100.0)
+    assert verify_count(storage, "a") == 0
+    writer.record("b", "verified", 100.0)
+    assert (verify_count(storage, "a"), verify_count(storage, "b")) == (1, 1)
+    writer.record("c", "verified", 100.0)
+    assert verify_count(storage, "c") == 0
+    writer.close()
+    assert verify_count(storage, "c") == 1
+    assert writer.written_count == 3
+
+def test_flushes_on_the_timer(storage):
+    """A partial batch is written once max_interval passes"""
+    writer = VerificationResultWriter(storage.collection, max_batch=100, max_interval=0.02)
+    try:
+        writer.record("a", "verified", 100.0, mode="fast")
+        for _ in range(200):
+            if verify_count(storage, "a") == 1:
+                break
+            threading.Event().wait(0.01)
+        assert verify_count(storage, "a") == 1
+        assert storage.collection.find_one({"file_name": "a"})["last_verification_mode"] == "fast"
+    finally:
+        writer.close()
+
+def test_failed_batch_is_kept_for_the_next_flush(storage):
+    """A connection error re-queues the batch instead of dropping it"""
+    writer = VerificationResultWriter(FlakyCollection(storage.collection), max_batch=100, max_interval=60)
+    writer.record("a", "verified", 100.0)
+    writer.record("b", "verified", 100.0)
+    with pytest.raises(AutoReconnect):
+        writer.flush()
+    assert verify_count(storage, "a") == 0
+    assert writer.flush() == 2
+    assert (verify_count(storage, "a"), verify_count(storage, "b")) == (1, 1)
+    writer.close()
+
+def test_partial_bulk_failure_counts_written_and_failed(storage):
+    """Operations that fail inside a bulk write are counted, and the others are still written"""
+    storage.collection.create_index("file_name", unique=True)
+    writer = BulkWriter(storage.collection, max_batch=100, max_interval=60)
+    writer.queue(InsertOne(mongodb_storage.file_document("d", "00", "drive-d", 1)))
+    writer.queue(InsertOne(mongodb_storage.file_document("a", "00", "drive-a2", 1)))  # Duplicate name
+    writer.close()
+    assert (writer.written_count, writer.failed_count) == (1, 1)
+    assert storage.collection.find_one({"file_name": "d"}) is not None
+    assert storage.collection.find_one({"file_name": "a"})["drive_id"] == "drive-a"
+
+def test_exit_flushes_even_when_the_body_raises(storage):
+    """Leaving the with block writes what was buffered, whether or not the body failed"""
+    with pytest.raises(RuntimeError):
+        with FileRecordWriter(storage.collection, max_batch=100, max_interval=60) as writer:
+            writer.add(mongodb_storage.file_document("d", "11", "drive-d", 2))
+            writer.add(mongodb_storage.file_document("a", "22", "drive-a2", 3))
+            raise RuntimeError("upload failed")
+    assert storage.collection.find_one({"file_name": "d"})["hash"] == "11"
+    assert storage.collection.find_one({"file_name": "a"})["drive_id"] == "drive-a2"
+    assert writer.written_count == 2
+
+def test_drive_metadata_writer_marks_missing_objects(storage):
+    """A snapshot is stored for present objects; None marks the object missing until it is seen again"""
+    with DriveMetadataWriter(storage.collection, max_interval=60) as writer:
+        writer.record("a", None)
+    assert storage.collection.find_one({"file_name": "a"})["drive_missing_at"]
+    with DriveMetadataWriter(storage.collection, max_interval=60) as writer:
+        writer.record("a", {'md5Checksum': "ff"})
+    record = storage.collection.find_one({"file_name": "a"})
+    assert record["drive_metadata"] == {'md5Checksum': "ff"}
+    assert "drive_missing_at" not in record
+
+@pytest.fixture
+def connections(monkeypatch):
+    """MongoClient constructions, each returning a fresh in-memory client"""
+    made = []
+
+    def connect(*args, **kwargs):
+        made.append(kwargs)
+        return mongomock.MongoClient()
+    monkeypatch.setattr(mongodb_storage, "MongoClient", connect)
+    monkeypatch.setattr(mongodb_storage, "_client", None)
+    return made
+
+def test_storages_share_one_pooled_client(connections):
+    """Every MongoDBStorage, from any thread, binds to the same client; close_client lets the next one reconnect"""
+    storages = []
+    threads = [threading.Thread(target=lambda: storages.append(mongodb_storage.MongoDBStorage())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    storages.append(mongodb_storage.MongoDBStorage())
+    assert len(connections) == 1
+    assert connections[0]['maxPoolSize'] == mongodb_storage.MAX_POOL_SIZE
+    assert all(storage.client is storages[0].client for storage in storages)
+
+    storages[0].close_connection()  # Releasing a handle keeps the pool
+    assert mongodb_storage.get_client() is storages[0].client
+    mongodb_storage.close_client()
+    assert mongodb_storage.MongoDBStorage().client is not storages[0].client
+    assert len(connections) == 2
+
+def test_ensure_indexes_creates_the_query_indexes_once(connections):
+    """Unique file names, hash and last_verified indexes; running it again changes nothing"""
+    mongodb_storage.ensure_indexes()
+    collection = mongodb_storage.MongoDBStorage().collection
+    indexes = collection.index_information()
+    assert indexes["file_name_1"]["unique"]
+    assert indexes["hash_1"]["key"] == [("hash", 1)]
+    assert indexes["status_1_last_verified_1"]["key"] == [("status", 1), ("last_verified", 1)]
+    assert indexes["drive_id_1"]["key"] == [("drive_id", 1)]
+
+    mongodb_storage.ensure_indexes()
+    assert collection.index_information() == indexes
+    collection.insert_one(mongodb_storage.file_document("a", "00", "drive-a", 1))
+    with pytest.raises(DuplicateKeyError):
+        collection.insert_one(mongodb_storage.file_document("a", "11", "drive-b", 1))
@@ -0,0 +1,87 @@
+"""
+Unit tests for the bulk upload pipeline
+"""
+
+import threading
+import pytest
+from pipeline import TransferProgress, iter_files, run_pipeline
+
+def make_tree(root, paths):
+    for rel_path in paths:
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(rel_path.encode())
+
+def test_iter_files_applies_globs(tmp_path):
+    """Include and exclude globs match relative paths, and excluded directories are pruned"""
+    make_tree(tmp_path, ["a.csv", "b.txt", "sub/c.csv", "sub/deep/d.csv", "skip/e.csv"])
+
+    found = [rel for _, rel in iter_files(tmp_path, include=["*.csv"], exclude=["skip", "sub/deep/*"])]
+    assert found == ["a.csv", "sub/c.csv"]
+    assert len(list(iter_files(tmp_path))) == 5
+
+def test_pipeline_runs_every_item_through_both_stages():
+    """Each item's first-stage value reaches the second stage"""
+    results = list(run_pipeline(range(50), lambda n: n * 2, lambda n, doubled: (n, doubled + 1),
+                                first_workers=3, second_workers=4, on_error=lambda n, e: (n, 'error')))
+    assert sorted(results) == [(n, n * 2 + 1) for n in range(50)]
+
+def test_pipeline_reports_errors_per_item():
+    """A failure in either stage becomes that item's result and the rest carry on"""
+    def first(n):
+        if n == 3:
+            raise ValueError("unreadable")
+        return n
+
+    def second(n, value):
+        if n == 5:
+            raise IOError("upload failed")
+        return n, 'ok'
+
+    results = dict(run_pipeline(range(8), first, second, 2, 2, on_error=lambda n, e: (n, str(e))))
+    assert results[3] == "unreadable"
+    assert results[5] == "upload failed"
+    assert sum(1 for value in results.values() if value == 'ok') == 6
+
+def test_pipeline_stages_overlap():
+    """Uploads start while other files are still being hashed"""
+    second_started = threading.Event()
+
+    def first(n):
+        if n > 0:
+            assert second_started.wait(5), "second stage never started while the first was busy"
+        return n
+
+    def second(n, value):
+        second_started.set()
+        return n
+
+    assert sorted(run_pipeline(range(4), first, second, 1, 1, on_error=lambda n, e: pytest.fail(str(e)))) == [0, 1, 2, 3]
+
+def test_closing_pipeline_early_stops_workers():
+    """Abandoning the results stops the feeder instead of hanging"""
+    fed = []
+
+    def items():
+        for n in range(10000):
+            fed.append(n)
+            yield n
+
+    results = run_pipeline(items(), lambda n: n, lambda n, v: n, 2, 2, on_error=lambda n, e: None)
+    next(results)
+    results.close()
+    assert len(fed) < 10000
+
+def test_transfer_progress_counts():
+    """Skipped, completed, deduplicated and failed files are tallied separately; dedup moves no bytes"""
+    progress = TransferProgress()
+    progress.found()
+    progress.found(skipped=True)
+    progress.found()
+    progress.finished(100)
+    progress.finished(failed=True)
+    progress.finished(50, deduplicated=True)
+    snapshot = progress.to_dict()
+    assert (snapshot['discovered'], snapshot['skipped'], snapshot['completed'], snapshot['failed']) == (3, 1, 2, 1)
+    assert snapshot['deduplicated'] == 1
+    assert snapshot['bytes_done'] == 100
@@ -0,0 +1,134 @@
+"""
+Unit tests for the Drive rate limiter and retry policy
+"""
+
+import threading
+import time
+import pytest
+from rate_limit import THROTTLE, TRANSIENT, RateLimiter, RetryPolicy, TokenBucket
+
+class FakeClock:
+    """Clock whose sleep() just advances time"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class Throttled(Exception):
+    pass
+
+class Broken(Exception):
+    pass
+
+def classify(error):
+    return {Throttled: THROTTLE, ConnectionError: TRANSIENT}.get(type(error))
+
+def flaky(failures):
+    """A call that raises each exception in `failures` once, then succeeds"""
+    failures = list(failures)
+    def call():
+        if failures:
+            raise failures.pop(0)
+        return "ok"
+    return call
+
+def make_limiter(clock, **kwargs):
+    kwargs.setdefault('retry_policy', RetryPolicy(max_retries=3, base_delay=1.0, max_delay=8.0))
+    return RateLimiter(classify=classify, sleep=clock.sleep, clock=clock, **kwargs)
+
+def test_token_bucket_holds_calls_to_the_rate():
+    """After the burst, calls are spaced 1/rate apart"""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=4, burst=2, clock=clock, sleep=clock.sleep)
+    for _ in range(10):
+        bucket.acquire()
+    assert clock.now == pytest.approx(8 / 4)
+
+def test_token_bucket_allows_requests_larger_than_the_burst():
+    """A batch costing more than the burst goes through and the debt delays the next caller"""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, burst=5, clock=clock, sleep=clock.sleep)
+    assert bucket.acquire(25) == 0
+    bucket.acquire()
+    assert clock.now == pytest.approx(2.1)
+
+def test_retry_delays_grow_exponentially_with_jitter():
+    """Delays stay within [0, min(max, base * 2**n)] and honour Retry-After"""
+    class Top:
+        def uniform(self, low, high):
+            return high
+    policy = RetryPolicy(max_retries=5, base_delay=0.5, max_delay=4.0, rng=Top())
+    assert [policy.delay(n) for n in range(5)] == [0.5, 1.0, 2.0, 4.0, 4.0]
+    assert policy.delay(0, retry_after=3.0) == 3.0
+    assert 0 <= RetryPolicy(base_delay=1.0).delay(3) <= 8.0
+
+def test_throttles_and_transient_errors_are_retried_and_counted():
+    """The call succeeds after retries, and the counters say why"""
+    clock = FakeClock()
+    limiter = make_limiter(clock, rate=100, burst=100)
+    assert limiter.call(flaky([Throttled(), ConnectionError()])) == "ok"
+    stats = limiter.stats()
+    assert (stats['calls'], stats['throttled'], stats['retries'], stats['failures']) == (3, 1, 2, 0)
+
+def test_permanent_errors_and_exhausted_retries_are_raised():
+    """Unclassified errors fail at once; retriable ones give up after max_retries"""
+    clock = FakeClock()
+    limiter = make_limiter(clock, rate=100, burst=100)
+    with pytest.raises(Broken):
+        limiter.call(flaky([Broken()]))
+    with pytest.raises(Throttled):
+        limiter.call(flaky([Throttled()] * 10))
+    stats = limiter.stats()
+    assert stats['calls'] == 1 + 4
+    assert stats['retries'] == 3
+    assert stats['failures'] == 2
+
+def test_throttling_lowers_the_rate_until_calls_succeed_again():
+    """A throttle halves the bucket rate; successes restore it gradually"""
+    clock = FakeClock()
+    limiter = make_limiter(clock, rate=10, burst=10)
+    limiter.call(flaky([Throttled()]))
+    assert limiter.bucket.rate == pytest.approx(10 * 0.5 + 10 * 0.05)
+    for _ in range(20):
+        limiter.call(lambda: None)
+    assert limiter.bucket.rate == pytest.approx(10)
+
+def test_concurrency_is_bounded():
+    """No more than `concurrency` calls run at once"""
+    limiter = RateLimiter(rate=1000, burst=1000, concurrency=3)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    threads = [threading.Thread(target=limiter.call, args=(slow,)) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 3
+    assert limiter.stats()['calls'] == 12
+
+def test_batch_item_failures_share_the_retry_budget():
+    """should_retry counts failures reported outside call() (e.g. inside a batch) and stops at max_retries"""
+    clock = FakeClock()
+    limiter = make_limiter(clock, rate=10, burst=10)
+    assert [limiter.should_retry(Throttled(), n) for n in range(4)] == [True, True, True, False]
+    assert limiter.should_retry(Broken(), 0) is False
+    limiter.backoff(2)
+    assert 0 <= clock.sleeps[-1] <= 4.0
+    stats = limiter.stats()
+    assert (stats['throttled'], stats['retries'], stats['failures']) == (4, 3, 2)
@@ -0,0 +1,39 @@
+"""
+Unit tests for spot-check sample planning
+"""
+
+import random
+import pytest
+from sampling import SamplePolicy, detection_probability, samples_for_confidence, tampered_chunk_count
+
+def test_detection_probability_bounds():
+    """Zero samples detect nothing; sampling past the clean chunks always detects"""
+    assert detection_probability(100, 1, 0) == 0.0
+    assert detection_probability(100, 10, 91) == 1.0
+    assert detection_probability(100, 1, 50) == pytest.approx(0.5)
+
+def test_samples_for_confidence_is_minimal():
+    """The chosen sample size reaches the target and one fewer does not"""
+    bad = tampered_chunk_count(10000, 0.01)
+    needed = samples_for_confidence(10000, bad, 0.99)
+    assert detection_probability(10000, bad, needed) >= 0.99
+    assert detection_probability(10000, bad, needed - 1) < 0.99
+    assert needed < 500
+
+def test_policy_respects_budget():
+    """A tight byte budget caps the sample and reports the confidence actually achieved"""
+    rng = random.Random(7)
+    generous = SamplePolicy(0.99, 0.01, budget_bytes=1024 * 1024 * 1024).plan(10000, 1024 * 1024, rng)
+    assert not generous.budget_limited
+    assert generous.confidence >= 0.99
+
+    tight = SamplePolicy(0.99, 0.01, budget_bytes=10 * 1024 * 1024).plan(10000, 1024 * 1024, rng)
+    assert tight.budget_limited
+    assert len(tight.indices) == 10
+    assert len(set(tight.indices)) == 10
+    assert tight.confidence < 0.99
+
+def test_policy_validates_inputs():
+    """Confidence must be a probability"""
+    with pytest.raises(ValueError):
+        SamplePolicy(confidence=1.5)
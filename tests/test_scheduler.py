@@ -0,0 +1,127 @@
+"""
+Unit tests for the continuous verification scheduler and daemon
+"""
+
+import threading
+from datetime import datetime
+from scheduler import VerificationScheduler, VerifyDaemon, SPREAD
+
+DAY = 24 * 3600
+SLA = 7 * DAY
+GB = 1024 ** 3
+
+class FakeClock:
+    def __init__(self, now=1_000_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def iso(seconds):
+    return datetime.fromtimestamp(seconds).isoformat()
+
+def record(name, last_verified=None, size=1024, score=None, risk=None):
+    return {'file_name': name, 'file_size': size, 'last_verified': last_verified,
+            'last_trust_score': score, 'risk_weight': risk}
+
+def make_scheduler(clock):
+    return VerificationScheduler(sla_seconds=SLA, large_file_size=GB, low_trust_boost=3.0, retry_seconds=600,
+                                 clock=clock)
+
+def test_intervals_never_exceed_sla_and_shrink_with_risk():
+    """Risk weight, a low trust score and size all shorten the interval; none exceeds the SLA"""
+    scheduler = make_scheduler(FakeClock())
+    plain = scheduler.interval(record("plain", score=100))
+    assert plain <= SLA
+    assert scheduler.interval(record("risky", score=100, risk=4)) < plain
+    assert scheduler.interval(record("suspect", score=40)) < plain
+    assert scheduler.interval(record("large", size=5 * GB, score=100)) < plain
+    assert scheduler.interval(record("low", score=100, risk=0.1)) == SLA
+
+def test_due_time_is_spread_within_the_interval():
+    """Files verified at the same moment come due at different times, all within the interval"""
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    verified = clock.now - DAY
+    dues = {scheduler.due_at(record(f"f{i}", iso(verified), score=100)) for i in range(50)}
+    interval = scheduler.interval(record("f0", score=100))
+    assert len(dues) == 50
+    assert all(verified + interval * (1 - SPREAD) <= due <= verified + interval for due in dues)
+    assert scheduler.due_at(record("never")) == clock.now
+
+def test_pop_due_takes_most_overdue_first():
+    """Never-verified and long-overdue files come out first; files not yet due stay queued"""
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.sync([
+        record("recent", iso(clock.now - DAY), score=100),
+        record("stale", iso(clock.now - 30 * DAY), score=100),
+        record("older", iso(clock.now - 10 * DAY), score=100),
+    ])
+    assert scheduler.pop_due()['file_name'] == "stale"
+    assert scheduler.pop_due()['file_name'] == "older"
+    assert scheduler.pop_due() is None
+    assert 0 < scheduler.seconds_until_next_due() <= SLA - DAY
+
+def test_complete_reschedules_and_retries_failures_soon():
+    """A verified file moves a full interval out; a failed check comes back after retry_seconds"""
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    scheduler.sync([record("a", score=100), record("b", score=100)])
+    first, second = scheduler.pop_due(), scheduler.pop_due()
+    scheduler.complete(first['file_name'], {'verified': True, 'is_intact': True, 'trust_score': 100})
+    scheduler.complete(second['file_name'], {'verified': False, 'error': "timeout"})
+    assert scheduler.seconds_until_next_due() == 600
+    clock.now += 600
+    assert scheduler.pop_due()['file_name'] == second['file_name']
+    assert scheduler.pop_due() is None
+
+def test_sync_adds_removes_and_keeps_newer_results():
+    """Reloading picks up new and deleted files without losing results not yet stored"""
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    assert scheduler.sync([record("a"), record("b")]) == (2, 0)
+    scheduler.complete(scheduler.pop_due()['file_name'], {'verified': True, 'trust_score': 100})
+    assert scheduler.sync([record("a"), record("c")]) == (1, 1)
+    assert len(scheduler) == 2
+    # "a" was just verified in memory even though the reload still says never-verified
+    assert scheduler.pop_due()['file_name'] == "c"
+    assert scheduler.pop_due() is None
+
+def test_required_rate_and_overdue_count():
+    """required_rate sums 1/interval over files; overdue counts files past the SLA"""
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    records = [record(f"f{i}", iso(clock.now - 8 * DAY) if i % 2 else None, score=100) for i in range(10)]
+    scheduler.sync(records)
+    expected = sum(1 / scheduler.interval(r) for r in records)
+    assert abs(scheduler.required_rate() - expected) < 1e-12
+    assert scheduler.overdue_count() == 10
+
+def test_daemon_verifies_each_due_file_once():
+    """The daemon checks every due file exactly once, then idles until stopped"""
+    scheduler = VerificationScheduler(sla_seconds=SLA)
+    records = [record(f"f{i}") for i in range(12)]
+    checked = []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def verify_one(rec):
+        with lock:
+            checked.append(rec['file_name'])
+            if len(checked) == len(records):
+                done.set()
+        return {'filename': rec['file_name'], 'verified': True, 'is_intact': rec['file_name'] != "f3",
+                'trust_score': 100}
+
+    daemon = VerifyDaemon(scheduler, verify_one, lambda: records, rate=1000, workers=3, reload_seconds=60)
+    runner = threading.Thread(target=daemon.run)
+    runner.start()
+    assert done.wait(10)
+    daemon.stop()
+    runner.join(10)
+    assert not runner.is_alive()
+    assert sorted(checked) == sorted(r['file_name'] for r in records)
+    status = daemon.status()
+    assert (status['checked'], status['intact'], status['tampered'], status['errors']) == (12, 11, 1, 0)
+    assert status['overdue'] == 0
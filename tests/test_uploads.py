@@ -0,0 +1,346 @@
+"""
+Unit tests for upload decisions, deduplication and reference-counted deletes,
+against an in-memory MongoDB and a fake Drive
+"""
+
+import hashlib
+import os
+import pytest
+
+pytest.importorskip("googleapiclient")
+mongomock = pytest.importorskip("mongomock")
+
+from googleapiclient.errors import HttpError
+import drive_client
+import hash_cache
+import mongodb_storage
+import uploads
+from hash_cache import HashCache
+from pipeline import TransferProgress
+
+class Response(dict):
+    def __init__(self, status):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = "error"
+
+class FakeDrive:
+    """Drive objects by id, with files().get(...) and files().delete(...) like the API client"""
+
+    def __init__(self):
+        self.objects = {}
+        self.deleted = []
+
+    def files(self):
+        return self
+
+    def _call(self, fn):
+        return type("Request", (), {"execute": staticmethod(fn)})()
+
+    def _lookup(self, fileId):
+        if fileId not in self.objects:
+            raise HttpError(Response(404), b"not found")
+        return self.objects[fileId]
+
+    def get(self, fileId, fields=None):
+        return self._call(lambda: dict(self._lookup(fileId)))
+
+    def delete(self, fileId):
+        def run():
+            self._lookup(fileId)
+            del self.objects[fileId]
+            self.deleted.append(fileId)
+        return self._call(run)
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setattr(mongodb_storage, "_client", mongomock.MongoClient())
+    return mongodb_storage.MongoDBStorage()
+
+@pytest.fixture
+def drive(monkeypatch):
+    fake = FakeDrive()
+    monkeypatch.setattr(drive_client, "get_drive_service", lambda: fake)
+    return fake
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = HashCache(tmp_path / "cache.sqlite3")
+    monkeypatch.setattr(hash_cache, "get_cache", lambda: cache)
+    return cache
+
+@pytest.fixture
+def sent(monkeypatch, storage, drive):
+    """Names uploaded through upload_stream, which is faked to record the file like a real upload"""
+    names = []
+
+    def fake_upload_stream(stream, file_name, size=None, mimetype=None, storage=None, algorithm="sha256"):
+        content = stream.read()
+        names.append(file_name)
+        drive_id = f"drive-{len(names)}"
+        drive.objects[drive_id] = {'id': drive_id, 'size': str(len(content)),
+                                   'md5Checksum': hashlib.md5(content).hexdigest()}
+        storage.store_file_hash(file_name, hashlib.sha256(content).hexdigest(), drive_id, len(content),
+                                md5_checksum=hashlib.md5(content).hexdigest())
+        return dict(uploads._unchanged_details(storage.get_file_hash(file_name)), skipped=False)
+    monkeypatch.setattr(uploads, "upload_stream", fake_upload_stream)
+    return names
+
+def upload(path, storage, **options):
+    return uploads.upload_file(str(path), storage=storage, hash_workers=1, use_cache=True, **options)
+
+def test_unchanged_file_is_uploaded_again_by_default(tmp_path, storage, drive, cache, sent):
+    """Re-uploading an unchanged file sends it, e.g. to repair a tampered Drive copy"""
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+    upload(path, storage)
+    drive.objects["drive-1"]['md5Checksum'] = "0" * 32  # Tampered on Drive
+    details = upload(path, storage)
+    assert not details['skipped']
+    assert sent == ["a.txt", "a.txt"]
+
+def test_skip_unchanged_only_when_drive_copy_matches(tmp_path, storage, drive, cache, sent):
+    """skip_unchanged skips an intact upload but not one whose Drive object is gone"""
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"hello")
+    upload(path, storage)
+    assert upload(path, storage, skip_unchanged=True)['skipped']
+    assert sent == ["a.txt"]
+
+    del drive.objects["drive-1"]
+    assert not upload(path, storage, skip_unchanged=True)['skipped']
+    assert sent == ["a.txt", "a.txt"]
+
+@pytest.fixture
+def batch_deletes(monkeypatch, drive):
+    def fake_batch_delete(service, file_ids, batch_size=None):
+        outcomes = {}
+        for file_id in file_ids:
+            try:
+                drive.delete(fileId=file_id).execute()
+                outcomes[file_id] = None
+            except HttpError as e:
+                outcomes[file_id] = e
+        return outcomes
+    monkeypatch.setattr(drive_client, "batch_delete", fake_batch_delete)
+
+def test_dedup_links_same_content_without_uploading(tmp_path, storage, drive, cache, sent):
+    """Content already on Drive is recorded under the new name pointing at the same object"""
+    (tmp_path / "a.txt").write_bytes(b"same bytes")
+    (tmp_path / "b.txt").write_bytes(b"same bytes")
+    upload(tmp_path / "a.txt", storage, dedup=True)
+    details = upload(tmp_path / "b.txt", storage, dedup=True)
+    assert details['deduplicated']
+    assert sent == ["a.txt"]
+    linked = storage.get_file_hash("b.txt")
+    assert linked['drive_id'] == "drive-1"
+    assert linked['deduplicated_from'] == "a.txt"
+    assert linked['md5_checksum'] == hashlib.md5(b"same bytes").hexdigest()
+
+def test_deleting_a_shared_object_keeps_it_on_drive(tmp_path, storage, drive, cache, sent):
+    """Deleting one of two names leaves the Drive object for the other"""
+    (tmp_path / "a.txt").write_bytes(b"same bytes")
+    (tmp_path / "b.txt").write_bytes(b"same bytes")
+    upload(tmp_path / "a.txt", storage, dedup=True)
+    upload(tmp_path / "b.txt", storage, dedup=True)
+
+    result = uploads.delete_file("a.txt", storage)
+    assert (result['drive_deleted'], result['remaining_references']) == (False, 1)
+    assert "drive-1" in drive.objects
+
+    result = uploads.delete_file("b.txt", storage)
+    assert (result['drive_deleted'], result['remaining_references']) == (True, 0)
+    assert drive.deleted == ["drive-1"]
+    assert not storage.drive_deletion_pending("drive-1")
+
+def test_batch_delete_removes_only_unreferenced_objects(tmp_path, storage, drive, cache, sent, batch_deletes):
+    """delete_files deletes a Drive object once its last name goes"""
+    for name, content in (("a.txt", b"shared"), ("b.txt", b"shared"), ("c.txt", b"own")):
+        (tmp_path / name).write_bytes(content)
+        upload(tmp_path / name, storage, dedup=True)
+    results = {r['filename']: r for r in uploads.delete_files(["a.txt", "c.txt", "missing.txt"], storage)}
+    assert results['a.txt']['deleted'] and not results['a.txt']['drive_deleted']
+    assert results['c.txt']['drive_deleted']
+    assert results['missing.txt']['error'] == 'not found'
+    assert drive.deleted == ["drive-2"]
+
+def test_link_made_during_delete_keeps_the_object(tmp_path, storage, drive, cache, sent, monkeypatch):
+    """A dedup link recorded after the first reference count is seen by the recount"""
+    (tmp_path / "a.txt").write_bytes(b"same bytes")
+    upload(tmp_path / "a.txt", storage, dedup=True)
+    existing = storage.get_file_hash("a.txt")
+    begin = storage.begin_drive_deletions
+
+    def link_then_begin(drive_ids):
+        uploads.link_duplicate("b.txt", existing, storage)  # Races in before the object is marked
+        return begin(drive_ids)
+    monkeypatch.setattr(storage, "begin_drive_deletions", link_then_begin)
+
+    result = uploads.delete_file("a.txt", storage)
+    assert not result['drive_deleted']
+    assert "drive-1" in drive.objects
+    assert storage.get_file_hash("b.txt")['status'] == "active"
+
+def test_link_backs_out_while_the_object_is_being_deleted(tmp_path, storage, drive, cache, sent):
+    """A dedup link to an object marked for deletion is undone and the file is uploaded instead"""
+    (tmp_path / "a.txt").write_bytes(b"same bytes")
+    (tmp_path / "b.txt").write_bytes(b"same bytes")
+    upload(tmp_path / "a.txt", storage, dedup=True)
+    storage.begin_drive_deletions(["drive-1"])
+
+    details = upload(tmp_path / "b.txt", storage, dedup=True)
+    assert not details['deduplicated']
+    assert sent == ["a.txt", "b.txt"]
+    assert storage.get_file_hash("b.txt")['drive_id'] == "drive-2"
+
+K = drive_client.RESUMABLE_CHUNK_ALIGNMENT
+
+class FakeResumableUpload:
+    """Stands in for run_resumable_upload: sends chunk by chunk and can fail after `fail_after` chunks"""
+
+    def __init__(self, drive):
+        self.drive = drive
+        self.fail_after = None
+        self.calls = []
+
+    def __call__(self, service, media, file_name, resume_uri=None, resume_offset=0, on_chunk=None):
+        self.calls.append((resume_uri, resume_offset))
+        offset, sent = resume_offset, 0
+        while offset < media.size():
+            if sent == self.fail_after:
+                raise ConnectionError("connection reset")
+            offset += len(media.getbytes(offset, media.chunksize()))
+            sent += 1
+            on_chunk("https://upload.example/session", offset, 0, 0.0)
+        media.sink.close()
+        drive_id = f"resumed-{len(self.calls)}"
+        self.drive.objects[drive_id] = {'id': drive_id, 'size': str(offset), 'md5Checksum': media_md5(media)}
+        return dict(self.drive.objects[drive_id])
+
+def media_md5(media):
+    hashers = [media.sink.hash_obj] + media.sink.observers
+    return next(o for o in hashers if getattr(o, 'name', None) == 'md5').hexdigest()
+
+@pytest.fixture
+def resumable(monkeypatch, drive):
+    fake = FakeResumableUpload(drive)
+    monkeypatch.setattr(drive_client, "run_resumable_upload", fake)
+    return fake
+
+def test_large_upload_reads_the_file_once(tmp_path, storage, drive, cache, resumable, monkeypatch):
+    """Without dedup, a resumable upload is hashed while it is sent, not in a pre-pass"""
+    def no_pre_pass(*args, **kwargs):
+        raise AssertionError("file hashed before the upload")
+    monkeypatch.setattr(uploads, "cached_file_hash", no_pre_pass)
+    data = os.urandom(2 * K + 100)
+    path = tmp_path / "big.bin"
+    path.write_bytes(data)
+    details = upload(path, storage, chunk_size=K, dedup=False)
+    assert details['hash'] == hashlib.sha256(data).hexdigest()
+    assert storage.get_file_hash("big.bin")['md5_checksum'] == hashlib.md5(data).hexdigest()
+
+def test_interrupted_upload_resumes_from_the_recorded_session(tmp_path, storage, drive, cache, resumable,
+                                                              monkeypatch):
+    """The session saved before a crash is resumed at the offset Drive reports"""
+    data = os.urandom(3 * K + 100)
+    path = tmp_path / "big.bin"
+    path.write_bytes(data)
+    resumable.fail_after = 1
+    with pytest.raises(ConnectionError):
+        upload(path, storage, chunk_size=K, dedup=False)
+    session = storage.get_upload_session(str(path))
+    assert session['offset'] == K and session['size'] == len(data)
+    assert session['mtime_ns'] == os.stat(path).st_mtime_ns
+
+    queried = []
+    monkeypatch.setattr(drive_client, "query_upload_offset", lambda uri, size: queried.append(uri) or K)
+    resumable.fail_after = None
+    details = upload(path, storage, chunk_size=K, dedup=False)
+    assert queried == ["https://upload.example/session"]
+    assert resumable.calls[-1] == ("https://upload.example/session", K)
+    assert details['resumed_from'] == K
+    assert details['hash'] == hashlib.sha256(data).hexdigest()
+    assert storage.get_upload_session(str(path)) is None
+
+def test_session_of_a_modified_file_is_not_resumed(tmp_path, storage, drive, cache, resumable, monkeypatch):
+    """A file whose size or mtime changed since its session started is uploaded from the beginning"""
+    path = tmp_path / "big.bin"
+    path.write_bytes(os.urandom(2 * K + 100))
+    resumable.fail_after = 1
+    with pytest.raises(ConnectionError):
+        upload(path, storage, chunk_size=K, dedup=False)
+
+    data = os.urandom(2 * K + 100)
+    path.write_bytes(data)
+    stat_result = os.stat(path)
+    os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1_000_000_000))
+    monkeypatch.setattr(drive_client, "query_upload_offset", lambda uri, size: pytest.fail("stale session queried"))
+    resumable.fail_after = None
+    details = upload(path, storage, chunk_size=K, dedup=False)
+    assert resumable.calls[-1] == (None, 0)
+    assert details['resumed_from'] == 0
+    assert details['hash'] == hashlib.sha256(data).hexdigest()
+
+class RecordWriter:
+    """FileRecordWriter.add applied straight away (mongomock cannot run ReplaceOne in bulk_write)"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def add(self, document):
+        self.storage.collection.replace_one({"file_name": document["file_name"]}, document, upsert=True)
+
+def test_bulk_link_uploads_when_the_object_is_deleted_after_lookup(tmp_path, storage, drive, cache, sent, resumable,
+                                                                     monkeypatch):
+    """A bulk dedup hit whose Drive object is deleted before the link is written uploads the file instead"""
+    (tmp_path / "a.txt").write_bytes(b"same bytes")
+    (tmp_path / "b.txt").write_bytes(b"same bytes")
+    upload(tmp_path / "a.txt", storage, dedup=True)
+    find_by_hash = storage.find_by_hash
+
+    def find_then_delete(file_hash, algorithm):
+        existing = find_by_hash(file_hash, algorithm)
+        uploads.delete_file("a.txt", storage)  # The last other name goes before the link is recorded
+        return existing
+    monkeypatch.setattr(storage, "find_by_hash", find_then_delete)
+
+    item = (str(tmp_path / "b.txt"), "b.txt")
+    hashed = uploads._hash_local_file(item, "sha256", use_cache=False)
+    result = uploads._upload_hashed_file(item, hashed, RecordWriter(storage), TransferProgress(), storage,
+                                         uploaded=uploads._UploadedContent(storage))
+    assert drive.deleted == ["drive-1"]
+    assert not result['deduplicated']
+    record = storage.get_file_hash("b.txt")
+    assert record['drive_id'] == result['drive_id'] and record['drive_id'] in drive.objects
+    assert 'deduplicated_from' not in record
+
+def test_bulk_single_chunk_upload_skips_the_session_round_trips(tmp_path, storage, drive, resumable, monkeypatch):
+    """A file no bigger than one chunk has nothing to resume, so no session is looked up, saved or deleted"""
+    for name in ("get_upload_session", "save_upload_session", "delete_upload_session"):
+        monkeypatch.setattr(storage, name, lambda *args, _name=name, **kwargs: pytest.fail(f"{_name} called"))
+    data = os.urandom(K)
+    (tmp_path / "small.bin").write_bytes(data)
+    item = (str(tmp_path / "small.bin"), "small.bin")
+    hashed = uploads._hash_local_file(item, "sha256", use_cache=False)
+    result = uploads._upload_hashed_file(item, hashed, RecordWriter(storage), TransferProgress(), storage, chunk_size=K)
+    assert resumable.calls == [(None, 0)]
+    assert storage.get_file_hash("small.bin")['drive_id'] == result['drive_id']
+
+def test_tree_hashed_upload_of_a_file_rewritten_in_place_is_undone(tmp_path, storage, drive, resumable, monkeypatch):
+    """A same-size rewrite between tree hashing and upload deletes the Drive copy instead of recording it"""
+    path = tmp_path / "big.bin"
+    path.write_bytes(os.urandom(2 * K + 100))
+    tree_hash = uploads.parallel_tree_hash
+
+    def hash_then_rewrite(file_path, workers):
+        tree = tree_hash(file_path, workers)
+        stat_result = os.stat(path)
+        path.write_bytes(os.urandom(2 * K + 100))
+        os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 1_000_000_000))
+        return tree
+    monkeypatch.setattr(uploads, "parallel_tree_hash", hash_then_rewrite)
+
+    with pytest.raises(ValueError, match="changed"):
+        uploads._upload_tree_hashed(str(path), "big.bin", 2 * K + 100, 2, storage, chunk_size=K)
+    assert drive.deleted == ["resumed-1"]
+    assert storage.get_file_hash("big.bin") is None
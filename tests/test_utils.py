@@ -2,24 +2,26 @@
 Unit tests for utility functions
 """
 
+import hashlib
 import pytest
 import tempfile
 import os
 from pathlib import Path
+import hash_cache
+from hash_cache import HashCache
 from utils import compute_file_hash, validate_file_path, format_file_size, truncate_hash
 
-def test_compute_file_hash():
-    """Test hash computation"""
-    with tempfile.NamedTemporaryFile(delete=False) as tmp:
-        tmp.write(b"test content")
-        tmp_path = tmp.name
-    
-    try:
-        hash_result = compute_file_hash(tmp_path)
-        assert hash_result is not None
-        assert len(hash_result) == 64  # SHA-256 produces 64 character hex string
-    finally:
-        os.unlink(tmp_path)
+def test_compute_file_hash(tmp_path, monkeypatch):
+    """Test hash computation, through a hash cache kept in the test's own directory"""
+    cache = HashCache(tmp_path / "hash_cache.sqlite3")
+    monkeypatch.setattr(hash_cache, "get_cache", lambda: cache)
+    path = tmp_path / "file.txt"
+    path.write_bytes(b"test content")
+
+    hash_result = compute_file_hash(str(path))
+    assert hash_result == hashlib.sha256(b"test content").hexdigest()
+    assert len(hash_result) == 64  # SHA-256 produces 64 character hex string
+    assert cache.get(path, "sha256") == hash_result
 
 def test_validate_file_path():
     """Test file path validation"""
@@ -0,0 +1,90 @@
+"""
+Unit tests for the concurrent verification engine
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from verifier import (VerificationSummary, compare_drive_checksums, full_verify_due,
+                      plan_fast_sweep, verify_concurrently)
+
+def fake_verify(name):
+    """Pretend to verify a file; names starting with 'bad' are tampered"""
+    time.sleep(0.01)
+    if name == "boom":
+        raise RuntimeError("drive unavailable")
+    intact = not name.startswith("bad")
+    return {'filename': name, 'is_intact': intact, 'trust_score': 100 if intact else 0, 'verified': True}
+
+def test_verify_concurrently_yields_every_result():
+    """Every item produces exactly one result, errors included"""
+    names = [f"file{i}" for i in range(20)] + ["bad1", "boom"]
+    results = list(verify_concurrently(names, fake_verify, workers=4))
+
+    assert sorted(r['filename'] for r in results) == sorted(names)
+    error = next(r for r in results if r['filename'] == "boom")
+    assert error['verified'] is False
+    assert "drive unavailable" in error['error']
+
+def test_verify_concurrently_bounds_in_flight_work():
+    """A lazy item stream is consumed only a few items ahead of the workers"""
+    pulled = []
+    lock = threading.Lock()
+
+    def items():
+        for i in range(50):
+            with lock:
+                pulled.append(i)
+            yield f"file{i}"
+
+    stream = verify_concurrently(items(), fake_verify, workers=2)
+    next(stream)
+    assert len(pulled) <= 5
+    assert len(list(stream)) == 49
+
+def test_summary_percentages():
+    """Security score ignores errors unless asked to count them"""
+    summary = VerificationSummary()
+    for result in verify_concurrently(["a", "b", "bad", "boom"], fake_verify, workers=2):
+        summary.add(result)
+
+    assert (summary.verified_count, summary.tampered_count, summary.error_count) == (2, 1, 1)
+    assert round(summary.security_percentage(), 1) == 66.7
+    assert summary.to_dict(include_errors=True)['security_percentage'] == 50.0
+
+def test_batches_are_flattened_into_per_file_results():
+    """A list work item yields one result per record, and errors fan out too"""
+    def verify_batch(item):
+        if item == ["x", "y"]:
+            raise RuntimeError("batch failed")
+        return [fake_verify(name) for name in item]
+
+    results = list(verify_concurrently([["a", "bad"], ["x", "y"]], verify_batch, workers=2))
+    assert sorted(r['filename'] for r in results) == ["a", "bad", "x", "y"]
+    assert sum(1 for r in results if not r['verified']) == 2
+
+def test_plan_fast_sweep_splits_due_records():
+    """Records never fully verified are checked individually; the rest are batched"""
+    recent = datetime.now().isoformat()
+    records = [{'file_name': f"f{i}", 'last_full_verified': recent} for i in range(5)]
+    records.insert(2, {'file_name': "stale", 'last_full_verified': None})
+
+    items = list(plan_fast_sweep(records, batch_size=3))
+    assert items[0] == {'file_name': "stale", 'last_full_verified': None}
+    assert [len(item) for item in items[1:]] == [3, 2]
+    assert full_verify_due({'last_full_verified': (datetime.now() - timedelta(days=40)).isoformat()}, 30)
+
+def test_compare_drive_checksums():
+    """Drive checksums are compared against the recorded digests"""
+    record = {'hash': "aa", 'md5_checksum': "m1", 'file_size': 3}
+    assert compare_drive_checksums(record, {'sha256Checksum': "aa", 'md5Checksum': "m1", 'size': "3"}) is True
+    assert compare_drive_checksums(record, {'sha256Checksum': "bb", 'md5Checksum': "m1", 'size': "3"}) is False
+    assert compare_drive_checksums(record, {'md5Checksum': "m1", 'size': "4"}) is False
+    assert compare_drive_checksums(record, {'size': "3"}) is None
+
+def test_compare_drive_checksums_ignores_non_sha256_hash():
+    """A BLAKE2b record hash is never compared with Drive's SHA-256"""
+    record = {'hash': "aa", 'algorithm': "blake2b", 'file_size': 3}
+    assert compare_drive_checksums(record, {'sha256Checksum': "bb", 'size': "3"}) is None
+    record['sha256_checksum'] = "bb"
+    assert compare_drive_checksums(record, {'sha256Checksum': "bb", 'size': "3"}) is True
@@ -0,0 +1,58 @@
+"""
+Route tests for the web API, against an in-memory MongoDB
+"""
+
+import pytest
+
+flask = pytest.importorskip("flask")
+mongomock = pytest.importorskip("mongomock")
+
+import mongodb_storage
+import web_app
+from merkle import MerkleBuilder
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setattr(mongodb_storage, "_client", mongomock.MongoClient())
+    return mongodb_storage.MongoDBStorage()
+
+@pytest.fixture
+def client():
+    web_app.app.config['TESTING'] = True
+    return web_app.app.test_client()
+
+def store_merkle_record(storage, file_name="report.pdf"):
+    builder = MerkleBuilder(4)
+    builder.update(b"0123456789abcdef")
+    storage.collection.insert_one(mongodb_storage.file_document(
+        file_name, "ab" * 32, "drive-1", 16, merkle=builder.finish().to_document(),
+        sample_history=[{'chunks': [0]}], verify_lease={'owner': "node", 'round': "r1"}))
+
+def test_file_list_serves_records_with_merkle_leaves(storage, client):
+    """Binary Merkle leaves and internal bookkeeping are left out of the file list"""
+    store_merkle_record(storage)
+    response = client.get('/api/files')
+    assert response.status_code == 200
+    files = response.get_json()['files']
+    assert [f['file_name'] for f in files] == ["report.pdf"]
+    assert files[0]['merkle']['leaf_count'] == 4
+    assert 'leaves' not in files[0]['merkle']
+    assert 'verify_lease' not in files[0] and 'sample_history' not in files[0]
+
+def test_search_serves_records_with_merkle_leaves(storage, client):
+    """Search results are serializable too"""
+    store_merkle_record(storage)
+    response = client.get('/api/search?q=report')
+    assert response.status_code == 200
+    data = response.get_json()['data']
+    assert data['count'] == 1
+    assert 'leaves' not in data['results'][0]['merkle']
+
+@pytest.mark.parametrize("query", ["", "?max_bytes=100"])
+def test_incremental_verification_rejects_byte_budgets(client, monkeypatch, query):
+    """Incremental sweeps ignore byte budgets, so asking for both is an error instead of an unbudgeted run"""
+    monkeypatch.setattr(web_app.jobs, "submit", lambda *args: pytest.fail("job submitted"))
+    body = {'incremental': True} if query else {'incremental': True, 'bytes_per_sec': 1000}
+    response = client.post('/api/verify-all' + query, json=body)
+    assert response.status_code == 400
+    assert not response.get_json()['success']